@@ -1,7 +1,10 @@
 from .tree import BPlusTree
+from .aio import AsyncBPlusTree
 from .serializer import (
-    IntSerializer, StrSerializer, UUIDSerializer, DatetimeUTCSerializer
+    IntSerializer, StrSerializer, UUIDSerializer, DatetimeUTCSerializer,
+    OrderedIntSerializer, FloatSerializer, DatetimeMicrosSerializer
 )
+from .codec import ValueCodec, ZlibCodec, PickleCodec, StructCodec
 from .const import VERSION
 
 __version__ = VERSION
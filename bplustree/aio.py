@@ -0,0 +1,174 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import threading
+from typing import Optional, Iterable
+
+from .tree import BPlusTree
+
+
+class AsyncBPlusTree:
+    """Asyncio front-end to a BPlusTree.
+
+    Every operation that may block on disk I/O or fsync runs on a bounded
+    pool of threads, keeping the event loop responsive.
+    """
+
+    __slots__ = ['_tree', '_executor']
+
+    def __init__(self, tree: BPlusTree, max_workers: int=4):
+        self._tree = tree
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    async def close(self):
+        await self._run(self._tree.close)
+        self._executor.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def checkpoint(self):
+        await self._run(self._tree.checkpoint)
+
+    async def get(self, key, default=None) -> bytes:
+        return await self._run(self._tree.get, key, default)
+
+    async def insert(self, key, value: bytes, replace=False):
+        """Insert a value in the tree.
+
+        If the coroutine is cancelled before the insert is committed, it
+        gets rolled back.
+        """
+        await self._run_write(threading.Event(), self._tree.insert,
+                              key, value, replace)
+
+    async def batch_insert(self, iterable: Iterable):
+        """Insert many elements in the tree at once.
+
+        The iterable is consumed by a worker thread. Cancelling the
+        coroutine rolls back the whole batch.
+        """
+        cancelled = threading.Event()
+        iterator = _CancellableIterator(iterable, cancelled)
+        await self._run_write(cancelled, self._tree.batch_insert, iterator)
+
+    def items(self, slice_: Optional[slice]=None,
+              batch_size: int=256) -> 'AsyncItemsIterator':
+        """Iterate asynchronously over the items of the tree.
+
+        Items are fetched from the tree in batches of `batch_size`, each
+        batch is read by a worker thread in its own read transaction.
+        """
+        return AsyncItemsIterator(self, slice_ or slice(None), batch_size)
+
+    def __repr__(self):
+        return '<AsyncBPlusTree: {}>'.format(self._tree)
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _run_write(self, cancelled: threading.Event, func, *args):
+        future = asyncio.ensure_future(
+            self._run(self._write_in_transaction, cancelled, func, *args)
+        )
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # The worker thread cannot be interrupted, tell it to roll back
+            # the transaction and wait for it to be done before giving back
+            # control to the caller
+            cancelled.set()
+            try:
+                await future
+            except asyncio.CancelledError:
+                pass
+            raise
+
+    def _write_in_transaction(self, cancelled: threading.Event, func, *args):
+        """Run a write operation in a transaction that can be cancelled.
+
+        Runs in a worker thread. Raising within the transaction makes
+        `FileMemory` roll back the WAL.
+        """
+        with self._tree._mem.write_transaction:
+            rv = func(*args)
+            if cancelled.is_set():
+                raise asyncio.CancelledError()
+        return rv
+
+    def _read_batch(self, slice_: slice, last_key, batch_size: int) -> list:
+        """Read a batch of items located after `last_key`.
+
+        Runs in a worker thread.
+        """
+        if last_key is not None:
+            slice_ = slice(last_key, slice_.stop)
+        items = self._tree.items(slice_)
+        try:
+            batch = list(itertools.islice(items, batch_size + 1))
+        finally:
+            # Closing the generator releases the read lock in this thread
+            items.close()
+
+        if last_key is not None and batch and batch[0][0] == last_key:
+            return batch[1:]
+        return batch[:batch_size]
+
+
+class AsyncItemsIterator:
+    """Asynchronous iterator yielding (key, value) tuples in order."""
+
+    __slots__ = ['_tree', '_slice', '_batch_size', '_batch', '_last_key',
+                 '_exhausted']
+
+    def __init__(self, tree: AsyncBPlusTree, slice_: slice, batch_size: int):
+        if batch_size < 1:
+            raise ValueError('Batch size must be positive')
+        self._tree = tree
+        self._slice = slice_
+        self._batch_size = batch_size
+        self._batch = list()
+        self._last_key = None
+        self._exhausted = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> tuple:
+        if not self._batch and not self._exhausted:
+            self._batch = await self._tree._run(
+                self._tree._read_batch, self._slice, self._last_key,
+                self._batch_size
+            )
+            self._batch.reverse()
+            if len(self._batch) < self._batch_size:
+                self._exhausted = True
+
+        if not self._batch:
+            raise StopAsyncIteration
+
+        key, value = self._batch.pop()
+        self._last_key = key
+        return key, value
+
+
+class _CancellableIterator:
+    """Iterator that stops a worker thread once its task is cancelled."""
+
+    __slots__ = ['_iterator', '_cancelled']
+
+    def __init__(self, iterable: Iterable, cancelled: threading.Event):
+        self._iterator = iter(iterable)
+        self._cancelled = cancelled
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._cancelled.is_set():
+            raise asyncio.CancelledError()
+        return next(self._iterator)
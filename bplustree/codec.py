@@ -0,0 +1,91 @@
+import abc
+import pickle
+import struct
+import zlib
+
+
+class ValueCodec(metaclass=abc.ABCMeta):
+    """Conversion of the values of a tree to and from bytes.
+
+    Values are encoded before being stored and decoded when they are read,
+    the same way keys go through a Serializer.
+    """
+
+    __slots__ = []
+
+    @abc.abstractmethod
+    def encode(self, obj: object) -> bytes:
+        """Encode a value to bytes."""
+
+    @abc.abstractmethod
+    def decode(self, data: bytes) -> object:
+        """Create a value object from bytes."""
+
+    def __repr__(self):
+        return '{}()'.format(self.__class__.__name__)
+
+
+class ZlibCodec(ValueCodec):
+    """Compress bytes values with zlib.
+
+    A value that compresses below the `value_size` of the tree stays in its
+    record instead of spilling into overflow pages. Values that do not get
+    smaller are kept as is, a single byte tells whether a value is compressed.
+    """
+
+    __slots__ = ['level']
+
+    def __init__(self, level: int=zlib.Z_DEFAULT_COMPRESSION):
+        self.level = level
+
+    def encode(self, obj: bytes) -> bytes:
+        compressed = zlib.compress(obj, self.level)
+        if len(compressed) < len(obj):
+            return b'\x01' + compressed
+        return b'\x00' + obj
+
+    def decode(self, data: bytes) -> bytes:
+        if data[0:1] == b'\x01':
+            return zlib.decompress(data[1:])
+        return bytes(data[1:])
+
+
+class PickleCodec(ValueCodec):
+    """Store any picklable object as value.
+
+    Unpickling can run arbitrary code, never decode untrusted trees.
+    """
+
+    __slots__ = ['protocol']
+
+    def __init__(self, protocol: int=pickle.DEFAULT_PROTOCOL):
+        self.protocol = protocol
+
+    def encode(self, obj: object) -> bytes:
+        return pickle.dumps(obj, protocol=self.protocol)
+
+    def decode(self, data: bytes) -> object:
+        return pickle.loads(data)
+
+
+class StructCodec(ValueCodec):
+    """Store tuples of numbers packed with a struct format.
+
+    Values are tuples with one item per field of the format, like the ones
+    returned by `struct.unpack`.
+    """
+
+    __slots__ = ['format', '_struct']
+
+    def __init__(self, format_: str):
+        self.format = format_
+        self._struct = struct.Struct(format_)
+
+    def encode(self, obj: tuple) -> bytes:
+        return self._struct.pack(*obj)
+
+    def decode(self, data: bytes) -> tuple:
+        return self._struct.unpack(data)
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self.format)
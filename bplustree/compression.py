@@ -0,0 +1,80 @@
+import lzma
+from typing import Optional, Union
+import zlib
+
+from .const import ENDIAN, NODE_TYPE_BYTES, USED_PAGE_LENGTH_BYTES
+
+# Type of a page holding the compressed data of a Node, no Node has this type
+COMPRESSED_PAGE_TYPE = 255
+
+# Header of a compressed page: its type and the length of the compressed data
+COMPRESSED_PAGE_HEADER_BYTES = NODE_TYPE_BYTES + USED_PAGE_LENGTH_BYTES
+
+# Compression algorithms available from the standard library with the
+# integer identifying them in the metadata of a tree
+COMPRESSIONS = {
+    'zlib': (1, zlib.compress, zlib.decompress),
+    'lzma': (2, lzma.compress, lzma.decompress),
+}
+
+
+def check_compression(compression: Optional[str]):
+    if compression is not None and compression not in COMPRESSIONS:
+        raise ValueError('Unknown compression {}, available ones are {}'
+                         .format(compression, ', '.join(sorted(COMPRESSIONS))))
+
+
+def compression_to_int(compression: Optional[str]) -> int:
+    if compression is None:
+        return 0
+    return COMPRESSIONS[compression][0]
+
+
+def int_to_compression(compression_int: int) -> Optional[str]:
+    if compression_int == 0:
+        return None
+    for compression, (identifier, _, _) in COMPRESSIONS.items():
+        if identifier == compression_int:
+            return compression
+    raise ValueError('Unknown compression {}'.format(compression_int))
+
+
+def compress_page(compression: Optional[str],
+                  data: Union[bytes, bytearray]) -> Union[bytes, bytearray]:
+    """Compress the data of a page.
+
+    Data that does not get smaller once compressed is kept as is.
+    """
+    if compression is None:
+        return data
+
+    compressed = COMPRESSIONS[compression][1](bytes(data))
+    if COMPRESSED_PAGE_HEADER_BYTES + len(compressed) >= len(data):
+        return data
+
+    return (
+        COMPRESSED_PAGE_TYPE.to_bytes(NODE_TYPE_BYTES, ENDIAN) +
+        len(compressed).to_bytes(USED_PAGE_LENGTH_BYTES, ENDIAN) +
+        compressed
+    )
+
+
+def decompress_page(compression: Optional[str], data: bytes) -> bytes:
+    """Decompress the data of a page compressed by `compress_page`.
+
+    The data may be followed by garbage up to the end of the page.
+    """
+    if compression is None:
+        return data
+
+    page_type = int.from_bytes(data[0:NODE_TYPE_BYTES], ENDIAN)
+    if page_type != COMPRESSED_PAGE_TYPE:
+        return data
+
+    length = int.from_bytes(
+        data[NODE_TYPE_BYTES:COMPRESSED_PAGE_HEADER_BYTES], ENDIAN
+    )
+    end_compressed = COMPRESSED_PAGE_HEADER_BYTES + length
+    return COMPRESSIONS[compression][2](
+        data[COMPRESSED_PAGE_HEADER_BYTES:end_compressed]
+    )
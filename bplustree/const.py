@@ -1,36 +1,70 @@
 from collections import namedtuple
 
-VERSION = '0.0.4.dev1'
+VERSION = '0.0.5.dev1'
 
 # Endianess for storing numbers
 ENDIAN = 'little'
 
-# Bytes used for storing references to pages
+# Default bytes used for storing references to pages
 # Can address 16 TB of memory with 4 KB pages
 PAGE_REFERENCE_BYTES = 4
 
+# Widths of page references a tree can be created with
+PAGE_REFERENCE_WIDTHS = (4, 6, 8)
+
+# Bytes of raw pages kept in memory when reading with direct I/O
+DEFAULT_BUFFER_POOL_SIZE = 64 * 1024 * 1024
+
+# Maximum number of contiguous pages read at once when warming up the cache
+WARM_UP_READ_PAGES = 256
+
+# Maximum number of passes copying the records changed during a vacuum while
+# the tree keeps serving writers, before the last one that blocks them
+VACUUM_CATCH_UP_PASSES = 3
+
 # Bytes used for storing the type of the node in page header
 NODE_TYPE_BYTES = 1
 
 # Bytes used for storing the length of the page payload in page header
 USED_PAGE_LENGTH_BYTES = 3
 
+# Bytes used for storing the number of entries in a page and the offset of
+# each entry in the slot directory. Can address any byte of a page.
+SLOT_BYTES = 3
+
 # Bytes used for storing the length of the key or value payload in record
 # header. Limits the maximum length of a key or value to 64 KB.
 USED_KEY_LENGTH_BYTES = 2
 USED_VALUE_LENGTH_BYTES = 2
 
+# Bytes used for storing the length of a value stored in an extent of
+# contiguous pages
+EXTENT_LENGTH_BYTES = 8
+
+# Bytes of the SHA-256 digest identifying a value shared by many records
+DIGEST_BYTES = 32
+
 # Max 256 types of frames
 FRAME_TYPE_BYTES = 1
 
 # Bytes used for storing general purpose integers like file metadata
 OTHERS_BYTES = 4
 
+# Bytes starting the metadata page of every file, followed by the version of
+# the format of the file. Files with another version cannot be read.
+FILE_MAGIC = b'bplustree'
+FORMAT_VERSION = 1
+
 
 TreeConf = namedtuple('TreeConf', [
     'page_size',   # Size of a page within the tree in bytes
-    'order',       # Branching factor of the tree
+    'order',       # Maximum branching factor of the tree or None
     'key_size',    # Maximum size of a key in bytes
     'value_size',  # Maximum size of a value in bytes
     'serializer',  # Instance of a Serializer
+    'compression',  # Name of the algorithm compressing pages or None
+    'page_reference_bytes',  # Bytes used for storing references to pages
 ])
+# Unless asked otherwise, trees do not compress their pages and reference
+# them with 4 bytes
+TreeConf.__new__.__defaults__ = (None, PAGE_REFERENCE_BYTES)
@@ -1,17 +1,36 @@
+import abc
+import bisect
+from collections import OrderedDict
 import enum
 import io
+import itertools
 from logging import getLogger
+import math
+import mmap
+from operator import methodcaller
 import os
 import platform
-from typing import Union, Tuple, Optional
+import threading
+from typing import Union, Tuple, Optional, Iterable, Iterator, Callable
 
 import cachetools
 import rwlock
 
-from .node import Node, FreelistNode
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .compression import (compress_page, decompress_page,
+                          compression_to_int, int_to_compression)
+from .node import (Node, FreelistNode, DedupNode, ReferenceNode,
+                   LonelyRootNode, NodePage)
 from .const import (
-    ENDIAN, PAGE_REFERENCE_BYTES, OTHERS_BYTES, TreeConf, FRAME_TYPE_BYTES
+    ENDIAN, PAGE_REFERENCE_BYTES, OTHERS_BYTES, TreeConf, FRAME_TYPE_BYTES,
+    USED_PAGE_LENGTH_BYTES, EXTENT_LENGTH_BYTES, WARM_UP_READ_PAGES,
+    FILE_MAGIC, FORMAT_VERSION
 )
+from .utils import iter_slice, contiguous_runs
 
 logger = getLogger(__name__)
 
@@ -20,6 +39,36 @@ class ReachedEndOfFile(Exception):
     """Read a file until its end."""
 
 
+class MetadataNotSet(ValueError):
+    """The metadata of a tree was never written."""
+
+
+# The magic, the version of the format and the width of page references
+FILE_HEADER_LENGTH = len(FILE_MAGIC) + 2 * OTHERS_BYTES
+
+
+def read_file_header(data: bytes) -> int:
+    """Return the width of page references recorded in a file header.
+
+    Raise ValueError if the file was not written by a supported version.
+    """
+    if not any(data):
+        # The page got preallocated but the metadata was never written
+        raise MetadataNotSet('Metadata not set yet')
+    end_magic = len(FILE_MAGIC)
+    if bytes(data[0:end_magic]) != FILE_MAGIC:
+        raise ValueError('Not a bplustree file or written by a version of '
+                         'bplustree with an incompatible format')
+    end_version = end_magic + OTHERS_BYTES
+    version = int.from_bytes(data[end_magic:end_version], ENDIAN)
+    if version != FORMAT_VERSION:
+        raise ValueError('Unsupported format version {}, expected {}'
+                         .format(version, FORMAT_VERSION))
+    return int.from_bytes(
+        data[end_version:end_version + OTHERS_BYTES], ENDIAN
+    )
+
+
 def open_file_in_dir(path: str) -> Tuple[io.FileIO, Optional[int]]:
     """Open a file and its directory.
 
@@ -49,6 +98,25 @@ def open_file_in_dir(path: str) -> Tuple[io.FileIO, Optional[int]]:
     return file_fd, dir_fd
 
 
+def lock_file(file_fd: io.FileIO, shared: bool=False):
+    """Take an advisory lock on a file for the lifetime of its descriptor.
+
+    An exclusive lock is held by a single descriptor, a shared lock can be
+    held by many. The lock is released when the file is closed.
+
+    On Windows, files are not locked.
+    """
+    if fcntl is None:
+        return
+
+    operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    try:
+        fcntl.flock(file_fd.fileno(), operation | fcntl.LOCK_NB)
+    except BlockingIOError:
+        raise ValueError('File {} is already in use by another instance'
+                         .format(file_fd.name))
+
+
 def write_to_file(file_fd: io.FileIO, dir_fileno: Optional[int],
                   data: bytes, fsync: bool=True):
     length_to_write = len(data)
@@ -66,12 +134,16 @@ def fsync_file_and_dir(file_fileno: int, dir_fileno: Optional[int]):
 
 
 def read_from_file(file_fd: io.FileIO, start: int, stop: int) -> bytes:
+    """Read data between two offsets of a file.
+
+    Reads are positional and do not depend on the offset of the file
+    descriptor, so many threads can read from the same file at once.
+    """
     length = stop - start
     assert length >= 0
-    file_fd.seek(start)
     data = bytes()
-    while file_fd.tell() < stop:
-        read_data = file_fd.read(stop - file_fd.tell())
+    while len(data) < length:
+        read_data = _pread(file_fd, length - len(data), start + len(data))
         if read_data == b'':
             raise ReachedEndOfFile('Read until the end of file')
         data += read_data
@@ -79,81 +151,505 @@ def read_from_file(file_fd: io.FileIO, start: int, stop: int) -> bytes:
     return data
 
 
+def read_from_file_direct(fileno: int, buffer: memoryview, offset: int):
+    """Fill an aligned buffer with data read from a file opened in O_DIRECT.
+
+    The offset and the length of the buffer must be multiples of the block
+    size of the file system.
+    """
+    if os.preadv(fileno, [buffer], offset) < len(buffer):
+        raise ReachedEndOfFile('Read until the end of file')
+
+
+if hasattr(os, 'pread'):
+    def _pread(file_fd: io.FileIO, length: int, offset: int) -> bytes:
+        return os.pread(file_fd.fileno(), length, offset)
+else:
+    _seek_lock = threading.Lock()
+
+    def _pread(file_fd: io.FileIO, length: int, offset: int) -> bytes:
+        # Windows has no pread, the seek and the read must not be
+        # interleaved with the ones of another thread
+        with _seek_lock:
+            file_fd.seek(offset)
+            return file_fd.read(length)
+
+
 class FakeCache:
     """A cache that doesn't cache anything.
 
     Because cachetools does not work with maxsize=0.
     """
 
+    currsize = 0
+
     def get(self, k):
         pass
 
     def __setitem__(self, key, value):
         pass
 
+    def pop(self, key, default=None):
+        return default
+
+    def popitem(self):
+        raise KeyError('Cache is empty')
+
     def clear(self):
         pass
 
+    def __iter__(self):
+        return iter(())
 
-class FileMemory:
 
-    __slots__ = ['_filename', '_tree_conf', '_lock', '_cache', '_fd',
-                 '_dir_fd', '_wal', 'last_page', '_freelist_start_page',
-                 '_root_node_page']
+class TwoQueueCache:
+    """A cache resisting scans, following the 2Q algorithm.
 
-    def __init__(self, filename: str, tree_conf: TreeConf,
-                 cache_size: int=512):
-        self._filename = filename
-        self._tree_conf = tree_conf
-        self._lock = rwlock.RWLock()
+    Keys enter a FIFO queue holding a quarter of the cache. Only keys
+    inserted again after being evicted from it, while they are still
+    remembered by a ghost queue of keys, make it to the main LRU queue. A
+    scan reading many keys once therefore only flushes the FIFO queue and
+    leaves the hot keys alone.
+
+    Like the caches of cachetools, the size of values is given by
+    `getsizeof`, by default each value counts as one.
+    """
+
+    __slots__ = ['maxsize', 'currsize', '_getsizeof', '_in_maxsize',
+                 '_in_currsize', '_main', '_in', '_out', '_sizes']
+
+    def __init__(self, maxsize: int, getsizeof: Optional[Callable]=None):
+        self.maxsize = maxsize
+        self.currsize = 0
+        self._getsizeof = getsizeof
+        self._in_maxsize = max(maxsize // 4, 1)
+        self._in_currsize = 0
+        self._main = OrderedDict()
+        self._in = OrderedDict()
+        self._out = OrderedDict()
+        self._sizes = dict()
+
+    def get(self, key, default=None):
+        if key in self._main:
+            self._main.move_to_end(key)
+            return self._main[key]
+        return self._in.get(key, default)
 
-        if cache_size == 0:
-            self._cache = FakeCache()
+    def __setitem__(self, key, value):
+        size = 1 if self._getsizeof is None else self._getsizeof(value)
+        if size > self.maxsize:
+            raise ValueError('value too large')
+
+        if key in self._main:
+            queue = self._main
+        elif key in self._out:
+            # Seen recently enough to be worth keeping
+            queue = self._main
+        else:
+            queue = self._in
+        self.pop(key)
+
+        while self._sizes and self.currsize + size > self.maxsize:
+            self.popitem()
+        queue[key] = value
+        self._sizes[key] = size
+        self.currsize += size
+        if queue is self._in:
+            self._in_currsize += size
+
+    def pop(self, key, default=None):
+        self._out.pop(key, None)
+        if key in self._main:
+            value = self._main.pop(key)
+        elif key in self._in:
+            value = self._in.pop(key)
+            self._in_currsize -= self._sizes[key]
+        else:
+            return default
+        self.currsize -= self._sizes.pop(key)
+        return value
+
+    def popitem(self) -> tuple:
+        """Evict the key the policy wants to get rid of first."""
+        if self._in and (self._in_currsize > self._in_maxsize or
+                         not self._main):
+            key = next(iter(self._in))
+            value = self.pop(key)
+            self._out[key] = None
+            # Remember about as many keys as the cache holds
+            while len(self._out) > max(len(self._sizes), 1):
+                self._out.popitem(last=False)
+        elif self._main:
+            key = next(iter(self._main))
+            value = self.pop(key)
         else:
-            self._cache = cachetools.LRUCache(maxsize=cache_size)
+            raise KeyError('Cache is empty')
+        return key, value
 
-        self._fd, self._dir_fd = open_file_in_dir(filename)
+    def clear(self):
+        self._main.clear()
+        self._in.clear()
+        self._out.clear()
+        self._sizes.clear()
+        self.currsize = 0
+        self._in_currsize = 0
 
-        self._wal = WAL(filename, tree_conf.page_size)
-        if self._wal.needs_recovery:
-            self.perform_checkpoint(reopen_wal=True)
+    def __contains__(self, key) -> bool:
+        return key in self._sizes
 
-        # Get the next available page
-        self._fd.seek(0, io.SEEK_END)
-        last_byte = self._fd.tell()
-        self.last_page = int(last_byte / self._tree_conf.page_size)
-        self._freelist_start_page = 0
+    def __iter__(self):
+        return itertools.chain(self._main, self._in)
+
+    def __len__(self):
+        return len(self._sizes)
+
+
+def create_cache(policy: Union[str, Callable], maxsize: int,
+                 getsizeof: Optional[Callable]=None):
+    """Create a cache of size `maxsize` evicting values following a policy.
+
+    The policy is either 'lru', '2q' or a callable taking the maximum size
+    and returning a mapping, like the caches of cachetools. The size of
+    values is given by `getsizeof`, by default each value counts as one.
+    """
+    if maxsize == 0:
+        return FakeCache()
+    if policy == 'lru':
+        policy = cachetools.LRUCache
+    elif policy == '2q':
+        policy = TwoQueueCache
+    elif not callable(policy):
+        raise ValueError('Unknown cache policy {}'.format(policy))
+
+    if getsizeof is None:
+        return policy(maxsize)
+    return policy(maxsize, getsizeof=getsizeof)
+
+
+class NodeCache:
+    """Cache of the nodes of a tree, in front of a cache policy.
+
+    The root and the internal nodes can be pinned: they are kept apart and
+    never evicted, so lookups stay fast whatever gets scanned. Freelist and
+    dedup nodes are only read to load their in-memory index, they bypass the
+    cache.
+
+    The cache can be shrunk below the size it was created with, for
+    instance to give memory back when the system runs low.
+
+    Pages that were only searched are cached as a `NodePage` until their
+    node is needed.
+    """
+
+    __slots__ = ['_cache', '_pinned', '_pin_internal_nodes', 'limit']
+
+    def __init__(self, cache, pin_internal_nodes: bool=False):
+        self._cache = cache
+        self._pinned = dict()
+        self._pin_internal_nodes = pin_internal_nodes
+        self.limit = None
+
+    def get(self, page: int) -> Union[Node, NodePage, None]:
+        node = self._pinned.get(page)
+        if node is None:
+            node = self._cache.get(page)
+        return node
 
-        # Todo: Remove this, it should only be in Tree
+    def __setitem__(self, page: int, node: Union[Node, NodePage]):
+        if self._pin_internal_nodes and (
+                isinstance(node, (ReferenceNode, LonelyRootNode)) or
+                isinstance(node, NodePage) and not node.is_leaf):
+            self._pinned[page] = node
+            self._cache.pop(page, None)
+            return
+
+        # The page may have held a node of another type before
+        self._pinned.pop(page, None)
+        if isinstance(node, (FreelistNode, DedupNode)):
+            self._cache.pop(page, None)
+            return
+
+        try:
+            self._cache[page] = node
+        except ValueError:
+            # The node alone is bigger than the cache
+            self._cache.pop(page, None)
+        self._evict_over_limit()
+
+    def resize(self, limit: Optional[int]):
+        """Evict nodes until the cache fits in `limit` and keep it there.
+
+        The limit is in the unit of the cache, nodes or bytes. None gives the
+        cache its original size back.
+        """
+        self.limit = limit
+        self._evict_over_limit()
+
+    @property
+    def currsize(self) -> int:
+        return self._cache.currsize
+
+    def pages(self) -> list:
+        """Pages of the nodes in the cache, pinned ones included."""
+        return list(self._pinned) + list(self._cache)
+
+    def clear(self):
+        self._pinned.clear()
+        self._cache.clear()
+
+    def _evict_over_limit(self):
+        if self.limit is None:
+            return
+        while self._cache.currsize > self.limit:
+            self._cache.popitem()
+
+
+class Memory(metaclass=abc.ABCMeta):
+    """Storage of the pages of a tree.
+
+    Implementations only provide the raw access to pages and the way
+    transactions are made durable. Caching, locking, allocation of pages and
+    metadata are common to all of them.
+    """
+
+    __slots__ = ['_tree_conf', '_lock', '_cache', '_cache_lock',
+                 '_write_depth', '_snapshot', 'readonly', 'last_page',
+                 '_freelist_start_page', '_root_node_page',
+                 '_dedup_start_page', '_shared_extents', '_shared_digests',
+                 '_dedup_pages_with_room', '_free_extents', '_free_pages',
+                 '_freelist_last_page', 'generation']
+
+    def __init__(self, tree_conf: TreeConf, cache_size: int=512,
+                 readonly: bool=False,
+                 cache_policy: Union[str, Callable]='lru',
+                 pin_internal_nodes: bool=False,
+                 cache_bytes: Optional[int]=None):
+        self._tree_conf = tree_conf
+        self.readonly = readonly
+        self._lock = rwlock.RWLock()
+        self._write_depth = 0
+        self._snapshot = None
+        # Number of write transactions that committed pages, lets long
+        # running readers find out whether the tree changed
+        self.generation = 0
+
+        if cache_bytes is None:
+            cache = create_cache(cache_policy, cache_size)
+        else:
+            # Bounded by the memory used by nodes rather than their number
+            cache = create_cache(cache_policy, cache_bytes,
+                                 getsizeof=methodcaller('footprint'))
+        self._cache = NodeCache(cache, pin_internal_nodes)
+        # Readers share the cache, every access to it reorders the LRU
+        self._cache_lock = threading.Lock()
+
+        self.last_page = 0
+        self._freelist_start_page = 0
         self._root_node_page = 0
 
+        # Map of the free extents of the freelist, loaded on first use
+        self._free_extents = None
+        self._free_pages = None
+        self._freelist_last_page = None
+
+        # Index of the extents shared by records, loaded on first use
+        self._dedup_start_page = 0
+        self._shared_extents = None
+        self._shared_digests = None
+        self._dedup_pages_with_room = None
+
+    @abc.abstractmethod
+    def _read_page(self, page: int) -> bytes:
+        """Read the data of a page, committed or not.
+
+        Raise ReachedEndOfFile if the page was never written.
+        """
+
+    @abc.abstractmethod
+    def _read_pages(self, page: int, num_pages: int) -> bytes:
+        """Read the data of contiguous pages, committed or not.
+
+        Each page takes `page_size` bytes of the data, even when it is
+        compressed.
+        """
+
+    def _join_pages(self, pages: Iterable[int]) -> bytes:
+        """Read pages one at a time, padding compressed ones to a page."""
+        page_size = self._tree_conf.page_size
+        return b''.join(bytes(self._read_page(page)).ljust(page_size, b'\0')
+                        for page in pages)
+
+    @abc.abstractmethod
+    def _write_page(self, page: int, data: Union[bytes, bytearray]):
+        """Write the data of a page within the current transaction.
+
+        When the tree compresses its pages the data may be shorter than a
+        page.
+        """
+
+    @abc.abstractmethod
+    def _write_metadata_page(self, data: Union[bytes, bytearray]):
+        """Write the metadata page outside of any transaction."""
+
+    @abc.abstractmethod
+    def _commit(self) -> bool:
+        """Make the pages written in the current transaction durable.
+
+        Return whether there were any.
+        """
+
+    @abc.abstractmethod
+    def _rollback(self):
+        """Discard the pages written in the current transaction."""
+
+    @abc.abstractmethod
+    def perform_checkpoint(self, reopen_wal=False):
+        """Merge committed pages into the main storage."""
+
+    @abc.abstractmethod
+    def close(self):
+        """Checkpoint and release the resources held by the storage."""
+
+    def advise(self, page: int, num_pages: int):
+        """Hint that contiguous pages are about to be read.
+
+        By default storages ignore the hint.
+        """
+
+    @abc.abstractmethod
+    def replace_storage(self, other: 'Memory'):
+        """Replace all pages by the ones of another storage.
+
+        The other storage is closed. Must be called while holding the
+        exclusive lock, outside of any transaction.
+        """
+
+    def resize_cache(self, limit: Optional[int]):
+        """Shrink the node cache below the size it was created with.
+
+        See `NodeCache.resize`.
+        """
+        with self._cache_lock:
+            self._cache.resize(limit)
+
+    def _reload(self):
+        """Forget about everything known from pages that got replaced."""
+        with self._cache_lock:
+            self._cache.clear()
+        self._free_extents = None
+        self._shared_extents = None
+        self.get_metadata()
+        self.generation += 1
+
+    @property
+    def root_node_page(self) -> int:
+        return self._root_node_page
+
     def get_node(self, page: int):
         """Get a node from storage.
 
-        The cache is not there to prevent hitting the disk, the OS is already
-        very good at it. It is there to avoid paying the price of deserializing
-        the data to create the Node object and its entry. This is a very
-        expensive operation in Python.
+        The cache is not there to prevent hitting the disk, the OS, or the
+        buffer pool with direct I/O, is already very good at it. It is there
+        to avoid paying the price of deserializing the data to create the
+        Node object and its entry. This is a very expensive operation in
+        Python.
 
         Since we have at most a single writer we can write to cache on
         `set_node` if we invalidate the cache when a transaction is rolled
         back.
+
+        Many readers can call this method concurrently: the disk is read
+        without holding any lock, only the accesses to the cache are
+        serialized.
+        """
+        with self._cache_lock:
+            node = self._cache.get(page)
+        if isinstance(node, NodePage):
+            # Only searched so far
+            node = node.to_node()
+        elif node is not None:
+            return node
+        else:
+            data = decompress_page(self._tree_conf.compression,
+                                   self._read_page(page))
+            node = Node.from_page_data(self._tree_conf, data=data, page=page)
+        with self._cache_lock:
+            self._cache[node.page] = node
+        return node
+
+    def get_node_or_page(self, page: int) -> Union[Node, NodePage]:
+        """Get a node from the cache, or a view on its page.
+
+        Pages missing from the cache are not loaded as nodes but cached as
+        a `NodePage`, enough for point lookups. `get_node` turns them into
+        nodes when they are needed as a whole.
         """
-        node = self._cache.get(page)
+        with self._cache_lock:
+            node = self._cache.get(page)
         if node is not None:
             return node
 
-        data = self._wal.get_page(page)
-        if not data:
-            data = self._read_page(page)
+        data = decompress_page(self._tree_conf.compression,
+                               self._read_page(page))
+        node_page = NodePage(self._tree_conf, data, page)
+        with self._cache_lock:
+            self._cache[page] = node_page
+        return node_page
 
-        node = Node.from_page_data(self._tree_conf, data=data, page=page)
-        self._cache[node.page] = node
-        return node
+    def load_nodes(self, pages: Iterable[int]) -> list:
+        """Read many nodes into the cache.
+
+        Pages are read in ascending order, runs of contiguous pages with a
+        single read. Pages already in the cache are not read again.
+        """
+        pages = set(pages)
+        with self._cache_lock:
+            cached = [self._cache.get(page) for page in pages]
+        # Pages that were only searched are loaded again as nodes
+        nodes = [node for node in cached if isinstance(node, Node)]
+        pages = sorted(pages - {node.page for node in nodes})
+
+        page_size = self._tree_conf.page_size
+        for run in contiguous_runs(pages, WARM_UP_READ_PAGES):
+            data = self._read_pages(run[0], len(run))
+            for i, page in enumerate(run):
+                page_data = decompress_page(
+                    self._tree_conf.compression,
+                    data[i*page_size:(i+1)*page_size]
+                )
+                node = Node.from_page_data(self._tree_conf, data=page_data,
+                                           page=page)
+                with self._cache_lock:
+                    self._cache[page] = node
+                nodes.append(node)
+        return nodes
+
+    def warm_cache(self, pages: Iterable[int]=()):
+        """Fill the cache with some pages and all the internal nodes.
+
+        The internal nodes are read level by level, down to the parents of
+        the leaves, after the pages so that they are the most recently used.
+        """
+        with self.read_transaction:
+            self.load_nodes(pages)
+            level = self.load_nodes([self._root_node_page])
+            while True:
+                children = list()
+                for node in level:
+                    if isinstance(node, ReferenceNode):
+                        children.extend(node.child_pages)
+                if not children:
+                    return
+                if not isinstance(self.get_node(children[0]), ReferenceNode):
+                    # Children are leaves
+                    return
+                level = self.load_nodes(children)
 
     def set_node(self, node: Node):
-        self._wal.set_page(node.page, node.dump())
-        self._cache[node.page] = node
+        data = compress_page(self._tree_conf.compression, node.dump())
+        self._write_page(node.page, data)
+        with self._cache_lock:
+            self._cache[node.page] = node
 
     def del_node(self, node: Node):
         self._insert_in_freelist(node.page)
@@ -161,6 +657,202 @@ class FileMemory:
     def del_page(self, page: int):
         self._insert_in_freelist(page)
 
+    def write_extent(self, data: bytes) -> int:
+        """Store data in newly allocated contiguous pages.
+
+        The first page starts with the length of the data. Return the first
+        page of the extent.
+        """
+        page_size = self._tree_conf.page_size
+        num_pages = math.ceil((EXTENT_LENGTH_BYTES + len(data)) / page_size)
+        first_page = self.next_available_extent(num_pages)
+
+        data = memoryview(data)
+        header = len(data).to_bytes(EXTENT_LENGTH_BYTES, ENDIAN)
+        first_page_length = page_size - EXTENT_LENGTH_BYTES
+        self._write_page(first_page, header + data[:first_page_length])
+        iterator = iter_slice(data[first_page_length:], page_size)
+        for page, (page_data, _) in enumerate(iterator, start=first_page + 1):
+            self._write_page(page, page_data)
+
+        return first_page
+
+    def write_extent_stream(self, chunks: Iterable[bytes],
+                            length: Optional[int]=None) -> int:
+        """Store data coming in chunks in newly allocated contiguous pages.
+
+        At most a couple of pages of data are kept in memory at a time. When
+        the length of the data is not known upfront, pages are appended to
+        the storage as data comes and the length is written last. Return the
+        first page of the extent.
+        """
+        page_size = self._tree_conf.page_size
+        if length is None:
+            # Nothing else gets allocated while the data is being written
+            first_page = self.last_page + 1
+        else:
+            num_pages = math.ceil((EXTENT_LENGTH_BYTES + length) / page_size)
+            first_page = self.next_available_extent(num_pages)
+
+        # The first page is written last, once the length is known
+        first_page_data = None
+        pending = bytearray(EXTENT_LENGTH_BYTES)
+        page = first_page
+        written_length = 0
+        for chunk in chunks:
+            written_length += len(chunk)
+            if length is not None and written_length > length:
+                raise ValueError('Data is longer than {} bytes'.format(length))
+
+            pending.extend(chunk)
+            while len(pending) >= page_size:
+                if page == first_page:
+                    first_page_data = pending[0:page_size]
+                else:
+                    self._write_page(page, bytes(pending[0:page_size]))
+                del pending[0:page_size]
+                page += 1
+
+        if length is not None and written_length != length:
+            raise ValueError('Data is shorter than {} bytes'.format(length))
+
+        if page == first_page:
+            first_page_data = pending
+            page += 1
+        elif pending:
+            self._write_page(page, bytes(pending))
+            page += 1
+
+        first_page_data[0:EXTENT_LENGTH_BYTES] = written_length.to_bytes(
+            EXTENT_LENGTH_BYTES, ENDIAN
+        )
+        self._write_page(first_page, bytes(first_page_data))
+        if length is None:
+            self.last_page = page - 1
+        return first_page
+
+    def read_extent(self, page: int) -> bytes:
+        """Read the data stored in contiguous pages.
+
+        The first page is read to know the length of the data, all the
+        other pages are read at once.
+        """
+        page_size = self._tree_conf.page_size
+        first_page_data = self._read_page(page)
+        length = int.from_bytes(first_page_data[0:EXTENT_LENGTH_BYTES],
+                                ENDIAN)
+        stop = EXTENT_LENGTH_BYTES + length
+        if stop <= page_size:
+            return first_page_data[EXTENT_LENGTH_BYTES:stop]
+
+        num_pages = math.ceil(stop / page_size)
+        other_pages_data = self._read_pages(page + 1, num_pages - 1)
+        # Join views to copy the data only once
+        return b''.join((
+            memoryview(first_page_data)[EXTENT_LENGTH_BYTES:],
+            memoryview(other_pages_data)[0:stop - page_size]
+        ))
+
+    def open_extent(self, page: int) -> 'ExtentReader':
+        """Open the data stored in contiguous pages as a binary stream."""
+        return ExtentReader(self, page)
+
+    def del_extent(self, page: int):
+        """Deallocate all the pages of an extent as a unit."""
+        first_page_data = self._read_page(page)
+        length = int.from_bytes(first_page_data[0:EXTENT_LENGTH_BYTES],
+                                ENDIAN)
+        num_pages = math.ceil(
+            (EXTENT_LENGTH_BYTES + length) / self._tree_conf.page_size
+        )
+        self._insert_in_freelist(page, num_pages)
+
+    def share_extent(self, digest: bytes) -> Optional[int]:
+        """Add a reference to the shared extent holding a value.
+
+        Return the first page of the extent or None if no shared extent
+        holds a value with this digest.
+        """
+        self._load_shared_extents()
+        index_page = self._shared_extents.get(digest)
+        if index_page is None:
+            return None
+
+        node = self.get_node(index_page)
+        page, references = node.extents[digest]
+        node.extents[digest] = (page, references + 1)
+        self.set_node(node)
+        return page
+
+    def add_shared_extent(self, digest: bytes, page: int):
+        """Make an extent shareable, it starts with a single reference."""
+        self._load_shared_extents()
+        if self._dedup_pages_with_room:
+            node = self.get_node(min(self._dedup_pages_with_room))
+        else:
+            # Index pages are chained from the metadata, new ones go first
+            node = DedupNode(self._tree_conf, page=self.next_available_page,
+                             next_page=self._dedup_start_page or None)
+            self._dedup_start_page = node.page
+            self.set_metadata(None, None)
+
+        node.extents[digest] = (page, 1)
+        self.set_node(node)
+        self._shared_extents[digest] = node.page
+        self._shared_digests[page] = digest
+        if node.is_full:
+            self._dedup_pages_with_room.discard(node.page)
+        else:
+            self._dedup_pages_with_room.add(node.page)
+
+    def release_extent(self, page: int) -> bool:
+        """Remove a reference to an extent.
+
+        Return whether the extent is not referenced anymore and can be
+        deleted. Extents that are not shared have a single reference.
+        """
+        self._load_shared_extents()
+        digest = self._shared_digests.get(page)
+        if digest is None:
+            return True
+
+        node = self.get_node(self._shared_extents[digest])
+        _, references = node.extents[digest]
+        if references > 1:
+            node.extents[digest] = (page, references - 1)
+            self.set_node(node)
+            return False
+
+        # Emptied index pages stay in the chain to be filled again
+        del node.extents[digest]
+        self.set_node(node)
+        del self._shared_extents[digest]
+        del self._shared_digests[page]
+        self._dedup_pages_with_room.add(node.page)
+        return True
+
+    def _load_shared_extents(self):
+        """Load in memory the index of shared extents if not done yet."""
+        if self._shared_extents is not None:
+            return
+
+        shared_extents = dict()
+        shared_digests = dict()
+        pages_with_room = set()
+        page = self._dedup_start_page or None
+        while page is not None:
+            node = self.get_node(page)
+            for digest, (extent_page, _) in node.extents.items():
+                shared_extents[digest] = page
+                shared_digests[extent_page] = digest
+            if not node.is_full:
+                pages_with_room.add(page)
+            page = node.next_page
+
+        self._shared_digests = shared_digests
+        self._dedup_pages_with_room = pages_with_room
+        self._shared_extents = shared_extents
+
     @property
     def read_transaction(self):
 
@@ -176,89 +868,249 @@ class FileMemory:
 
     @property
     def write_transaction(self):
+        """Context manager for modifying the storage.
+
+        Write transactions can be nested, the changes are only committed
+        when the outermost transaction exits.
+        """
 
         class WriteTransaction:
 
             def __enter__(self2):
+                if self.readonly:
+                    raise io.UnsupportedOperation(
+                        'Cannot modify {} opened in read-only mode'
+                        .format(self)
+                    )
                 self._lock.writer_lock.acquire()
+                if self._write_depth == 0:
+                    self._snapshot = (self.last_page,
+                                      self._freelist_start_page,
+                                      self._dedup_start_page,
+                                      self._root_node_page)
+                self._write_depth += 1
 
             def __exit__(self2, exc_type, exc_val, exc_tb):
+                self._write_depth -= 1
                 if exc_type:
                     # When an error happens in the middle of a write
                     # transaction we must roll it back and clear the cache
                     # because the writer may have partially modified the Nodes
-                    self._wal.rollback()
-                    self._cache.clear()
-                else:
-                    self._wal.commit()
+                    self._rollback()
+                    with self._cache_lock:
+                        self._cache.clear()
+                    self._restore_snapshot()
+                elif self._write_depth == 0:
+                    if self._commit():
+                        self.generation += 1
                 self._lock.writer_lock.release()
 
         return WriteTransaction()
 
+    @property
+    def exclusive_lock(self):
+        """Lock excluding all readers and writers, even in read-only mode."""
+        return self._lock.writer_lock
+
+    def _restore_snapshot(self):
+        """Forget about pages allocated by a transaction rolled back."""
+        (last_page, freelist_start_page, dedup_start_page,
+         root_node_page) = self._snapshot
+        self.last_page = last_page
+        # Maps of free and shared extents are reloaded from committed pages
+        self._free_extents = None
+        self._shared_extents = None
+        if (freelist_start_page != self._freelist_start_page or
+                dedup_start_page != self._dedup_start_page or
+                root_node_page != self._root_node_page):
+            self._freelist_start_page = freelist_start_page
+            self._dedup_start_page = dedup_start_page
+            self.set_metadata(root_node_page, None)
+
     @property
     def next_available_page(self) -> int:
-        last_freelist_page = self._pop_from_freelist()
+        return self.next_available_extent(1)
+
+    def next_available_page_near(self, page: int) -> int:
+        """Allocate the free page closest to a page.
+
+        Nodes allocated next to their siblings keep range scans sequential.
+        Without free pages, the page is appended to the storage.
+        """
+        self._load_free_extents()
+        if not self._free_pages:
+            self.last_page += 1
+            return self.last_page
+
+        candidates = list()
+        i = bisect.bisect_right(self._free_pages, page)
+        if i > 0:
+            # Closest page of the extent starting before the page
+            start = self._free_pages[i - 1]
+            num_pages, _ = self._free_extents[start]
+            candidates.append((start, min(page, start + num_pages - 1)))
+        if i < len(self._free_pages):
+            start = self._free_pages[i]
+            candidates.append((start, start))
+
+        start, free_page = min(candidates, key=lambda c: abs(c[1] - page))
+        self._take_from_free_extent(start, free_page)
+        return free_page
+
+    def next_available_extent(self, num_pages: int) -> int:
+        """Allocate contiguous pages and return the first one.
+
+        Pages are reused from the freelist when its last extent is big
+        enough, otherwise they are appended to the storage.
+        """
+        last_freelist_page = self._pop_from_freelist(num_pages)
         if last_freelist_page is not None:
             return last_freelist_page
 
-        self.last_page += 1
-        return self.last_page
+        self.last_page += num_pages
+        return self.last_page - num_pages + 1
+
+    def _load_free_extents(self):
+        """Load in memory the map of free extents if not done yet.
+
+        Extents are indexed by their first page, along with their length
+        and the extent preceding them in the freelist.
+        """
+        if self._free_extents is not None:
+            return
+
+        free_extents = dict()
+        previous_page = None
+        page = self._freelist_start_page or None
+        while page is not None:
+            node = self.get_node(page)
+            free_extents[page] = (node.num_pages, previous_page)
+            previous_page = page
+            page = node.next_page
+
+        self._free_pages = sorted(free_extents)
+        self._freelist_last_page = previous_page
+        self._free_extents = free_extents
 
     def _traverse_free_list(self) -> Tuple[Optional[FreelistNode],
                                            Optional[FreelistNode]]:
-        if self._freelist_start_page == 0:
+        self._load_free_extents()
+        if self._freelist_last_page is None:
             return None, None
 
-        second_to_last_node = None
-        last_node = self.get_node(self._freelist_start_page)
+        _, previous_page = self._free_extents[self._freelist_last_page]
+        last_node = self.get_node(self._freelist_last_page)
+        if previous_page is None:
+            return None, last_node
+        return self.get_node(previous_page), last_node
 
-        while last_node.next_page is not None:
-            second_to_last_node = last_node
-            last_node = self.get_node(second_to_last_node.next_page)
-
-        return second_to_last_node, last_node
-
-    def _insert_in_freelist(self, page: int):
-        """Insert a page at the end of the freelist."""
-        _, last_node = self._traverse_free_list()
-
-        self.set_node(FreelistNode(self._tree_conf, page=page, next_page=None))
-
-        if last_node is None:
+    def _link_free_extents(self, previous_page: Optional[int],
+                           next_page: Optional[int]):
+        """Make an extent follow another one in the freelist."""
+        if previous_page is None:
             # Write in metadata that the freelist got a new starting point
-            self._freelist_start_page = page
+            self._freelist_start_page = next_page or 0
             self.set_metadata(None, None)
         else:
-            last_node.next_page = page
-            self.set_node(last_node)
+            node = self.get_node(previous_page)
+            node.next_page = next_page
+            self.set_node(node)
+        self._set_previous_free_extent(next_page, previous_page)
+
+    def _set_previous_free_extent(self, page: Optional[int],
+                                  previous_page: Optional[int]):
+        if page is None:
+            self._freelist_last_page = previous_page
+        else:
+            num_pages, _ = self._free_extents[page]
+            self._free_extents[page] = (num_pages, previous_page)
+
+    def _add_free_extent(self, page: int, num_pages: int,
+                         previous_page: Optional[int],
+                         next_page: Optional[int]):
+        """Insert contiguous pages in the freelist between two extents."""
+        self.set_node(FreelistNode(self._tree_conf, page=page,
+                                   next_page=next_page, num_pages=num_pages))
+        bisect.insort(self._free_pages, page)
+        self._free_extents[page] = (num_pages, None)
+        self._link_free_extents(previous_page, page)
+        self._set_previous_free_extent(next_page, page)
+
+    def _remove_free_extent(self, page: int):
+        """Remove an extent from the freelist."""
+        next_page = self.get_node(page).next_page
+        _, previous_page = self._free_extents.pop(page)
+        del self._free_pages[bisect.bisect_left(self._free_pages, page)]
+        self._link_free_extents(previous_page, next_page)
+
+    def _resize_free_extent(self, page: int, num_pages: int):
+        """Keep only the first pages of an extent in the freelist."""
+        node = self.get_node(page)
+        node.num_pages = num_pages
+        self.set_node(node)
+        _, previous_page = self._free_extents[page]
+        self._free_extents[page] = (num_pages, previous_page)
+
+    def _take_from_free_extent(self, start: int, page: int):
+        """Remove a single page from an extent of the freelist."""
+        num_pages, previous_page = self._free_extents[start]
+        end = start + num_pages
+        if page == start:
+            next_page = self.get_node(start).next_page
+            self._remove_free_extent(start)
+            if num_pages > 1:
+                self._add_free_extent(start + 1, num_pages - 1,
+                                      previous_page, next_page)
+        elif page == end - 1:
+            self._resize_free_extent(start, num_pages - 1)
+        else:
+            # The extent is split in two around the page
+            next_page = self.get_node(start).next_page
+            self._resize_free_extent(start, page - start)
+            self._add_free_extent(page + 1, end - page - 1, start, next_page)
+
+    def _insert_in_freelist(self, page: int, num_pages: int=1):
+        """Insert contiguous pages at the end of the freelist."""
+        self._load_free_extents()
+        self._add_free_extent(page, num_pages, self._freelist_last_page, None)
 
-    def _pop_from_freelist(self) -> Optional[int]:
-        """Remove the last page from the freelist and return its page."""
-        second_to_last_node, last_node = self._traverse_free_list()
+    def _pop_from_freelist(self, num_pages: int=1) -> Optional[int]:
+        """Remove contiguous pages from the freelist and return the first one.
 
-        if last_node is None:
+        The pages are taken from the end of the last extent of the freelist.
+        """
+        self._load_free_extents()
+        last_page = self._freelist_last_page
+        if last_page is None:
             # Freelist is completely empty, nothing to pop
             return None
 
-        if second_to_last_node is None:
-            # Write in metadata that the freelist is empty
-            self._freelist_start_page = 0
-            self.set_metadata(None, None)
-        else:
-            second_to_last_node.next_page = None
-            self.set_node(second_to_last_node)
+        last_num_pages, _ = self._free_extents[last_page]
+        if last_num_pages < num_pages:
+            # The last extent is too small
+            return None
+
+        if last_num_pages > num_pages:
+            # The beginning of the extent stays in the freelist
+            self._resize_free_extent(last_page, last_num_pages - num_pages)
+            return last_page + last_num_pages - num_pages
 
-        return last_node.page
+        self._remove_free_extent(last_page)
+        return last_page
 
     # Todo: make metadata as a normal Node
     def get_metadata(self) -> tuple:
         try:
             data = self._read_page(0)
         except ReachedEndOfFile:
-            raise ValueError('Metadata not set yet')
-        end_root_node_page = PAGE_REFERENCE_BYTES
+            raise MetadataNotSet('Metadata not set yet')
+        # The width of page references comes right after the magic and the
+        # version, other page references of the metadata depend on it
+        end_page_reference_bytes = FILE_HEADER_LENGTH
+        page_reference_bytes = read_file_header(data)
+        end_root_node_page = end_page_reference_bytes + page_reference_bytes
         root_node_page = int.from_bytes(
-            data[0:end_root_node_page], ENDIAN
+            data[end_page_reference_bytes:end_root_node_page], ENDIAN
         )
         end_page_size = end_root_node_page + OTHERS_BYTES
         page_size = int.from_bytes(
@@ -267,7 +1119,7 @@ class FileMemory:
         end_order = end_page_size + OTHERS_BYTES
         order = int.from_bytes(
             data[end_page_size:end_order], ENDIAN
-        )
+        ) or None
         end_key_size = end_order + OTHERS_BYTES
         key_size = int.from_bytes(
             data[end_order:end_key_size], ENDIAN
@@ -276,12 +1128,21 @@ class FileMemory:
         value_size = int.from_bytes(
             data[end_key_size:end_value_size], ENDIAN
         )
-        end_freelist_start_page = end_value_size + PAGE_REFERENCE_BYTES
+        end_freelist_start_page = end_value_size + page_reference_bytes
         self._freelist_start_page = int.from_bytes(
             data[end_value_size:end_freelist_start_page], ENDIAN
         )
+        end_compression = end_freelist_start_page + OTHERS_BYTES
+        compression = int_to_compression(int.from_bytes(
+            data[end_freelist_start_page:end_compression], ENDIAN
+        ))
+        end_dedup_start_page = end_compression + page_reference_bytes
+        self._dedup_start_page = int.from_bytes(
+            data[end_compression:end_dedup_start_page], ENDIAN
+        )
         self._tree_conf = TreeConf(
-            page_size, order, key_size, value_size, self._tree_conf.serializer
+            page_size, order, key_size, value_size, self._tree_conf.serializer,
+            compression, page_reference_bytes
         )
         self._root_node_page = root_node_page
         return root_node_page, self._tree_conf
@@ -295,55 +1156,648 @@ class FileMemory:
         if tree_conf is None:
             tree_conf = self._tree_conf
 
-        length = 2 * PAGE_REFERENCE_BYTES + 4 * OTHERS_BYTES
+        compression = compression_to_int(tree_conf.compression)
+        page_reference_bytes = tree_conf.page_reference_bytes
+        length = (FILE_HEADER_LENGTH + 3 * page_reference_bytes +
+                  5 * OTHERS_BYTES)
         data = (
-            root_node_page.to_bytes(PAGE_REFERENCE_BYTES, ENDIAN) +
+            FILE_MAGIC +
+            FORMAT_VERSION.to_bytes(OTHERS_BYTES, ENDIAN) +
+            page_reference_bytes.to_bytes(OTHERS_BYTES, ENDIAN) +
+            root_node_page.to_bytes(page_reference_bytes, ENDIAN) +
             tree_conf.page_size.to_bytes(OTHERS_BYTES, ENDIAN) +
-            tree_conf.order.to_bytes(OTHERS_BYTES, ENDIAN) +
+            (tree_conf.order or 0).to_bytes(OTHERS_BYTES, ENDIAN) +
             tree_conf.key_size.to_bytes(OTHERS_BYTES, ENDIAN) +
             tree_conf.value_size.to_bytes(OTHERS_BYTES, ENDIAN) +
-            self._freelist_start_page.to_bytes(PAGE_REFERENCE_BYTES, ENDIAN) +
+            self._freelist_start_page.to_bytes(page_reference_bytes, ENDIAN) +
+            compression.to_bytes(OTHERS_BYTES, ENDIAN) +
+            self._dedup_start_page.to_bytes(page_reference_bytes, ENDIAN) +
             bytes(tree_conf.page_size - length)
         )
-        self._write_page_in_tree(0, data, fsync=True)
+        self._write_metadata_page(data)
 
         self._tree_conf = tree_conf
         self._root_node_page = root_node_page
 
+
+class ExtentReader(io.RawIOBase):
+    """Read-only stream over the data stored in an extent.
+
+    Pages are read when the stream is read, the data is never loaded in
+    memory at once. The extent must not be deallocated while the stream is
+    in use.
+    """
+
+    def __init__(self, mem: Memory, page: int):
+        super().__init__()
+        self._mem = mem
+        self._page = page
+        self._position = 0
+        with mem.read_transaction:
+            first_page_data = mem._read_page(page)
+        self._length = int.from_bytes(first_page_data[0:EXTENT_LENGTH_BYTES],
+                                      ENDIAN)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int=io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self._length + offset
+        else:
+            raise ValueError('Invalid whence {}'.format(whence))
+        if position < 0:
+            raise ValueError('Negative seek position {}'.format(position))
+        self._position = position
+        return position
+
+    def readinto(self, buffer) -> int:
+        if self.closed:
+            raise ValueError('I/O operation on closed stream')
+
+        length = min(len(buffer), self._length - self._position)
+        if length <= 0:
+            return 0
+
+        # Read at once all the pages covering the requested range
+        page_size = self._mem._tree_conf.page_size
+        start = EXTENT_LENGTH_BYTES + self._position
+        stop = start + length
+        first_page = start // page_size
+        num_pages = (stop - 1) // page_size - first_page + 1
+        with self._mem.read_transaction:
+            data = self._mem._read_pages(self._page + first_page, num_pages)
+
+        offset = start - first_page * page_size
+        memoryview(buffer).cast('B')[0:length] = (
+            memoryview(data)[offset:offset + length]
+        )
+        self._position += length
+        return length
+
+    def __repr__(self):
+        return '<ExtentReader: page={} length={}>'.format(self._page,
+                                                          self._length)
+
+
+class Readahead:
+    """Advise a storage of the leaves a scan is about to read.
+
+    Leaves are not necessarily contiguous in the file, their pages come from
+    `leaves`, an iterator over the pages of the leaves the scan reads next,
+    in order. They are advised by windows. The window starts at a single
+    leaf and doubles every time the scan reaches the second half of the
+    previous one, up to `max_pages`. Short scans only ask for a few pages
+    while long ones read far enough ahead to keep the disk streaming.
+
+    Contiguous pages of a window are advised at once.
+    """
+
+    __slots__ = ['_mem', '_max_pages', '_leaves', '_window', '_position',
+                 '_stop']
+
+    def __init__(self, mem: Memory, max_pages: int, leaves: Iterator[int]):
+        self._mem = mem
+        self._max_pages = max_pages
+        self._leaves = leaves
+        self._window = 1
+        # Number of leaves the scan moved to and advised so far
+        self._position = 0
+        self._stop = 0
+
+    def visit(self):
+        """Tell that the scan moves to the next leaf."""
+        if not self._max_pages:
+            return
+
+        position = self._position
+        self._position += 1
+        if position < self._stop - self._window // 2:
+            # Still far enough from the end of the advised window
+            return
+
+        if self._stop:
+            # Continue the window where the previous one stopped
+            self._window = min(self._window * 2, self._max_pages)
+        start = self._stop
+        self._stop = position + self._window
+        pages = sorted(itertools.islice(self._leaves, self._stop - start))
+        for run in contiguous_runs(pages, self._max_pages):
+            self._mem.advise(run[0], len(run))
+
+
+class BufferPool:
+    """Raw pages read with direct I/O, kept in a fixed amount of memory.
+
+    Files opened with O_DIRECT bypass the page cache of the OS, they must be
+    read into buffers aligned on memory pages. The pool allocates them at
+    once with an anonymous mmap, divided in slots of a page, and keeps the
+    most recently used pages.
+
+    Pages are read from disk without holding the lock: the slot being filled
+    belongs to a single reader until its page enters the pool.
+    """
+
+    __slots__ = ['_page_size', '_buffer', '_slots', '_free_slots', '_lock']
+
+    def __init__(self, page_size: int, size: int):
+        if page_size % mmap.PAGESIZE:
+            raise ValueError('Direct I/O needs a page size multiple of {}'
+                             .format(mmap.PAGESIZE))
+        num_slots = size // page_size
+        if num_slots == 0:
+            raise ValueError('Buffer pool of {} bytes cannot hold a page of '
+                             '{} bytes'.format(size, page_size))
+
+        self._page_size = page_size
+        self._buffer = mmap.mmap(-1, num_slots * page_size)
+        # Slots of the pages in the pool, from least to most recently used
+        self._slots = OrderedDict()
+        self._free_slots = list(range(num_slots))
+        self._lock = threading.Lock()
+
+    def read_page(self, fileno: int, page: int) -> bytes:
+        with self._lock:
+            slot = self._slots.get(page)
+            if slot is not None:
+                self._slots.move_to_end(page)
+                return self._buffer[self._slice(slot)]
+            slot = self._take_slot()
+
+        if slot is None:
+            # All slots are being filled by other readers
+            return self.read_pages(fileno, page, 1)
+
+        try:
+            with memoryview(self._buffer)[self._slice(slot)] as view:
+                read_from_file_direct(fileno, view, page * self._page_size)
+                data = bytes(view)
+        except BaseException:
+            with self._lock:
+                self._free_slots.append(slot)
+            raise
+
+        with self._lock:
+            if page in self._slots:
+                # Another reader was faster
+                self._free_slots.append(slot)
+            else:
+                self._slots[page] = slot
+        return data
+
+    def read_pages(self, fileno: int, page: int, num_pages: int) -> bytes:
+        """Read contiguous pages without keeping them in the pool.
+
+        Big values read once would otherwise evict the nodes.
+        """
+        length = num_pages * self._page_size
+        with mmap.mmap(-1, length) as buffer:
+            with memoryview(buffer) as view:
+                read_from_file_direct(fileno, view, page * self._page_size)
+            return buffer[:]
+
+    def discard(self, page: int):
+        with self._lock:
+            slot = self._slots.pop(page, None)
+            if slot is not None:
+                self._free_slots.append(slot)
+
+    def clear(self):
+        with self._lock:
+            self._free_slots.extend(self._slots.values())
+            self._slots.clear()
+
     def close(self):
-        self.perform_checkpoint()
+        self._buffer.close()
+
+    def _take_slot(self) -> Optional[int]:
+        if self._free_slots:
+            return self._free_slots.pop()
+        if self._slots:
+            _, slot = self._slots.popitem(last=False)
+            return slot
+        return None
+
+    def _slice(self, slot: int) -> slice:
+        start = slot * self._page_size
+        return slice(start, start + self._page_size)
+
+    def __len__(self):
+        return len(self._slots)
+
+
+class FileMemory(Memory):
+    """Storage of a tree in a file, made durable by a write-ahead log.
+
+    With a `buffer_pool_size`, in bytes, pages are read with direct I/O into
+    a `BufferPool` instead of going through the page cache of the OS.
+
+    With `warm_cache`, the pages in the cache are saved next to the file
+    when it is closed, to be loaded back by `warm_cache()` once reopened.
+    The list is removed as soon as the file is opened for writing, it never
+    refers to pages that changed since.
+    """
+
+    __slots__ = ['_filename', '_fd', '_dir_fd', '_wal', '_mmap',
+                 '_direct_fd', '_pool', '_warm_cache', '_hot_pages']
+
+    def __init__(self, filename: str, tree_conf: TreeConf,
+                 cache_size: int=512, readonly: bool=False,
+                 buffer_pool_size: Optional[int]=None,
+                 cache_policy: Union[str, Callable]='lru',
+                 pin_internal_nodes: bool=False,
+                 cache_bytes: Optional[int]=None, warm_cache: bool=False):
+        super().__init__(tree_conf, cache_size, readonly, cache_policy,
+                         pin_internal_nodes, cache_bytes)
+        self._filename = filename
+        self._warm_cache = warm_cache
+        self._hot_pages = list()
+
+        self._mmap = None
+        self._direct_fd = None
+        self._pool = None
+        if readonly:
+            self._fd = open(filename, mode='rb', buffering=0)
+            self._dir_fd = None
+        else:
+            self._fd, self._dir_fd = open_file_in_dir(filename)
+        try:
+            lock_file(self._fd, shared=readonly)
+        except ValueError:
+            self._close_fds()
+            raise
+
+        # Pages in the WAL are referenced with the width recorded in the
+        # metadata of an existing file
+        try:
+            page_reference_bytes = read_file_header(
+                read_from_file(self._fd, 0, FILE_HEADER_LENGTH)
+            )
+        except (ReachedEndOfFile, MetadataNotSet):
+            pass
+        except ValueError:
+            self._close_fds()
+            raise
+        else:
+            self._tree_conf = self._tree_conf._replace(
+                page_reference_bytes=page_reference_bytes
+            )
+
+        self._load_hot_pages()
+
+        if buffer_pool_size is not None:
+            try:
+                self._pool = BufferPool(tree_conf.page_size, buffer_pool_size)
+                self._open_direct()
+            except ValueError:
+                self._close_fds()
+                raise
+
+        if readonly:
+            self._wal = None
+            self._open_readonly()
+        else:
+            self._wal = WAL(filename, tree_conf.page_size,
+                            self._tree_conf.page_reference_bytes)
+            if self._wal.needs_recovery:
+                self.perform_checkpoint(reopen_wal=True)
+
+        # Get the next available page
+        self._fd.seek(0, io.SEEK_END)
+        last_byte = self._fd.tell()
+        self.last_page = int(last_byte / self._tree_conf.page_size)
+
+    def _open_readonly(self):
+        """Map the file in memory to serve pages without any system call.
+
+        A file with a WAL has not been closed properly, its recovery needs
+        to write to the file.
+        """
+        if os.path.exists(self._filename + '-wal'):
+            self._close_fds()
+            raise ValueError('File {} needs to be recovered from its WAL, it '
+                             'must be opened once in read-write mode'
+                             .format(self._filename))
+
+        if os.fstat(self._fd.fileno()).st_size == 0:
+            self._close_fds()
+            raise ValueError('Cannot open empty file {} in read-only mode'
+                             .format(self._filename))
+
+        if self._pool is None:
+            self._mmap = mmap.mmap(self._fd.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+
+    def _open_direct(self):
+        """Open the file a second time, to read it with direct I/O.
+
+        Writes keep going through the first descriptor.
+        """
+        if not hasattr(os, 'O_DIRECT') or not hasattr(os, 'preadv'):
+            raise ValueError('Direct I/O is not supported on this platform')
+
+        try:
+            self._direct_fd = os.open(self._filename,
+                                      os.O_RDONLY | os.O_DIRECT)
+        except OSError as e:
+            raise ValueError('Cannot open {} with direct I/O: {}'
+                             .format(self._filename, e))
+
+    def _write_page(self, page: int, data: Union[bytes, bytearray]):
+        self._wal.set_page(page, data)
+
+    def _write_metadata_page(self, data: Union[bytes, bytearray]):
+        self._write_page_in_tree(0, data, fsync=True)
+
+    def _commit(self) -> bool:
+        return self._wal.commit()
+
+    def _rollback(self):
+        self._wal.rollback()
+
+    def close(self):
+        if self._wal is not None:
+            self.perform_checkpoint()
+            if self._warm_cache:
+                self._save_hot_pages()
+        self._close_fds()
+        if self._pool is not None:
+            self._pool.close()
+
+    def warm_cache(self, pages: Iterable[int]=()):
+        hot_pages, self._hot_pages = self._hot_pages, list()
+        super().warm_cache(itertools.chain(hot_pages, pages))
+
+    def _load_hot_pages(self):
+        """Read the pages saved by the last instance that closed the file."""
+        path = self._filename + '-cache'
+        if not os.path.exists(path):
+            return
+
+        if self._warm_cache:
+            with open(path, 'rb') as f:
+                data = f.read()
+            width = self._tree_conf.page_reference_bytes
+            self._hot_pages = [
+                int.from_bytes(data[i:i+width], ENDIAN)
+                for i in range(0, len(data) - width + 1, width)
+            ]
+        if not self.readonly:
+            os.remove(path)
+
+    def _save_hot_pages(self):
+        with self._cache_lock:
+            pages = self._cache.pages()
+        width = self._tree_conf.page_reference_bytes
+        with open(self._filename + '-cache', 'wb') as f:
+            f.write(b''.join(page.to_bytes(width, ENDIAN) for page in pages))
+
+    def _close_fds(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        if self._direct_fd is not None:
+            os.close(self._direct_fd)
         self._fd.close()
         if self._dir_fd is not None:
             os.close(self._dir_fd)
 
     def perform_checkpoint(self, reopen_wal=False):
         logger.info('Performing checkpoint of %s', self._filename)
+        self._preallocate(self._wal.last_committed_page)
         for page, page_data in self._wal.checkpoint():
             self._write_page_in_tree(page, page_data, fsync=False)
         fsync_file_and_dir(self._fd.fileno(), self._dir_fd)
+        if self._pool is not None:
+            self._drop_from_os_cache()
         if reopen_wal:
-            self._wal = WAL(self._filename, self._tree_conf.page_size)
+            self._wal = WAL(self._filename, self._tree_conf.page_size,
+                            self._tree_conf.page_reference_bytes)
+
+    def replace_storage(self, other: 'FileMemory'):
+        other.close()
+        self.perform_checkpoint()
+
+        # The new file is locked before taking the place of the current one,
+        # no other instance can open the tree in between
+        fd, dir_fd = open_file_in_dir(other._filename)
+        try:
+            lock_file(fd)
+        except ValueError:
+            fd.close()
+            if dir_fd is not None:
+                os.close(dir_fd)
+            raise
+        os.replace(other._filename, self._filename)
+        if dir_fd is not None:
+            os.fsync(dir_fd)
+
+        self._close_fds()
+        self._fd, self._dir_fd = fd, dir_fd
+        if self._pool is not None:
+            self._pool.clear()
+            self._open_direct()
+        self._wal = WAL(self._filename, self._tree_conf.page_size,
+                        self._tree_conf.page_reference_bytes)
+        self._fd.seek(0, io.SEEK_END)
+        self.last_page = int(self._fd.tell() / self._tree_conf.page_size)
+        self._reload()
+
+    def advise(self, page: int, num_pages: int):
+        if self._pool is not None:
+            # Direct reads would not benefit from the page cache
+            return
+        if not hasattr(os, 'posix_fadvise'):
+            return
+
+        page_size = self._tree_conf.page_size
+        try:
+            os.posix_fadvise(self._fd.fileno(), page * page_size,
+                             num_pages * page_size, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            logger.debug('Could not advise reading ahead %s', self._filename)
+
+    def _drop_from_os_cache(self):
+        """Evict the pages written by a checkpoint from the page cache.
+
+        They are read with direct I/O, keeping them would only waste memory.
+        """
+        if not hasattr(os, 'posix_fadvise'):
+            return
+
+        try:
+            os.posix_fadvise(self._fd.fileno(), 0, 0,
+                             os.POSIX_FADV_DONTNEED)
+        except OSError:
+            logger.debug('Could not drop %s from the page cache',
+                         self._filename)
+
+    def _preallocate(self, last_page: int):
+        """Reserve the space of the pages past the end of the file.
+
+        Pages are written back from the WAL in no particular order, reserving
+        their space at once lets the file system lay them out contiguously.
+
+        Compressed pages only write the start of their slot, the rest must
+        stay a hole for the file to take less space on disk.
+        """
+        if (self._tree_conf.compression is not None or
+                not hasattr(os, 'posix_fallocate')):
+            return
+
+        size = self._fd.seek(0, io.SEEK_END)
+        stop = (last_page + 1) * self._tree_conf.page_size
+        if stop <= size:
+            return
+
+        try:
+            os.posix_fallocate(self._fd.fileno(), size, stop - size)
+        except OSError:
+            # Not all file systems support it, space is then allocated as
+            # pages get written
+            logger.debug('Could not preallocate %s', self._filename)
 
     def _read_page(self, page: int) -> bytes:
+        if self._wal is not None:
+            data = self._wal.get_page(page)
+            if data:
+                return data
+
         start = page * self._tree_conf.page_size
         stop = start + self._tree_conf.page_size
         assert stop - start == self._tree_conf.page_size
-        return read_from_file(self._fd, start, stop)
+        if self._pool is not None:
+            return self._pool.read_page(self._direct_fd, page)
+        if self._mmap is None:
+            return read_from_file(self._fd, start, stop)
+
+        data = self._mmap[start:stop]
+        if len(data) != stop - start:
+            raise ReachedEndOfFile('Read until the end of file')
+        return data
+
+    def _read_pages(self, page: int, num_pages: int) -> bytes:
+        pages = range(page, page + num_pages)
+        if self._wal is not None and any(p in self._wal for p in pages):
+            # Some pages are more recent in the WAL than in the file
+            return self._join_pages(pages)
+
+        start = page * self._tree_conf.page_size
+        stop = start + num_pages * self._tree_conf.page_size
+        if self._pool is not None:
+            return self._pool.read_pages(self._direct_fd, page, num_pages)
+        if self._mmap is None:
+            return read_from_file(self._fd, start, stop)
+
+        data = self._mmap[start:stop]
+        if len(data) != stop - start:
+            raise ReachedEndOfFile('Read until the end of file')
+        return data
 
     def _write_page_in_tree(self, page: int, data: Union[bytes, bytearray],
                             fsync: bool=True):
         """Write a page of data in the tree file itself.
 
         To be used during checkpoints and other non-standard uses.
+
+        Every page has a slot of `page_size` bytes in the file, a compressed
+        page only writes the start of its slot.
         """
-        assert len(data) == self._tree_conf.page_size
-        self._fd.seek(page * self._tree_conf.page_size)
-        write_to_file(self._fd, self._dir_fd, data, fsync=fsync)
+        assert len(data) <= self._tree_conf.page_size
+        if self._pool is not None:
+            self._pool.discard(page)
+        start = page * self._tree_conf.page_size
+        self._fd.seek(start)
+        write_to_file(self._fd, self._dir_fd, data, fsync=False)
+
+        stop = start + self._tree_conf.page_size
+        if len(data) < self._tree_conf.page_size:
+            # The end of the slot of the last page must exist for reads of a
+            # whole page to succeed, extending the file leaves a hole
+            if self._fd.seek(0, io.SEEK_END) < stop:
+                os.ftruncate(self._fd.fileno(), stop)
+
+        if fsync:
+            fsync_file_and_dir(self._fd.fileno(), self._dir_fd)
 
     def __repr__(self):
         return '<FileMemory: {}>'.format(self._filename)
 
 
+class VolatileMemory(Memory):
+    """Storage of a tree in RAM, its content is lost when it is closed.
+
+    Pages are still serialized so that it behaves like persistent storage
+    minus the I/O, which makes it suitable for tests and benchmarks.
+    """
+
+    __slots__ = ['_committed_pages', '_not_committed_pages']
+
+    def __init__(self, tree_conf: TreeConf, cache_size: int=512,
+                 cache_policy: Union[str, Callable]='lru',
+                 pin_internal_nodes: bool=False,
+                 cache_bytes: Optional[int]=None):
+        super().__init__(tree_conf, cache_size,
+                         cache_policy=cache_policy,
+                         pin_internal_nodes=pin_internal_nodes,
+                         cache_bytes=cache_bytes)
+        self._committed_pages = dict()
+        self._not_committed_pages = dict()
+
+    def _read_page(self, page: int) -> bytes:
+        for store in (self._not_committed_pages, self._committed_pages):
+            data = store.get(page)
+            if data is not None:
+                return data
+        raise ReachedEndOfFile('Page {} does not exist'.format(page))
+
+    def _read_pages(self, page: int, num_pages: int) -> bytes:
+        return self._join_pages(range(page, page + num_pages))
+
+    def _write_page(self, page: int, data: Union[bytes, bytearray]):
+        assert len(data) <= self._tree_conf.page_size
+        self._not_committed_pages[page] = bytes(data)
+
+    def _write_metadata_page(self, data: Union[bytes, bytearray]):
+        assert len(data) == self._tree_conf.page_size
+        self._committed_pages[0] = bytes(data)
+
+    def _commit(self) -> bool:
+        committed = bool(self._not_committed_pages)
+        self._committed_pages.update(self._not_committed_pages)
+        self._not_committed_pages = dict()
+        return committed
+
+    def _rollback(self):
+        self._not_committed_pages = dict()
+
+    def perform_checkpoint(self, reopen_wal=False):
+        pass
+
+    def close(self):
+        self._committed_pages = dict()
+        self._not_committed_pages = dict()
+
+    def replace_storage(self, other: 'VolatileMemory'):
+        self._committed_pages = other._committed_pages
+        self._not_committed_pages = dict()
+        self.last_page = other.last_page
+        other.close()
+        self._reload()
+
+    def __repr__(self):
+        return '<VolatileMemory>'
+
+
 class FrameType(enum.Enum):
     PAGE = 1
     COMMIT = 2
@@ -353,16 +1807,15 @@ class FrameType(enum.Enum):
 class WAL:
 
     __slots__ = ['filename', '_fd', '_dir_fd', '_page_size',
-                 '_committed_pages', '_not_committed_pages', 'needs_recovery']
-
-    FRAME_HEADER_LENGTH = (
-        FRAME_TYPE_BYTES + PAGE_REFERENCE_BYTES
-    )
+                 '_page_reference_bytes', '_committed_pages',
+                 '_not_committed_pages', 'needs_recovery']
 
-    def __init__(self, filename: str, page_size: int):
+    def __init__(self, filename: str, page_size: int,
+                 page_reference_bytes: int=PAGE_REFERENCE_BYTES):
         self.filename = filename + '-wal'
         self._fd, self._dir_fd = open_file_in_dir(self.filename)
         self._page_size = page_size
+        self._page_reference_bytes = page_reference_bytes
         self._committed_pages = dict()
         self._not_committed_pages = dict()
 
@@ -383,11 +1836,11 @@ class WAL:
 
         fsync_file_and_dir(self._fd.fileno(), self._dir_fd)
 
-        for page, page_start in self._committed_pages.items():
+        for page, (page_start, page_length) in self._committed_pages.items():
             page_data = read_from_file(
                 self._fd,
                 page_start,
-                page_start + self._page_size
+                page_start + page_length
             )
             yield page, page_data
 
@@ -403,9 +1856,9 @@ class WAL:
         write_to_file(self._fd, self._dir_fd, data, True)
 
     def _load_wal(self):
-        self._fd.seek(0)
         header_data = read_from_file(self._fd, 0, OTHERS_BYTES)
         assert int.from_bytes(header_data, ENDIAN) == self._page_size
+        self._fd.seek(OTHERS_BYTES)
 
         while True:
             try:
@@ -416,26 +1869,34 @@ class WAL:
             logger.warning('WAL has uncommitted data, discarding it')
             self._not_committed_pages = dict()
 
+    @property
+    def frame_header_length(self) -> int:
+        return (
+            FRAME_TYPE_BYTES + self._page_reference_bytes +
+            USED_PAGE_LENGTH_BYTES
+        )
+
     def _load_next_frame(self):
         start = self._fd.tell()
-        stop = start + self.FRAME_HEADER_LENGTH
+        stop = start + self.frame_header_length
         data = read_from_file(self._fd, start, stop)
 
         frame_type = int.from_bytes(data[0:FRAME_TYPE_BYTES], ENDIAN)
-        page = int.from_bytes(
-            data[FRAME_TYPE_BYTES:FRAME_TYPE_BYTES+PAGE_REFERENCE_BYTES],
-            ENDIAN
+        end_page = FRAME_TYPE_BYTES + self._page_reference_bytes
+        page = int.from_bytes(data[FRAME_TYPE_BYTES:end_page], ENDIAN)
+        page_length = int.from_bytes(
+            data[end_page:self.frame_header_length], ENDIAN
         )
 
         frame_type = FrameType(frame_type)
-        if frame_type is FrameType.PAGE:
-            self._fd.seek(stop + self._page_size)
+        self._fd.seek(stop + page_length)
 
-        self._index_frame(frame_type, page, stop)
+        self._index_frame(frame_type, page, stop, page_length)
 
-    def _index_frame(self, frame_type: FrameType, page: int, page_start: int):
+    def _index_frame(self, frame_type: FrameType, page: int, page_start: int,
+                     page_length: int):
         if frame_type is FrameType.PAGE:
-            self._not_committed_pages[page] = page_start
+            self._not_committed_pages[page] = (page_start, page_length)
         elif frame_type is FrameType.COMMIT:
             self._committed_pages.update(self._not_committed_pages)
             self._not_committed_pages = dict()
@@ -448,42 +1909,56 @@ class WAL:
                    page_data: Optional[bytes]=None):
         if frame_type is FrameType.PAGE and (not page or not page_data):
             raise ValueError('PAGE frame without page data')
-        if page_data and len(page_data) != self._page_size:
-            raise ValueError('Page data is different from page size')
+        if page_data and len(page_data) > self._page_size:
+            raise ValueError('Page data is bigger than page size')
         if not page:
             page = 0
         if frame_type is not FrameType.PAGE:
             page_data = b''
+        # Compressed pages are shorter than page size
+        page_length = len(page_data)
         data = (
             frame_type.value.to_bytes(FRAME_TYPE_BYTES, ENDIAN) +
-            page.to_bytes(PAGE_REFERENCE_BYTES, ENDIAN) +
+            page.to_bytes(self._page_reference_bytes, ENDIAN) +
+            page_length.to_bytes(USED_PAGE_LENGTH_BYTES, ENDIAN) +
             page_data
         )
         self._fd.seek(0, io.SEEK_END)
         write_to_file(self._fd, self._dir_fd, data,
                       fsync=frame_type != FrameType.PAGE)
-        self._index_frame(frame_type, page, self._fd.tell() - self._page_size)
+        self._index_frame(frame_type, page, self._fd.tell() - page_length,
+                          page_length)
 
     def get_page(self, page: int) -> Optional[bytes]:
-        page_start = None
+        frame = None
         for store in (self._not_committed_pages, self._committed_pages):
-            page_start = store.get(page)
-            if page_start:
+            frame = store.get(page)
+            if frame:
                 break
 
-        if not page_start:
+        if not frame:
             return None
 
-        return read_from_file(self._fd, page_start,
-                              page_start + self._page_size)
+        page_start, page_length = frame
+        return read_from_file(self._fd, page_start, page_start + page_length)
+
+    def __contains__(self, page: int) -> bool:
+        return (page in self._not_committed_pages or
+                page in self._committed_pages)
+
+    @property
+    def last_committed_page(self) -> int:
+        return max(self._committed_pages, default=0)
 
     def set_page(self, page: int, page_data: bytes):
         self._add_frame(FrameType.PAGE, page, page_data)
 
-    def commit(self):
+    def commit(self) -> bool:
         # Commit is a no-op when there is no uncommitted pages
-        if self._not_committed_pages:
-            self._add_frame(FrameType.COMMIT)
+        if not self._not_committed_pages:
+            return False
+        self._add_frame(FrameType.COMMIT)
+        return True
 
     def rollback(self):
         # Rollback is a no-op when there is no uncommitted pages
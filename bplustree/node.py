@@ -1,27 +1,73 @@
 import abc
+from array import array
 import bisect
 import math
+import sys
 from typing import Optional
 
 from .const import (ENDIAN, NODE_TYPE_BYTES, USED_PAGE_LENGTH_BYTES,
-                    PAGE_REFERENCE_BYTES, TreeConf)
-from .entry import Entry, Record, Reference, OpaqueData
+                    SLOT_BYTES, USED_KEY_LENGTH_BYTES, USED_VALUE_LENGTH_BYTES,
+                    DIGEST_BYTES, OTHERS_BYTES, TreeConf)
+from .entry import Entry, Record, Reference
+from .utils import common_prefix, pairwise
+
+# Size of the payload of a Node holding multiple Entries before the slots: the
+# number of slots and the length of the key prefix shared by all entries
+SLOTTED_HEADER_BYTES = SLOT_BYTES + USED_KEY_LENGTH_BYTES
+
+# Memory taken by an empty bytes object, to estimate the one of keys
+BYTES_FOOTPRINT = sys.getsizeof(b'')
+
+# Errors of serializers for keys that cannot be stored in a tree, like strings
+# longer than the key size or integers out of range
+SERIALIZE_ERRORS = (AssertionError, OverflowError, ValueError)
+
+
+def serialize_search_key(tree_conf: TreeConf, key) -> Optional[bytes]:
+    """Serialize a key to compare it to serialized keys.
+
+    Return None when keys must be compared deserialized: when the serializer
+    is not byte comparable or when the key cannot be serialized. Such a key
+    is in no node but it still has a place in the order of keys.
+    """
+    serializer = tree_conf.serializer
+    if not serializer.byte_comparable:
+        return None
+    try:
+        return serializer.serialize(key, tree_conf.key_size)
+    except SERIALIZE_ERRORS:
+        return None
 
 
 class Node(metaclass=abc.ABCMeta):
+    """A page of the tree.
+
+    Entries are not stored as objects but in parallel columns: the sorted
+    list of their keys, the list of their serialized keys and the columns
+    of their other fields named by `_columns`. Entry objects are only
+    created when they are asked for, searching a Node bisects its keys.
+
+    Keys of a loaded Node are only deserialized when they are needed. With
+    a byte comparable serializer, searches bisect the serialized keys and
+    may never need them.
+    """
 
-    __slots__ = ['_tree_conf', 'entries', 'page', 'parent', 'next_page']
+    __slots__ = ['_tree_conf', '_keys', '_raw_keys', 'page', 'parent',
+                 'next_page']
 
     # Attributes to redefine in inherited classes
     _node_type_int = 0
     max_children = 0
     min_children = 0
     _entry_class = None
+    _columns = ()
+    holds_records = False
 
     def __init__(self, tree_conf: TreeConf, data: Optional[bytes]=None,
                  page: int=None, parent: 'Node'=None, next_page: int=None):
         self._tree_conf = tree_conf
-        self.entries = list()
+        self._keys = list()
+        self._raw_keys = list()
         self.page = page
         self.parent = parent
         self.next_page = next_page
@@ -34,7 +80,9 @@ class Node(metaclass=abc.ABCMeta):
         used_page_length = int.from_bytes(
             data[NODE_TYPE_BYTES:end_used_page_length], ENDIAN
         )
-        end_header = end_used_page_length + PAGE_REFERENCE_BYTES
+        end_header = (
+            end_used_page_length + self._tree_conf.page_reference_bytes
+        )
         self.next_page = int.from_bytes(
             data[end_used_page_length:end_header], ENDIAN
         )
@@ -45,26 +93,76 @@ class Node(metaclass=abc.ABCMeta):
             # For Nodes that cannot hold Entries
             return
 
-        try:
-            # For Nodes that can hold multiple sized Entries
-            entry_length = self._entry_class(self._tree_conf).length
-        except AttributeError:
-            # For Nodes that can hold a single variable sized Entry
-            entry_length = used_page_length - end_header
+        # For Nodes that can hold multiple variable sized Entries, the
+        # payload starts with the prefix shared by all keys, followed by a
+        # directory of slots giving the offset of each entry in the page.
+        # Entries only store the suffix of their key.
+        end_num_slots = end_header + SLOT_BYTES
+        num_slots = int.from_bytes(data[end_header:end_num_slots], ENDIAN)
+        end_prefix_length = end_num_slots + USED_KEY_LENGTH_BYTES
+        prefix_length = int.from_bytes(
+            data[end_num_slots:end_prefix_length], ENDIAN
+        )
+        end_prefix = end_prefix_length + prefix_length
+        key_prefix = bytes(data[end_prefix_length:end_prefix])
+
+        offsets = list()
+        for start_slot in range(end_prefix,
+                                end_prefix + num_slots * SLOT_BYTES,
+                                SLOT_BYTES):
+            offsets.append(int.from_bytes(
+                data[start_slot:start_slot+SLOT_BYTES], ENDIAN
+            ))
+        offsets.append(used_page_length)
+
+        self._keys = None
+        for start_offset, end_offset in pairwise(offsets):
+            self._load_entry(data, start_offset, end_offset, key_prefix)
+
+    def _add_key(self, key_suffix: bytes, key_prefix: bytes):
+        raw_key = key_prefix + key_suffix
+        assert len(raw_key) <= self._tree_conf.key_size
+        self._raw_keys.append(raw_key)
 
-        for start_offset in range(end_header, used_page_length, entry_length):
-            entry_data = data[start_offset:start_offset+entry_length]
-            entry = self._entry_class(self._tree_conf, data=entry_data)
-            self.entries.append(entry)
+    @property
+    def keys(self) -> list:
+        """Keys of the entries, deserialized on first access."""
+        if self._keys is None:
+            deserialize = self._tree_conf.serializer.deserialize
+            self._keys = [deserialize(raw_key) for raw_key in self._raw_keys]
+        return self._keys
+
+    def _key(self, i: int):
+        """Key of an entry, without deserializing the other ones."""
+        if self._keys is None:
+            return self._tree_conf.serializer.deserialize(self._raw_keys[i])
+        return self._keys[i]
+
+    def _search_column(self, key) -> tuple:
+        """Column of keys to bisect and the key to look for in it."""
+        raw_key = serialize_search_key(self._tree_conf, key)
+        if raw_key is None:
+            return self.keys, key
+        return self._raw_keys, raw_key
+
+    def bisect_left(self, key) -> int:
+        """Index of the first entry with a key bigger than or equal to key."""
+        keys, key = self._search_column(key)
+        return bisect.bisect_left(keys, key)
+
+    def bisect_right(self, key) -> int:
+        """Index of the first entry with a key bigger than key."""
+        keys, key = self._search_column(key)
+        return bisect.bisect_right(keys, key)
 
     def dump(self) -> bytearray:
-        data = bytearray()
-        for record in self.entries:
-            data.extend(record.dump())
+        data = self._dump_payload()
 
         # used_page_length = len(header) + len(data), but the header is
         # generated later
-        used_page_length = len(data) + 4 + PAGE_REFERENCE_BYTES
+        used_page_length = (
+            len(data) + 4 + self._tree_conf.page_reference_bytes
+        )
         assert 0 < used_page_length <= self._tree_conf.page_size
         assert len(data) <= self.max_payload
 
@@ -72,7 +170,7 @@ class Node(metaclass=abc.ABCMeta):
         header = (
             self._node_type_int.to_bytes(1, ENDIAN) +
             used_page_length.to_bytes(3, ENDIAN) +
-            next_page.to_bytes(PAGE_REFERENCE_BYTES, ENDIAN)
+            next_page.to_bytes(self._tree_conf.page_reference_bytes, ENDIAN)
         )
 
         data = bytearray(header) + data
@@ -84,16 +182,143 @@ class Node(metaclass=abc.ABCMeta):
 
         return data
 
+    def _dump_payload(self) -> bytearray:
+        key_prefix = self.key_prefix
+        entries_data = [self._dump_entry(i, len(key_prefix))
+                        for i in range(len(self._raw_keys))]
+        num_slots = len(entries_data)
+        offset = (4 + self._tree_conf.page_reference_bytes +
+                  SLOTTED_HEADER_BYTES + len(key_prefix) +
+                  num_slots * SLOT_BYTES)
+
+        data = bytearray(num_slots.to_bytes(SLOT_BYTES, ENDIAN))
+        data.extend(len(key_prefix).to_bytes(USED_KEY_LENGTH_BYTES, ENDIAN))
+        data.extend(key_prefix)
+        for entry_data in entries_data:
+            data.extend(offset.to_bytes(SLOT_BYTES, ENDIAN))
+            offset += len(entry_data)
+        for entry_data in entries_data:
+            data.extend(entry_data)
+        return data
+
+    def _dump_key(self, i: int, prefix_length: int) -> bytes:
+        key_suffix = self._raw_keys[i][prefix_length:]
+        return (len(key_suffix).to_bytes(USED_KEY_LENGTH_BYTES, ENDIAN) +
+                key_suffix)
+
+    def _insert_entry(self, i: int, entry: Entry):
+        if self._keys is not None:
+            self._keys.insert(i, entry.key)
+        self._raw_keys.insert(i, entry.dump_key())
+        self._insert_fields(i, entry)
+
+    def _delete_entry(self, i: int):
+        if self._keys is not None:
+            del self._keys[i]
+        for name in ('_raw_keys',) + self._columns:
+            del getattr(self, name)[i]
+
+    @property
+    def entries(self) -> list:
+        """Objects of the entries of the Node, created on each access."""
+        return [self._entry(i) for i in range(len(self._raw_keys))]
+
+    @entries.setter
+    def entries(self, entries: list):
+        self._keys = list()
+        for name in ('_raw_keys',) + self._columns:
+            setattr(self, name, getattr(self, name)[:0])
+        for entry in entries:
+            self.insert_entry_at_the_end(entry)
+
+    def _take_entries(self, other: 'Node'):
+        """Take over the columns of entries of another Node."""
+        for name in ('_keys', '_raw_keys') + self._columns:
+            setattr(self, name, getattr(other, name))
+
     @property
     def max_payload(self) -> int:
         """Size in bytes of serialized payload a Node can carry."""
         return (
-            self._tree_conf.page_size - 4 - PAGE_REFERENCE_BYTES
+            self._tree_conf.page_size - 4 -
+            self._tree_conf.page_reference_bytes
         )
 
+    def footprint(self) -> int:
+        """Estimate the memory used by the Node, in bytes.
+
+        Deserialized keys are assumed to be about the size of their
+        serialized form.
+        """
+        footprint = sys.getsizeof(self) + sum(
+            sys.getsizeof(getattr(self, name))
+            for name in ('_keys', '_raw_keys') + self._columns
+        )
+        copies = 1 if self._keys is None else 2
+        footprint += sum(copies * (BYTES_FOOTPRINT + len(raw_key))
+                         for raw_key in self._raw_keys)
+        return footprint
+
+    @property
+    def key_prefix(self) -> bytes:
+        """Longest prefix shared by the serialized keys of all entries."""
+        return common_prefix(self._raw_keys)
+
     @property
-    def can_add_entry(self) -> bool:
-        return self.num_children < self.max_children
+    def payload_length(self) -> int:
+        """Size in bytes of the payload of the Node once serialized."""
+        return self._slotted_lengths()[0]
+
+    def _slotted_lengths(self) -> tuple:
+        """Compute the size of the payload with and without prefix compression.
+
+        Without compression, the size is the one of the entries and their
+        slots, as if every entry had its full key.
+        """
+        key_prefix = self.key_prefix
+        num_entries = len(self._raw_keys)
+        uncompressed_length = (sum(self._entry_lengths()) +
+                               num_entries * SLOT_BYTES)
+        entries_length = uncompressed_length - num_entries * len(key_prefix)
+        payload_length = (SLOTTED_HEADER_BYTES + len(key_prefix) +
+                          entries_length)
+        return payload_length, uncompressed_length
+
+    @property
+    def max_uncompressed_length(self) -> int:
+        """Size in bytes of entries with their full keys a Node can carry.
+
+        Thanks to prefix compression a page may hold more entries than their
+        uncompressed size suggests. But after a split the keys of each half
+        may share a shorter prefix, so the entries must stay small enough for
+        the two halves to fit in their pages without any compression.
+        """
+        entry_length = (
+            self._entry_class.max_length(self._tree_conf) + SLOT_BYTES
+        )
+        return 2 * (self.max_payload - SLOTTED_HEADER_BYTES - entry_length)
+
+    @property
+    def max_children_in_page(self) -> int:
+        """Number of entries of maximal size that fit in the page."""
+        entry_length = (
+            self._entry_class.max_length(self._tree_conf) + SLOT_BYTES
+        )
+        return (self.max_payload - SLOTTED_HEADER_BYTES) // entry_length
+
+    @property
+    def needs_split(self) -> bool:
+        """Tell if the Node holds more than it can.
+
+        The capacity of a Node is bounded by the size of its page and, if
+        the tree has an order, by the maximum number of children.
+        """
+        if (self.max_children is not None and
+                self.num_children > self.max_children):
+            return True
+        payload_length, uncompressed_length = self._slotted_lengths()
+        return (payload_length > self.max_payload or
+                uncompressed_length > self.max_uncompressed_length)
 
     @property
     def can_delete_entry(self) -> bool:
@@ -101,31 +326,33 @@ class Node(metaclass=abc.ABCMeta):
 
     @property
     def smallest_key(self):
-        return self.smallest_entry.key
+        return self._key(0)
 
     @property
     def smallest_entry(self):
-        return self.entries[0]
+        return self._entry(0)
 
     @property
     def biggest_key(self):
-        return self.biggest_entry.key
+        return self._key(-1)
 
     @property
     def biggest_entry(self):
-        return self.entries[-1]
+        return self._entry(-1)
 
     @property
     def num_children(self) -> int:
         """Number of entries or other nodes connected to the node."""
-        return len(self.entries)
+        return len(self._raw_keys)
 
     def pop_smallest(self) -> Entry:
         """Remove and return the smallest entry."""
-        return self.entries.pop(0)
+        entry = self._entry(0)
+        self._delete_entry(0)
+        return entry
 
     def insert_entry(self, entry: Entry):
-        bisect.insort(self.entries, entry)
+        self._insert_entry(self.bisect_right(entry.key), entry)
 
     def insert_entry_at_the_end(self, entry: Entry):
         """Insert an entry at the end of the entry list.
@@ -133,34 +360,58 @@ class Node(metaclass=abc.ABCMeta):
         This is an optimized version of `insert_entry` when it is known that
         the key to insert is bigger than any other entries.
         """
-        self.entries.append(entry)
+        self._insert_entry(len(self._raw_keys), entry)
 
     def remove_entry(self, key):
-        self.entries.pop(self._find_entry_index(key))
+        self._delete_entry(self._find_entry_index(key))
 
     def get_entry(self, key) -> Entry:
-        return self.entries[self._find_entry_index(key)]
+        return self._entry(self._find_entry_index(key))
 
     def _find_entry_index(self, key) -> int:
-        entry = self._entry_class(
-            self._tree_conf,
-            key=key  # Hack to compare and order
-        )
-        i = bisect.bisect_left(self.entries, entry)
-        if i != len(self.entries) and self.entries[i] == entry:
+        keys, search_key = self._search_column(key)
+        i = bisect.bisect_left(keys, search_key)
+        if i != len(keys) and keys[i] == search_key:
             return i
         raise ValueError('No entry for key {}'.format(key))
 
-    def split_entries(self) -> list:
+    def split_into(self, other: 'Node'):
         """Split the entries in half.
 
-        Keep the lower part in the node and return the upper one.
+        Keep the lower part in the node and move the upper one to an empty
+        node.
         """
-        len_entries = len(self.entries)
-        rv = self.entries[len_entries//2:]
-        self.entries = self.entries[:len_entries//2]
-        assert len(self.entries) + len(rv) == len_entries
-        return rv
+        assert not other.num_children
+        split_index = self._split_index()
+        for name in ('_keys', '_raw_keys') + self._columns:
+            column = getattr(self, name)
+            if column is None:
+                # Keys not deserialized yet
+                setattr(other, name, None)
+                continue
+            setattr(other, name, column[split_index:])
+            setattr(self, name, column[:split_index])
+
+    def _split_index(self) -> int:
+        """Find where to split entries in two halves of similar sizes.
+
+        Sizes are in bytes, entries do not all have the same length. The
+        halves are balanced on the size of entries with their full keys as
+        each half gets its own key prefix.
+        """
+        lengths = [SLOT_BYTES + length for length in self._entry_lengths()]
+        total_length = sum(lengths)
+        split_index = 1
+        smallest_difference = None
+        lower_length = 0
+        for i in range(1, len(lengths)):
+            lower_length += lengths[i - 1]
+            difference = abs(total_length - 2 * lower_length)
+            if (smallest_difference is None or
+                    difference < smallest_difference):
+                smallest_difference = difference
+                split_index = i
+        return split_index
 
     @classmethod
     def from_page_data(cls, tree_conf: TreeConf, data: bytes,
@@ -175,35 +426,137 @@ class Node(metaclass=abc.ABCMeta):
             return InternalNode(tree_conf, data, page)
         elif node_type_int == 4:
             return LeafNode(tree_conf, data, page)
-        elif node_type_int == 5:
-            return OverflowNode(tree_conf, data, page)
         elif node_type_int == 6:
             return FreelistNode(tree_conf, data, page)
+        elif node_type_int == 7:
+            return DedupNode(tree_conf, data, page)
         else:
             assert False, 'No Node with type {} exists'.format(node_type_int)
 
     def __repr__(self):
         return '<{}: page={} entries={}>'.format(
-            self.__class__.__name__, self.page, len(self.entries)
+            self.__class__.__name__, self.page, len(self._raw_keys)
         )
 
     def __eq__(self, other):
+        # Entries are equal when their keys are
         return (
             self.__class__ is other.__class__ and
             self.page == other.page and
-            self.entries == other.entries
+            self._raw_keys == other._raw_keys
         )
 
 
-class RecordNode(Node):
+class EntryNode(Node, metaclass=abc.ABCMeta):
+    """Node holding entries, either records or references."""
+
+    __slots__ = []
+
+    @abc.abstractmethod
+    def _load_entry(self, data: bytes, start: int, end: int,
+                    key_prefix: bytes):
+        """Append the entry serialized between two offsets of the page."""
+
+    @abc.abstractmethod
+    def _dump_entry(self, i: int, prefix_length: int) -> bytes:
+        """Serialize an entry, leaving out the prefix of its key."""
+
+    @abc.abstractmethod
+    def _entry_lengths(self) -> list:
+        """Size in bytes of the serialized entries with their full key."""
+
+    @abc.abstractmethod
+    def _entry(self, i: int) -> Entry:
+        """Create the object of an entry."""
+
+    @abc.abstractmethod
+    def _insert_fields(self, i: int, entry: Entry):
+        """Insert the fields of an entry other than its key in the columns."""
+
+
+class RecordNode(EntryNode):
+    """Node holding records.
+
+    The value of a record is in `values`, or None when it overflows, in
+    which case the first page of its overflow is in `overflow_pages`, or 0.
+    """
+
+    __slots__ = ['_entry_class', 'values', 'overflow_pages']
 
-    __slots__ = ['_entry_class']
+    _columns = ('values', 'overflow_pages')
+    holds_records = True
 
     def __init__(self, tree_conf: TreeConf, data: Optional[bytes]=None,
                  page: int=None, parent: 'Node'=None, next_page: int=None):
         self._entry_class = Record
+        self.values = list()
+        self.overflow_pages = array('Q')
         super().__init__(tree_conf, data, page, parent, next_page)
 
+    def _load_entry(self, data: bytes, start: int, end: int,
+                    key_prefix: bytes):
+        end_used_key_length = start + USED_KEY_LENGTH_BYTES
+        used_key_length = int.from_bytes(data[start:end_used_key_length],
+                                         ENDIAN)
+        end_key = end_used_key_length + used_key_length
+        self._add_key(bytes(data[end_used_key_length:end_key]), key_prefix)
+
+        end_used_value_length = end_key + USED_VALUE_LENGTH_BYTES
+        used_value_length = int.from_bytes(
+            data[end_key:end_used_value_length], ENDIAN
+        )
+        assert 0 <= used_value_length <= self._tree_conf.value_size
+        end_value = end_used_value_length + used_value_length
+        assert end_value + self._tree_conf.page_reference_bytes == end
+
+        overflow_page = int.from_bytes(data[end_value:end], ENDIAN)
+        if overflow_page:
+            self.values.append(None)
+        else:
+            self.values.append(bytes(data[end_used_value_length:end_value]))
+        self.overflow_pages.append(overflow_page)
+
+    def _dump_entry(self, i: int, prefix_length: int) -> bytes:
+        overflow_page = self.overflow_pages[i]
+        value = b'' if overflow_page else self.values[i]
+        return (
+            self._dump_key(i, prefix_length) +
+            len(value).to_bytes(USED_VALUE_LENGTH_BYTES, ENDIAN) +
+            value +
+            overflow_page.to_bytes(self._tree_conf.page_reference_bytes,
+                                   ENDIAN)
+        )
+
+    def _entry_lengths(self) -> list:
+        fixed_length = (USED_KEY_LENGTH_BYTES + USED_VALUE_LENGTH_BYTES +
+                        self._tree_conf.page_reference_bytes)
+        return [
+            fixed_length + len(raw_key) + (0 if value is None else len(value))
+            for raw_key, value in zip(self._raw_keys, self.values)
+        ]
+
+    def _entry(self, i: int) -> Record:
+        return Record(self._tree_conf, self._key(i), value=self.values[i],
+                      overflow_page=self.overflow_pages[i] or None)
+
+    def _insert_fields(self, i: int, entry: Record):
+        assert entry.value is None or entry.overflow_page is None
+        self.values.insert(i, entry.value)
+        self.overflow_pages.insert(i, entry.overflow_page or 0)
+
+    def replace_value(self, key, value: Optional[bytes],
+                      overflow_page: Optional[int]):
+        """Change the value of the record with the key."""
+        assert value is None or overflow_page is None
+        i = self._find_entry_index(key)
+        self.values[i] = value
+        self.overflow_pages[i] = overflow_page or 0
+
+    def footprint(self) -> int:
+        return super().footprint() + sum(
+            sys.getsizeof(value) for value in self.values if value is not None
+        )
+
 
 class LonelyRootNode(RecordNode):
     """A Root node that holds records.
@@ -217,12 +570,12 @@ class LonelyRootNode(RecordNode):
                  page: int=None, parent: 'Node'=None):
         self._node_type_int = 1
         self.min_children = 0
-        self.max_children = tree_conf.order - 1
+        self.max_children = tree_conf.order - 1 if tree_conf.order else None
         super().__init__(tree_conf, data, page, parent)
 
     def convert_to_leaf(self):
         leaf = LeafNode(self._tree_conf, page=self.page)
-        leaf.entries = self.entries
+        leaf._take_entries(self)
         return leaf
 
 
@@ -234,40 +587,102 @@ class LeafNode(RecordNode):
     def __init__(self, tree_conf: TreeConf, data: Optional[bytes]=None,
                  page: int=None, parent: 'Node'=None, next_page: int=None):
         self._node_type_int = 4
-        self.min_children = math.ceil(tree_conf.order / 2) - 1
-        self.max_children = tree_conf.order - 1
+        if tree_conf.order:
+            self.min_children = math.ceil(tree_conf.order / 2) - 1
+            self.max_children = tree_conf.order - 1
+        else:
+            self.min_children = 0
+            self.max_children = None
         super().__init__(tree_conf, data, page, parent, next_page)
 
 
-class ReferenceNode(Node):
+class ReferenceNode(EntryNode):
+    """Node holding references to other nodes.
+
+    The pages before and after each key are in `befores` and `afters`, the
+    page after a key is the one before the next key.
+    """
+
+    __slots__ = ['_entry_class', 'befores', 'afters']
 
-    __slots__ = ['_entry_class']
+    _columns = ('befores', 'afters')
 
     def __init__(self, tree_conf: TreeConf, data: Optional[bytes]=None,
                  page: int=None, parent: 'Node'=None):
         self._entry_class = Reference
+        self.befores = array('Q')
+        self.afters = array('Q')
         super().__init__(tree_conf, data, page, parent)
 
+    def _load_entry(self, data: bytes, start: int, end: int,
+                    key_prefix: bytes):
+        page_reference_bytes = self._tree_conf.page_reference_bytes
+        end_before = start + page_reference_bytes
+        self.befores.append(int.from_bytes(data[start:end_before], ENDIAN))
+
+        end_used_key_length = end_before + USED_KEY_LENGTH_BYTES
+        used_key_length = int.from_bytes(
+            data[end_before:end_used_key_length], ENDIAN
+        )
+        end_key = end_used_key_length + used_key_length
+        self._add_key(bytes(data[end_used_key_length:end_key]), key_prefix)
+
+        assert end_key + page_reference_bytes == end
+        self.afters.append(int.from_bytes(data[end_key:end], ENDIAN))
+
+    def _dump_entry(self, i: int, prefix_length: int) -> bytes:
+        page_reference_bytes = self._tree_conf.page_reference_bytes
+        return (
+            self.befores[i].to_bytes(page_reference_bytes, ENDIAN) +
+            self._dump_key(i, prefix_length) +
+            self.afters[i].to_bytes(page_reference_bytes, ENDIAN)
+        )
+
+    def _entry_lengths(self) -> list:
+        fixed_length = (USED_KEY_LENGTH_BYTES +
+                        2 * self._tree_conf.page_reference_bytes)
+        return [fixed_length + len(raw_key) for raw_key in self._raw_keys]
+
+    def _entry(self, i: int) -> Reference:
+        return Reference(self._tree_conf, self._key(i), self.befores[i],
+                         self.afters[i])
+
+    def _insert_fields(self, i: int, entry: Reference):
+        self.befores.insert(i, entry.before)
+        self.afters.insert(i, entry.after)
+
     @property
     def num_children(self) -> int:
-        return len(self.entries) + 1 if self.entries else 0
+        return len(self._raw_keys) + 1 if self._raw_keys else 0
 
-    def insert_entry(self, entry: 'Reference'):
-        """Make sure that after of a reference matches before of the next one.
+    @property
+    def child_pages(self) -> list:
+        """Pages of the nodes connected to this one, in order."""
+        if not self._raw_keys:
+            return []
+        return [self.befores[0]] + list(self.afters)
+
+    def child_page(self, key) -> int:
+        """Page of the child node that may hold the key."""
+        i = self.bisect_right(key)
+        if i == 0:
+            return self.befores[0]
+        return self.afters[i - 1]
+
+    def _split_index(self) -> int:
+        # The smallest entry of the upper half gets moved to the parent, the
+        # upper half must keep at least one entry after that
+        return min(super()._split_index(), len(self._raw_keys) - 2)
 
-        Probably very inefficient approach.
-        """
-        super().insert_entry(entry)
-        i = self.entries.index(entry)
+    def insert_entry(self, entry: 'Reference'):
+        """Make sure that after of a reference matches before of the next
+        one."""
+        i = self.bisect_right(entry.key)
+        self._insert_entry(i, entry)
         if i > 0:
-            previous_entry = self.entries[i-1]
-            previous_entry.after = entry.before
-        try:
-            next_entry = self.entries[i+1]
-        except IndexError:
-            pass
-        else:
-            next_entry.before = entry.after
+            self.afters[i - 1] = entry.before
+        if i + 1 < len(self._raw_keys):
+            self.befores[i + 1] = entry.after
 
 
 class RootNode(ReferenceNode):
@@ -284,7 +699,7 @@ class RootNode(ReferenceNode):
 
     def convert_to_internal(self):
         internal = InternalNode(self._tree_conf, page=self.page)
-        internal.entries = self.entries
+        internal._take_entries(self)
         return internal
 
 
@@ -296,39 +711,258 @@ class InternalNode(ReferenceNode):
     def __init__(self, tree_conf: TreeConf, data: Optional[bytes]=None,
                  page: int=None, parent: 'Node'=None):
         self._node_type_int = 3
-        self.min_children = math.ceil(tree_conf.order / 2)
+        if tree_conf.order:
+            self.min_children = math.ceil(tree_conf.order / 2)
+        else:
+            self.min_children = 2
         self.max_children = tree_conf.order
         super().__init__(tree_conf, data, page, parent)
 
 
-class OverflowNode(Node):
-    """Node that holds a single Record value too large for its Node."""
+class FreelistNode(Node):
+    """Node that is a marker for deallocated contiguous pages.
+
+    The marker is written in the first page, the other ones are left as is.
+    """
 
     def __init__(self, tree_conf: TreeConf, data: Optional[bytes]=None,
-                 page: int=None, next_page: int=None):
-        self._node_type_int = 5
-        self.max_children = 1
-        self.min_children = 1
-        self._entry_class = OpaqueData
+                 page: int=None, next_page: int=None, num_pages: int=1):
+        self._node_type_int = 6
+        self.max_children = 0
+        self.min_children = 0
+        self.num_pages = num_pages
         super().__init__(tree_conf, data, page, next_page=next_page)
 
+    def load(self, data: bytes):
+        super().load(data)
+        page_reference_bytes = self._tree_conf.page_reference_bytes
+        start = NODE_TYPE_BYTES + USED_PAGE_LENGTH_BYTES + page_reference_bytes
+        self.num_pages = int.from_bytes(
+            data[start:start+page_reference_bytes], ENDIAN
+        )
+
+    def _dump_payload(self) -> bytearray:
+        return bytearray(self.num_pages.to_bytes(
+            self._tree_conf.page_reference_bytes, ENDIAN
+        ))
+
     def __repr__(self):
-        return '<{}: page={} next_page={}>'.format(
-            self.__class__.__name__, self.page, self.next_page
+        return '<{}: page={} next_page={} num_pages={}>'.format(
+            self.__class__.__name__, self.page, self.next_page, self.num_pages
         )
 
+    def __eq__(self, other):
+        return super().__eq__(other) and self.num_pages == other.num_pages
 
-class FreelistNode(Node):
-    """Node that is a marker for a deallocated page."""
+
+class DedupNode(Node):
+    """Node indexing the extents shared by records holding the same value.
+
+    Extents are identified by the digest of the value they hold and carry the
+    number of records referencing them.
+    """
+
+    __slots__ = ['_node_type_int', 'min_children', 'max_children', 'extents']
 
     def __init__(self, tree_conf: TreeConf, data: Optional[bytes]=None,
                  page: int=None, next_page: int=None):
-        self._node_type_int = 6
-        self.max_children = 0
+        self._node_type_int = 7
         self.min_children = 0
+        self.max_children = (
+            (tree_conf.page_size - 4 - tree_conf.page_reference_bytes) //
+            self.entry_length(tree_conf)
+        )
+        # Digest -> (first page of the extent, number of references)
+        self.extents = dict()
         super().__init__(tree_conf, data, page, next_page=next_page)
 
+    def load(self, data: bytes):
+        super().load(data)
+        end_used_page_length = NODE_TYPE_BYTES + USED_PAGE_LENGTH_BYTES
+        used_page_length = int.from_bytes(
+            data[NODE_TYPE_BYTES:end_used_page_length], ENDIAN
+        )
+        page_reference_bytes = self._tree_conf.page_reference_bytes
+        end_header = end_used_page_length + page_reference_bytes
+        for start in range(end_header, used_page_length,
+                           self.entry_length(self._tree_conf)):
+            end_digest = start + DIGEST_BYTES
+            end_page = end_digest + page_reference_bytes
+            end_references = end_page + OTHERS_BYTES
+            digest = bytes(data[start:end_digest])
+            self.extents[digest] = (
+                int.from_bytes(data[end_digest:end_page], ENDIAN),
+                int.from_bytes(data[end_page:end_references], ENDIAN)
+            )
+
+    def _dump_payload(self) -> bytearray:
+        data = bytearray()
+        for digest, (page, references) in self.extents.items():
+            data.extend(digest)
+            data.extend(page.to_bytes(self._tree_conf.page_reference_bytes,
+                                      ENDIAN))
+            data.extend(references.to_bytes(OTHERS_BYTES, ENDIAN))
+        return data
+
+    @staticmethod
+    def entry_length(tree_conf: TreeConf) -> int:
+        """Size in bytes of an entry of the index."""
+        # The digest of a shared value, the first page of the extent holding
+        # it and the number of records referencing it
+        return DIGEST_BYTES + tree_conf.page_reference_bytes + OTHERS_BYTES
+
+    @property
+    def is_full(self) -> bool:
+        return len(self.extents) >= self.max_children
+
+    def __repr__(self):
+        return '<{}: page={} next_page={} extents={}>'.format(
+            self.__class__.__name__, self.page, self.next_page,
+            len(self.extents)
+        )
+
+    def __eq__(self, other):
+        return super().__eq__(other) and self.extents == other.extents
+
+
+class NodePage:
+    """Read-only view on the page of a node holding entries.
+
+    A lookup binary searches the slots of the page and only deserializes
+    the keys it probes, none with a byte comparable serializer, instead of
+    loading every entry of a Node. The Node
+    is built with `to_node` when it is needed as a whole, to be modified or
+    scanned.
+    """
+
+    __slots__ = ['_tree_conf', '_data', 'page', '_node_type_int',
+                 '_used_page_length', '_start_slots', 'num_slots',
+                 '_key_prefix']
+
+    def __init__(self, tree_conf: TreeConf, data: bytes, page: int):
+        assert len(data) == tree_conf.page_size
+        self._tree_conf = tree_conf
+        self._data = data
+        self.page = page
+        self._node_type_int = int.from_bytes(data[0:NODE_TYPE_BYTES], ENDIAN)
+        assert self._node_type_int in (1, 2, 3, 4)
+
+        end_used_page_length = NODE_TYPE_BYTES + USED_PAGE_LENGTH_BYTES
+        self._used_page_length = int.from_bytes(
+            data[NODE_TYPE_BYTES:end_used_page_length], ENDIAN
+        )
+        end_header = end_used_page_length + tree_conf.page_reference_bytes
+        end_num_slots = end_header + SLOT_BYTES
+        self.num_slots = int.from_bytes(data[end_header:end_num_slots],
+                                        ENDIAN)
+        end_prefix_length = end_num_slots + USED_KEY_LENGTH_BYTES
+        prefix_length = int.from_bytes(
+            data[end_num_slots:end_prefix_length], ENDIAN
+        )
+        self._start_slots = end_prefix_length + prefix_length
+        self._key_prefix = data[end_prefix_length:self._start_slots]
+
+    @property
+    def holds_records(self) -> bool:
+        # Lonely root and leaf nodes
+        return self._node_type_int in (1, 4)
+
+    @property
+    def is_leaf(self) -> bool:
+        return self._node_type_int == 4
+
+    def _entry_bounds(self, i: int) -> tuple:
+        start_slot = self._start_slots + i * SLOT_BYTES
+        start = int.from_bytes(
+            self._data[start_slot:start_slot+SLOT_BYTES], ENDIAN
+        )
+        if i + 1 == self.num_slots:
+            return start, self._used_page_length
+        end = int.from_bytes(
+            self._data[start_slot+SLOT_BYTES:start_slot+2*SLOT_BYTES], ENDIAN
+        )
+        return start, end
+
+    def _key(self, i: int, raw: bool):
+        """Key of an entry, serialized or deserialized."""
+        start, _ = self._entry_bounds(i)
+        if not self.holds_records:
+            start += self._tree_conf.page_reference_bytes
+        end_used_key_length = start + USED_KEY_LENGTH_BYTES
+        used_key_length = int.from_bytes(
+            self._data[start:end_used_key_length], ENDIAN
+        )
+        end_key = end_used_key_length + used_key_length
+        raw_key = self._key_prefix + self._data[end_used_key_length:end_key]
+        if raw:
+            return raw_key
+        return self._tree_conf.serializer.deserialize(raw_key)
+
+    def _search_key(self, key) -> tuple:
+        """Key to compare to the ones of entries and whether it is raw."""
+        raw_key = serialize_search_key(self._tree_conf, key)
+        if raw_key is None:
+            return key, False
+        return raw_key, True
+
+    def _bisect(self, search_key, raw: bool, right: bool) -> int:
+        low, high = 0, self.num_slots
+        while low < high:
+            middle = (low + high) // 2
+            middle_key = self._key(middle, raw)
+            if middle_key < search_key or (right and
+                                           middle_key == search_key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def child_page(self, key) -> int:
+        """Page of the child node that may hold the key."""
+        assert not self.holds_records and self.num_slots
+        page_reference_bytes = self._tree_conf.page_reference_bytes
+        i = self._bisect(*self._search_key(key), right=True)
+        if i == 0:
+            start, _ = self._entry_bounds(0)
+            return int.from_bytes(
+                self._data[start:start+page_reference_bytes], ENDIAN
+            )
+        _, end = self._entry_bounds(i - 1)
+        return int.from_bytes(self._data[end-page_reference_bytes:end],
+                              ENDIAN)
+
+    def get_entry(self, key) -> Record:
+        """Get the record of a key, like `Node.get_entry`."""
+        assert self.holds_records
+        search_key, raw = self._search_key(key)
+        i = self._bisect(search_key, raw, right=False)
+        if i != self.num_slots and self._key(i, raw) == search_key:
+            return self._record(i, key)
+        raise ValueError('No entry for key {}'.format(key))
+
+    def _record(self, i: int, key) -> Record:
+        """Create the record of an entry from its known key."""
+        start, end = self._entry_bounds(i)
+        used_key_length = int.from_bytes(
+            self._data[start:start+USED_KEY_LENGTH_BYTES], ENDIAN
+        )
+        start_value = (start + USED_KEY_LENGTH_BYTES + used_key_length +
+                       USED_VALUE_LENGTH_BYTES)
+        end_value = end - self._tree_conf.page_reference_bytes
+        overflow_page = int.from_bytes(self._data[end_value:end], ENDIAN)
+        if overflow_page:
+            return Record(self._tree_conf, key, overflow_page=overflow_page)
+        return Record(self._tree_conf, key,
+                      value=self._data[start_value:end_value])
+
+    def to_node(self) -> Node:
+        return Node.from_page_data(self._tree_conf, self._data, self.page)
+
+    def footprint(self) -> int:
+        """Estimate the memory used by the view and its page, in bytes."""
+        return sys.getsizeof(self) + sys.getsizeof(self._data)
+
     def __repr__(self):
-        return '<{}: page={} next_page={}>'.format(
-            self.__class__.__name__, self.page, self.next_page
+        return '<{}: page={} entries={}>'.format(
+            self.__class__.__name__, self.page, self.num_slots
         )
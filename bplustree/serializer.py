@@ -1,5 +1,7 @@
 import abc
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+import math
+import struct
 from uuid import UUID
 
 try:
@@ -10,10 +12,17 @@ except ImportError:
 from .const import ENDIAN
 
 
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
 class Serializer(metaclass=abc.ABCMeta):
 
     __slots__ = []
 
+    # Whether serialized keys compare like the keys themselves, nodes then
+    # search and sort keys without deserializing them
+    byte_comparable = False
+
     @abc.abstractmethod
     def serialize(self, obj: object, key_size: int) -> bytes:
         """Serialize a key to bytes."""
@@ -22,6 +31,17 @@ class Serializer(metaclass=abc.ABCMeta):
     def deserialize(self, data: bytes) -> object:
         """Create a key object from bytes."""
 
+    def shortest_separator(self, lower: object, upper: object) -> object:
+        """Find the shortest key separating two consecutive keys.
+
+        The separator is bigger than `lower` and smaller than or equal to
+        `upper`. Internal nodes store separators instead of actual keys, the
+        shorter they are the more of them fit in a page.
+
+        By default keys are not truncated.
+        """
+        return upper
+
     def __repr__(self):
         return '{}()'.format(self.__class__.__name__)
 
@@ -41,6 +61,9 @@ class StrSerializer(Serializer):
 
     __slots__ = []
 
+    # UTF-8 keeps the order of code points
+    byte_comparable = True
+
     def serialize(self, obj: str, key_size: int) -> bytes:
         rv = obj.encode(encoding='utf-8')
         assert len(rv) <= key_size
@@ -49,11 +72,21 @@ class StrSerializer(Serializer):
     def deserialize(self, data: bytes) -> str:
         return data.decode(encoding='utf-8')
 
+    def shortest_separator(self, lower: str, upper: str) -> str:
+        # Strings compare character by character, only the characters up to
+        # the first one that differs are needed
+        for i, (lower_char, upper_char) in enumerate(zip(lower, upper)):
+            if lower_char != upper_char:
+                return upper[:i + 1]
+        return upper[:len(lower) + 1]
+
 
 class UUIDSerializer(Serializer):
 
     __slots__ = []
 
+    byte_comparable = True
+
     def serialize(self, obj: UUID, key_size: int) -> bytes:
         return obj.bytes
 
@@ -80,3 +113,80 @@ class DatetimeUTCSerializer(Serializer):
         rv = temporenc.unpackb(data).datetime()
         rv = rv.replace(tzinfo=timezone.utc)
         return rv
+
+
+def _flip_sign(value: int, length: int) -> int:
+    """Map a signed integer to an unsigned one in the same order."""
+    return value + (1 << (8 * length - 1))
+
+
+class OrderedIntSerializer(Serializer):
+    """Serialize signed integers to big-endian bytes that sort like them."""
+
+    __slots__ = []
+
+    byte_comparable = True
+
+    def serialize(self, obj: int, key_size: int) -> bytes:
+        return _flip_sign(obj, key_size).to_bytes(key_size, 'big')
+
+    def deserialize(self, data: bytes) -> int:
+        return int.from_bytes(data, 'big') - _flip_sign(0, len(data))
+
+
+class FloatSerializer(Serializer):
+    """Serialize floats to 8 bytes that sort like them.
+
+    Positive floats get their sign bit set, negative ones get all their bits
+    inverted. NaN cannot be a key.
+    """
+
+    __slots__ = []
+
+    byte_comparable = True
+
+    def serialize(self, obj: float, key_size: int) -> bytes:
+        assert key_size >= 8
+        if math.isnan(obj):
+            raise ValueError('NaN cannot be used as a key')
+        # -0.0 and 0.0 are the same key
+        bits = int.from_bytes(struct.pack('>d', obj + 0.0), 'big')
+        if bits >> 63:
+            bits ^= (1 << 64) - 1
+        else:
+            bits |= 1 << 63
+        return bits.to_bytes(8, 'big')
+
+    def deserialize(self, data: bytes) -> float:
+        bits = int.from_bytes(data, 'big')
+        if bits >> 63:
+            bits &= (1 << 63) - 1
+        else:
+            bits ^= (1 << 64) - 1
+        return struct.unpack('>d', bits.to_bytes(8, 'big'))[0]
+
+
+class DatetimeMicrosSerializer(Serializer):
+    """Serialize datetimes to 8 bytes that sort like them.
+
+    Datetimes are stored as the number of microseconds since the epoch, they
+    must be timezone aware and come back in UTC.
+    """
+
+    __slots__ = []
+
+    byte_comparable = True
+
+    def serialize(self, obj: datetime, key_size: int) -> bytes:
+        assert key_size >= 8
+        if obj.tzinfo is None:
+            raise ValueError('DatetimeMicrosSerializer needs a timezone aware '
+                             'datetime')
+        delta = obj - EPOCH
+        micros = ((delta.days * 86400 + delta.seconds) * 1000000 +
+                  delta.microseconds)
+        return _flip_sign(micros, 8).to_bytes(8, 'big')
+
+    def deserialize(self, data: bytes) -> datetime:
+        micros = int.from_bytes(data, 'big') - _flip_sign(0, 8)
+        return EPOCH + timedelta(microseconds=micros)
@@ -1,13 +1,23 @@
 from functools import partial
+import hashlib
+import io
+import itertools
 from logging import getLogger
-from typing import Optional, Union, Iterator, Iterable
+import os
+import time
+from typing import Optional, Union, Iterator, Iterable, Callable
 
 from . import utils
-from .const import TreeConf
-from .entry import Record, Reference, OpaqueData
-from .memory import FileMemory
+from .codec import ValueCodec
+from .compression import check_compression
+from .const import (TreeConf, SLOT_BYTES, PAGE_REFERENCE_BYTES,
+                    PAGE_REFERENCE_WIDTHS, DEFAULT_BUFFER_POOL_SIZE,
+                    VACUUM_CATCH_UP_PASSES)
+from .entry import Record, Reference
+from .memory import FileMemory, VolatileMemory, Readahead, MetadataNotSet
 from .node import (
-    Node, LonelyRootNode, RootNode, InternalNode, LeafNode, OverflowNode
+    Node, LonelyRootNode, RootNode, InternalNode, LeafNode,
+    SLOTTED_HEADER_BYTES
 )
 from .serializer import Serializer, IntSerializer
 
@@ -17,33 +27,79 @@ logger = getLogger(__name__)
 
 class BPlusTree:
 
-    __slots__ = ['_filename', '_tree_conf', '_mem', '_root_node_page',
-                 '_is_open', 'LonelyRootNode', 'RootNode', 'InternalNode',
-                 'LeafNode', 'OverflowNode', 'Record', 'Reference']
+    __slots__ = ['_filename', '_tree_conf', '_mem', '_is_open', '_dedup',
+                 '_codec', '_readahead', '_changed_keys',
+                 'LonelyRootNode', 'RootNode', 'InternalNode', 'LeafNode',
+                 'Record', 'Reference']
 
     # ######################### Public API ################################
 
-    def __init__(self, filename: str, page_size: int= 4096, order: int=100,
+    def __init__(self, filename: str, page_size: int= 4096,
+                 order: Optional[int]=None,
                  key_size: int=8, value_size: int=32, cache_size: int=64,
-                 serializer: Optional[Serializer]=None):
+                 serializer: Optional[Serializer]=None, readonly: bool=False,
+                 compression: Optional[str]=None, dedup: bool=False,
+                 codec: Optional[ValueCodec]=None,
+                 page_reference_bytes: int=PAGE_REFERENCE_BYTES,
+                 readahead: int=0, direct_io: bool=False,
+                 buffer_pool_size: int=DEFAULT_BUFFER_POOL_SIZE,
+                 cache_policy: Union[str, Callable]='lru',
+                 pin_internal_nodes: bool=False,
+                 cache_bytes: Optional[int]=None, warm_cache: bool=False):
+        check_compression(compression)
+        if page_reference_bytes not in PAGE_REFERENCE_WIDTHS:
+            raise ValueError('Page references must be {} bytes wide'.format(
+                ', '.join(str(w) for w in PAGE_REFERENCE_WIDTHS)
+            ))
         self._filename = filename
+        self._dedup = dedup
+        self._codec = codec
+        self._readahead = readahead
+        # Keys written while a vacuum is copying the tree, None otherwise
+        self._changed_keys = None
         self._tree_conf = TreeConf(
             page_size, order, key_size, value_size,
-            serializer or IntSerializer()
+            serializer or IntSerializer(), compression, page_reference_bytes
         )
         self._create_partials()
-        self._mem = FileMemory(filename, self._tree_conf,
-                               cache_size=cache_size)
+        self._check_page_size()
+        if filename == ':memory:':
+            self._mem = VolatileMemory(
+                self._tree_conf, cache_size=cache_size,
+                cache_policy=cache_policy,
+                pin_internal_nodes=pin_internal_nodes,
+                cache_bytes=cache_bytes
+            )
+        else:
+            self._mem = FileMemory(
+                filename, self._tree_conf, cache_size=cache_size,
+                readonly=readonly,
+                buffer_pool_size=buffer_pool_size if direct_io else None,
+                cache_policy=cache_policy,
+                pin_internal_nodes=pin_internal_nodes,
+                cache_bytes=cache_bytes, warm_cache=warm_cache
+            )
         try:
             metadata = self._mem.get_metadata()
-        except ValueError:
+        except MetadataNotSet:
+            if readonly:
+                self._mem.close()
+                raise
             self._initialize_empty_tree()
+        except Exception:
+            # Release the file and its lock, the tree cannot be opened
+            self._mem.close()
+            raise
         else:
-            self._root_node_page, self._tree_conf = metadata
+            # Nodes follow the format recorded in the file
+            _, self._tree_conf = metadata
+            self._create_partials()
+            if warm_cache:
+                self._mem.warm_cache()
         self._is_open = True
 
     def close(self):
-        with self._mem.write_transaction:
+        with self._mem.exclusive_lock:
             if not self._is_open:
                 logger.info('Tree is already closed')
                 return
@@ -61,59 +117,156 @@ class BPlusTree:
         with self._mem.write_transaction:
             self._mem.perform_checkpoint(reopen_wal=True)
 
+    def resize_cache(self, size: Optional[int]):
+        """Shrink the cache of nodes, to give memory back under pressure.
+
+        The size is in bytes if the tree was created with `cache_bytes`, in
+        nodes otherwise. Nodes are evicted until the cache fits, and it stays
+        that small until resized again. The cache never grows beyond the size
+        it was created with, None restores it.
+        """
+        self._mem.resize_cache(size)
+
+    def vacuum(self, batch_size: int=1000, pause: float=0.0):
+        """Rewrite the tree densely and give its free pages back.
+
+        Records are copied in key order to a new tree, built like with
+        `batch_insert`, that then takes the place of the current one. Its
+        leaves are contiguous and its file has no free pages.
+
+        Records are copied by batches, each in its own read transaction and
+        followed by a pause of `pause` seconds, so the tree keeps serving
+        readers and writers meanwhile. Records written during the copy are
+        copied again, a few times while writers keep going, then a last time
+        while holding the lock.
+        """
+        if self._mem.readonly:
+            raise io.UnsupportedOperation(
+                'Cannot vacuum {} opened in read-only mode'.format(self)
+            )
+
+        with self._mem.read_transaction:
+            self._changed_keys = set()
+        try:
+            new_tree = self._copy_to_new_tree(batch_size, pause)
+            try:
+                for _ in range(VACUUM_CATCH_UP_PASSES):
+                    if not self._copy_changes(new_tree, batch_size, pause):
+                        break
+                with self._mem.exclusive_lock:
+                    self._copy_changes(new_tree, batch_size, 0)
+                    self._mem.replace_storage(new_tree._mem)
+            except BaseException:
+                self._discard_tree(new_tree)
+                raise
+        finally:
+            self._changed_keys = None
+
     def insert(self, key, value: bytes, replace=False):
         """Insert a value in the tree.
 
         :param key: The key at which the value will be recorded, must be of the
                     same type used by the Serializer
-        :param value: The value to record in bytes
+        :param value: The value to record in bytes, or any object the codec
+                      of the tree can encode
         :param replace: If True, already existing value will be overridden,
                         otherwise a ValueError is raised.
         """
+        if self._codec is not None:
+            value = self._codec.encode(value)
         if not isinstance(value, bytes):
             ValueError('Values must be bytes objects')
 
         with self._mem.write_transaction:
-            node = self._search_in_tree(key, self._root_node)
+            self._insert(key, partial(self._store_value, value), replace)
+
+    def insert_stream(self, key, fileobj, length: Optional[int]=None,
+                      replace=False):
+        """Insert a value read from a binary file object.
+
+        The file is read in chunks that are written to overflow pages as they
+        come, so memory use does not depend on the size of the value. All
+        writes happen in a single transaction. The data is stored as is, it
+        must already be encoded when the tree has a codec.
+
+        :param key: The key at which the value will be recorded
+        :param fileobj: File object opened in binary mode to read the value
+                        from
+        :param length: If given, exactly this amount of bytes is read,
+                       otherwise the file is read until its end
+        :param replace: If True, already existing value will be overridden,
+                        otherwise a ValueError is raised.
+        """
+        with self._mem.write_transaction:
+            self._insert(key, partial(self._store_stream, fileobj, length),
+                         replace)
 
-            # Check if a record with the key already exists
-            try:
-                existing_record = node.get_entry(key)
-            except ValueError:
-                pass
-            else:
-                if not replace:
-                    raise ValueError('Key {} already exists'.format(key))
-
-                if existing_record.overflow_page:
-                    self._delete_overflow(existing_record.overflow_page)
-
-                if len(value) <= self._tree_conf.value_size:
-                    existing_record.value = value
-                    existing_record.overflow_page = None
-                else:
-                    existing_record.value = None
-                    existing_record.overflow_page = self._create_overflow(
-                        value
-                    )
-                self._mem.set_node(node)
-                return
+    def _insert(self, key, store_value, replace: bool):
+        """Insert a record in the tree.
 
-            if len(value) <= self._tree_conf.value_size:
-                record = self.Record(key, value=value)
+        `store_value` is called once the record is known to be insertable, it
+        returns the value and the overflow page of the record.
+        """
+        if self._changed_keys is not None:
+            self._changed_keys.add(key)
+        node = self._search_in_tree(key, self._root_node)
+
+        # Check if a record with the key already exists
+        try:
+            existing_record = node.get_entry(key)
+        except ValueError:
+            pass
+        else:
+            if not replace:
+                raise ValueError('Key {} already exists'.format(key))
+
+            if existing_record.overflow_page:
+                self._delete_overflow(existing_record.overflow_page)
+
+            node.replace_value(key, *store_value())
+
+            # A bigger value may not fit in the page anymore
+            if node.needs_split:
+                self._split_leaf(node)
             else:
-                # Record values exceeding the max value_size must be placed
-                # into overflow pages
-                first_overflow_page = self._create_overflow(value)
-                record = self.Record(key, value=None,
-                                     overflow_page=first_overflow_page)
-
-            if node.can_add_entry:
-                node.insert_entry(record)
                 self._mem.set_node(node)
-            else:
-                node.insert_entry(record)
-                self._split_leaf(node)
+            return
+
+        value, overflow_page = store_value()
+        record = self.Record(key, value=value, overflow_page=overflow_page)
+        node.insert_entry(record)
+        if node.needs_split:
+            self._split_leaf(node)
+        else:
+            self._mem.set_node(node)
+
+    def _store_value(self, value: bytes) -> tuple:
+        """Return the value and the overflow page of a record."""
+        if len(value) <= self._tree_conf.value_size:
+            return value, None
+
+        # Record values exceeding the max value_size must be placed
+        # into overflow pages
+        return None, self._create_overflow(value)
+
+    def _store_stream(self, fileobj, length: Optional[int]) -> tuple:
+        """Return the value and the overflow page of a record read from a file.
+
+        Only the beginning of the file is buffered to find out whether the
+        value fits in the record, the rest is streamed to overflow pages.
+        """
+        chunks = utils.read_chunks(fileobj, self._tree_conf.page_size, length)
+        head = bytearray()
+        for chunk in chunks:
+            head.extend(chunk)
+            if len(head) > self._tree_conf.value_size:
+                break
+        else:
+            return bytes(head), None
+
+        return None, self._create_overflow_from_chunks(
+            itertools.chain([bytes(head)], chunks), length
+        )
 
     def batch_insert(self, iterable: Iterable):
         """Insert many elements in the tree at once.
@@ -131,27 +284,20 @@ class BPlusTree:
                 if node is None:
                     node = self._search_in_tree(key, self._root_node)
 
-                try:
-                    biggest_entry = node.biggest_entry
-                except IndexError:
-                    biggest_entry = None
-                if biggest_entry and key <= biggest_entry.key:
+                if node.num_children and key <= node.biggest_key:
                     raise ValueError('Keys to batch insert must be sorted and '
                                      'bigger than keys currently in the tree')
 
-                if len(value) <= self._tree_conf.value_size:
-                    record = self.Record(key, value=value)
-                else:
-                    # Record values exceeding the max value_size must be placed
-                    # into overflow pages
-                    first_overflow_page = self._create_overflow(value)
-                    record = self.Record(key, value=None,
-                                         overflow_page=first_overflow_page)
-
-                if node.can_add_entry:
-                    node.insert_entry_at_the_end(record)
-                else:
-                    node.insert_entry_at_the_end(record)
+                if self._changed_keys is not None:
+                    self._changed_keys.add(key)
+                if self._codec is not None:
+                    value = self._codec.encode(value)
+                value, overflow_page = self._store_value(value)
+                record = self.Record(key, value=value,
+                                     overflow_page=overflow_page)
+
+                node.insert_entry_at_the_end(record)
+                if node.needs_split:
                     self._split_leaf(node)
                     node = None
 
@@ -160,15 +306,50 @@ class BPlusTree:
 
     def get(self, key, default=None) -> bytes:
         with self._mem.read_transaction:
-            node = self._search_in_tree(key, self._root_node)
             try:
-                record = node.get_entry(key)
+                record = self._get_record(key)
             except ValueError:
                 return default
             else:
-                rv = self._get_value_from_record(record)
-                assert isinstance(rv, bytes)
-                return rv
+                return self._get_value(record.value, record.overflow_page)
+
+    def get_view(self, key, default=None) -> memoryview:
+        """Get a read-only view on a value without copying it.
+
+        Values stored in the tree itself are viewed directly in their node.
+        Overflowing values are read in a single buffer, `open_value` can
+        read them progressively instead. Values are not decoded by the codec
+        of the tree.
+        """
+        with self._mem.read_transaction:
+            try:
+                record = self._get_record(key)
+            except ValueError:
+                return default
+
+            if record.value is not None:
+                return memoryview(record.value)
+            return memoryview(self._read_from_overflow(record.overflow_page))
+
+    def open_value(self, key) -> io.BufferedReader:
+        """Open a value as a read-only binary stream.
+
+        Overflowing values are read from their pages as the stream is read,
+        so that large values can be copied to files or sockets without being
+        entirely loaded in memory. The value must not be replaced while the
+        stream is in use. Values are not decoded by the codec of the tree.
+        """
+        with self._mem.read_transaction:
+            try:
+                record = self._get_record(key)
+            except ValueError:
+                raise KeyError(key)
+
+            if record.value is not None:
+                raw = io.BytesIO(record.value)
+            else:
+                raw = self._mem.open_extent(record.overflow_page)
+            return io.BufferedReader(raw)
 
     def __contains__(self, item):
         with self._mem.read_transaction:
@@ -186,8 +367,8 @@ class BPlusTree:
                 # as a method cannot return a sometimes a generator
                 # and sometimes a normal value
                 rv = dict()
-                for record in self._iter_slice(item):
-                    rv[record.key] = self._get_value_from_record(record)
+                for key, value, overflow_page in self._iter_slice(item):
+                    rv[key] = self._get_value(value, overflow_page)
                 return rv
 
             else:
@@ -201,7 +382,7 @@ class BPlusTree:
             node = self._left_record_node
             rv = 0
             while True:
-                rv += len(node.entries)
+                rv += node.num_children
                 if not node.next_page:
                     return rv
                 node = self._mem.get_node(node.next_page)
@@ -209,16 +390,21 @@ class BPlusTree:
     def __length_hint__(self):
         with self._mem.read_transaction:
             node = self._root_node
+            max_children = node.max_children
+            if max_children is None:
+                # Without order the capacity of nodes depends on the size of
+                # entries, assume that they are of maximal size
+                max_children = node.max_children_in_page
             if isinstance(node, LonelyRootNode):
                 # Assume that the lonely root node is half full
-                return node.max_children // 2
+                return max_children // 2
             # Assume that there are no holes in pages
             last_page = self._mem.last_page
             # Assume that 70% of nodes in a tree carry values
             num_leaf_nodes = int(last_page * 0.70)
             # Assume that every leaf node is half full
             num_records_per_leaf_node = int(
-                (node.max_children + node.min_children) / 2
+                (max_children + node.min_children) / 2
             )
             return num_leaf_nodes * num_records_per_leaf_node
 
@@ -226,8 +412,8 @@ class BPlusTree:
         if not slice_:
             slice_ = slice(None)
         with self._mem.read_transaction:
-            for record in self._iter_slice(slice_):
-                yield record.key
+            for key, _, _ in self._iter_slice(slice_):
+                yield key
 
     keys = __iter__
 
@@ -235,15 +421,15 @@ class BPlusTree:
         if not slice_:
             slice_ = slice(None)
         with self._mem.read_transaction:
-            for record in self._iter_slice(slice_):
-                yield record.key, self._get_value_from_record(record)
+            for key, value, overflow_page in self._iter_slice(slice_):
+                yield key, self._get_value(value, overflow_page)
 
     def values(self, slice_: Optional[slice]=None) -> Iterator[bytes]:
         if not slice_:
             slice_ = slice(None)
         with self._mem.read_transaction:
-            for record in self._iter_slice(slice_):
-                yield self._get_value_from_record(record)
+            for _, value, overflow_page in self._iter_slice(slice_):
+                yield self._get_value(value, overflow_page)
 
     def __bool__(self):
         with self._mem.read_transaction:
@@ -257,20 +443,44 @@ class BPlusTree:
     # ####################### Implementation ##############################
 
     def _initialize_empty_tree(self):
-        self._root_node_page = self._mem.next_available_page
+        root_node_page = self._mem.next_available_page
         with self._mem.write_transaction:
-            self._mem.set_node(self.LonelyRootNode(page=self._root_node_page))
-        self._mem.set_metadata(self._root_node_page, self._tree_conf)
+            self._mem.set_node(self.LonelyRootNode(page=root_node_page))
+        self._mem.set_metadata(root_node_page, self._tree_conf)
+
+    def _check_page_size(self):
+        """Make sure that a page is big enough to split Nodes.
+
+        A Node overflowing its page is split in two halves of similar sizes,
+        each half must fit in a page even when entries have a maximal size.
+        """
+        max_payload = self.LeafNode().max_payload
+        for entry_class in (Record, Reference):
+            entry_length = entry_class.max_length(self._tree_conf)
+            if (2 * (entry_length + SLOT_BYTES) + SLOTTED_HEADER_BYTES >
+                    max_payload):
+                raise ValueError(
+                    'Page size {} is too small for keys of {} bytes and '
+                    'values of {} bytes'.format(
+                        self._tree_conf.page_size, self._tree_conf.key_size,
+                        self._tree_conf.value_size
+                    )
+                )
 
     def _create_partials(self):
         self.LonelyRootNode = partial(LonelyRootNode, self._tree_conf)
         self.RootNode = partial(RootNode, self._tree_conf)
         self.InternalNode = partial(InternalNode, self._tree_conf)
         self.LeafNode = partial(LeafNode, self._tree_conf)
-        self.OverflowNode = partial(OverflowNode, self._tree_conf)
         self.Record = partial(Record, self._tree_conf)
         self.Reference = partial(Reference, self._tree_conf)
 
+    @property
+    def _root_node_page(self) -> int:
+        # The storage owns the page of the root node so that it can be
+        # restored when a transaction is rolled back
+        return self._mem.root_node_page
+
     @property
     def _root_node(self) -> Union['LonelyRootNode', 'RootNode']:
         root_node = self._mem.get_node(self._root_node_page)
@@ -281,10 +491,43 @@ class BPlusTree:
     def _left_record_node(self) -> Union['LonelyRootNode', 'LeafNode']:
         node = self._root_node
         while not isinstance(node, (LonelyRootNode, LeafNode)):
-            node = self._mem.get_node(node.smallest_entry.before)
+            child_node = self._mem.get_node(node.befores[0])
+            child_node.parent = node
+            node = child_node
         return node
 
-    def _iter_slice(self, slice_: slice) -> Iterator[Record]:
+    def _leaves_after(self, leaf: 'Node') -> Iterator[int]:
+        """Iterate over the pages of the leaves following a leaf, in order.
+
+        They are found in the ancestors of the leaf, linked while walking
+        down to it, and the internal nodes after them. No leaf is read.
+        """
+        ancestors = list()
+        node = leaf
+        while node.page != self._root_node_page:
+            parent = node.parent
+            ancestors.append((parent, parent.child_pages.index(node.page)))
+            node = parent
+        return itertools.chain.from_iterable(
+            self._leaves_under(parent.child_pages[i + 1:], height)
+            for height, (parent, i) in enumerate(ancestors)
+        )
+
+    def _leaves_under(self, pages: list, height: int) -> Iterator[int]:
+        """Iterate over the pages of the leaves under nodes, in order.
+
+        The nodes are `height` levels above the leaves.
+        """
+        for page in pages:
+            if height == 0:
+                yield page
+            else:
+                yield from self._leaves_under(
+                    self._mem.get_node(page).child_pages, height - 1
+                )
+
+    def _iter_slice(self, slice_: slice) -> Iterator[tuple]:
+        """Iterate over the key, value and overflow page of records."""
         if slice_.step is not None:
             raise ValueError('Cannot iterate with a custom step')
 
@@ -297,65 +540,73 @@ class BPlusTree:
         else:
             node = self._search_in_tree(slice_.start, self._root_node)
 
+        leaves = self._leaves_after(node) if self._readahead else iter(())
+        readahead = Readahead(self._mem, self._readahead, leaves)
+        start = 0
+        if slice_.start is not None:
+            start = node.bisect_left(slice_.start)
         while True:
-            for entry in node.entries:
-                if slice_.start is not None and entry.key < slice_.start:
-                    continue
-
-                if slice_.stop is not None and entry.key >= slice_.stop:
-                    return
-
-                yield entry
-
+            keys, values, overflow_pages = (node.keys, node.values,
+                                            node.overflow_pages)
+            stop = len(keys)
+            if slice_.stop is not None:
+                stop = node.bisect_left(slice_.stop)
+            for i in range(start, stop):
+                yield keys[i], values[i], overflow_pages[i] or None
+
+            if stop < len(keys):
+                return
+            start = 0
             if node.next_page:
+                readahead.visit()
                 node = self._mem.get_node(node.next_page)
             else:
                 return
 
+    def _get_record(self, key) -> Record:
+        """Get the record of a key, raise ValueError if there is none.
+
+        Pages missing from the cache are searched in place, without loading
+        their nodes.
+        """
+        node = self._mem.get_node_or_page(self._root_node_page)
+        while not node.holds_records:
+            node = self._mem.get_node_or_page(node.child_page(key))
+        return node.get_entry(key)
+
     def _search_in_tree(self, key, node) -> 'Node':
         if isinstance(node, (LonelyRootNode, LeafNode)):
             return node
 
-        page = None
-
-        if key < node.smallest_key:
-            page = node.smallest_entry.before
-
-        elif node.biggest_key <= key:
-            page = node.biggest_entry.after
-
-        else:
-            for ref_a, ref_b in utils.pairwise(node.entries):
-                if ref_a.key <= key < ref_b.key:
-                    page = ref_a.after
-                    break
-
-        assert page is not None
-
-        child_node = self._mem.get_node(page)
+        child_node = self._mem.get_node(node.child_page(key))
         child_node.parent = node
         return self._search_in_tree(key, child_node)
 
     def _split_leaf(self, old_node: 'Node'):
         """Split a leaf Node to allow the tree to grow."""
         parent = old_node.parent
-        new_node = self.LeafNode(page=self._mem.next_available_page,
-                                 next_page=old_node.next_page)
-        new_entries = old_node.split_entries()
-        new_node.entries = new_entries
-        ref = self.Reference(new_node.smallest_key,
-                             old_node.page, new_node.page)
+        # The new leaf follows the old one when iterating, it is allocated
+        # close to it on disk
+        new_node = self.LeafNode(
+            page=self._mem.next_available_page_near(old_node.page),
+            next_page=old_node.next_page
+        )
+        old_node.split_into(new_node)
+        separator = self._tree_conf.serializer.shortest_separator(
+            old_node.biggest_key, new_node.smallest_key
+        )
+        ref = self.Reference(separator, old_node.page, new_node.page)
 
         if isinstance(old_node, LonelyRootNode):
             # Convert the LonelyRoot into a Leaf
             old_node = old_node.convert_to_leaf()
             self._create_new_root(ref)
-        elif parent.can_add_entry:
-            parent.insert_entry(ref)
-            self._mem.set_node(parent)
         else:
             parent.insert_entry(ref)
-            self._split_parent(parent)
+            if parent.needs_split:
+                self._split_parent(parent)
+            else:
+                self._mem.set_node(parent)
 
         old_node.next_page = new_node.page
 
@@ -364,9 +615,10 @@ class BPlusTree:
 
     def _split_parent(self, old_node: Node):
         parent = old_node.parent
-        new_node = self.InternalNode(page=self._mem.next_available_page)
-        new_entries = old_node.split_entries()
-        new_node.entries = new_entries
+        new_node = self.InternalNode(
+            page=self._mem.next_available_page_near(old_node.page)
+        )
+        old_node.split_into(new_node)
 
         ref = new_node.pop_smallest()
         ref.before = old_node.page
@@ -376,12 +628,12 @@ class BPlusTree:
             # Convert the Root into an Internal
             old_node = old_node.convert_to_internal()
             self._create_new_root(ref)
-        elif parent.can_add_entry:
-            parent.insert_entry(ref)
-            self._mem.set_node(parent)
         else:
             parent.insert_entry(ref)
-            self._split_parent(parent)
+            if parent.needs_split:
+                self._split_parent(parent)
+            else:
+                self._mem.set_node(parent)
 
         self._mem.set_node(old_node)
         self._mem.set_node(new_node)
@@ -389,57 +641,148 @@ class BPlusTree:
     def _create_new_root(self, reference: Reference):
         new_root = self.RootNode(page=self._mem.next_available_page)
         new_root.insert_entry(reference)
-        self._root_node_page = new_root.page
-        self._mem.set_metadata(self._root_node_page, self._tree_conf)
+        self._mem.set_metadata(new_root.page, self._tree_conf)
         self._mem.set_node(new_root)
 
     def _create_overflow(self, value: bytes) -> int:
-        first_overflow_page = self._mem.next_available_page
-        next_overflow_page = first_overflow_page
+        """Store a value in contiguous pages and return the first one.
 
-        iterator = utils.iter_slice(value, self.OverflowNode().max_payload)
-        for slice_value, is_last in iterator:
-            current_overflow_page = next_overflow_page
+        When deduplicating, a value already stored gets one more reference
+        instead of being written again.
+        """
+        if not self._dedup:
+            return self._mem.write_extent(value)
+
+        digest = hashlib.sha256(value).digest()
+        first_overflow_page = self._mem.share_extent(digest)
+        if first_overflow_page is None:
+            first_overflow_page = self._mem.write_extent(value)
+            self._mem.add_shared_extent(digest, first_overflow_page)
+        return first_overflow_page
 
-            if is_last:
-                next_overflow_page = None
-            else:
-                next_overflow_page = self._mem.next_available_page
+    def _create_overflow_from_chunks(self, chunks: Iterable[bytes],
+                                     length: Optional[int]) -> int:
+        """Store a value coming in chunks in contiguous pages.
 
-            overflow_node = self.OverflowNode(
-                page=current_overflow_page, next_page=next_overflow_page
-            )
-            overflow_node.insert_entry_at_the_end(OpaqueData(data=slice_value))
-            self._mem.set_node(overflow_node)
+        The digest of a streamed value is only known once it is written, a
+        duplicate is given back to the freelist right away.
+        """
+        if not self._dedup:
+            return self._mem.write_extent_stream(chunks, length)
 
-        return first_overflow_page
+        hash_ = hashlib.sha256()
 
-    def _traverse_overflow(self, first_overflow_page: int):
-        """Yield all Nodes of an overflow chain."""
-        next_overflow_page = first_overflow_page
-        while True:
-            overflow_node = self._mem.get_node(next_overflow_page)
-            yield overflow_node
+        def hashed_chunks():
+            for chunk in chunks:
+                hash_.update(chunk)
+                yield chunk
 
-            next_overflow_page = overflow_node.next_page
-            if next_overflow_page is None:
-                break
+        first_overflow_page = self._mem.write_extent_stream(hashed_chunks(),
+                                                            length)
+        digest = hash_.digest()
+        shared_page = self._mem.share_extent(digest)
+        if shared_page is None:
+            self._mem.add_shared_extent(digest, first_overflow_page)
+            return first_overflow_page
 
-    def _read_from_overflow(self, first_overflow_page: int) -> bytes:
-        """Collect all values of an overflow chain."""
-        rv = bytearray()
-        for overflow_node in self._traverse_overflow(first_overflow_page):
-            rv.extend(overflow_node.smallest_entry.data)
+        self._mem.del_extent(first_overflow_page)
+        return shared_page
 
-        return bytes(rv)
+    def _read_from_overflow(self, first_overflow_page: int) -> bytes:
+        return self._mem.read_extent(first_overflow_page)
 
     def _delete_overflow(self, first_overflow_page: int):
-        """Delete all Nodes in an overflow chain."""
-        for overflow_node in self._traverse_overflow(first_overflow_page):
-            self._mem.del_node(overflow_node)
-
-    def _get_value_from_record(self, record: Record) -> bytes:
-        if record.value is not None:
-            return record.value
-
-        return self._read_from_overflow(record.overflow_page)
+        # Shared values are only deleted with their last reference
+        if self._mem.release_extent(first_overflow_page):
+            self._mem.del_extent(first_overflow_page)
+
+    def _get_bytes(self, value: Optional[bytes],
+                   overflow_page: Optional[int]) -> bytes:
+        if value is not None:
+            return value
+
+        return self._read_from_overflow(overflow_page)
+
+    def _get_value(self, value: Optional[bytes],
+                   overflow_page: Optional[int]):
+        value = self._get_bytes(value, overflow_page)
+        if self._codec is not None:
+            return self._codec.decode(value)
+        return value
+
+    def _copy_to_new_tree(self, batch_size: int,
+                          pause: float) -> 'BPlusTree':
+        """Copy all records to a new tree with the same configuration."""
+        if self._filename == ':memory:':
+            filename = ':memory:'
+        else:
+            filename = self._filename + '-vacuum'
+            # Leftovers of an interrupted vacuum
+            for path in (filename, filename + '-wal'):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        conf = self._tree_conf
+        new_tree = BPlusTree(
+            filename, page_size=conf.page_size, order=conf.order,
+            key_size=conf.key_size, value_size=conf.value_size,
+            serializer=conf.serializer, compression=conf.compression,
+            dedup=self._dedup, page_reference_bytes=conf.page_reference_bytes
+        )
+        try:
+            slice_ = slice(None)
+            while True:
+                batch = list()
+                with self._mem.read_transaction:
+                    for key, value, overflow_page in self._iter_slice(slice_):
+                        if key == slice_.start:
+                            continue
+                        batch.append(
+                            (key, self._get_bytes(value, overflow_page))
+                        )
+                        if len(batch) >= batch_size:
+                            break
+
+                if not batch:
+                    return new_tree
+
+                new_tree.batch_insert(batch)
+                slice_ = slice(batch[-1][0], None)
+                if pause:
+                    time.sleep(pause)
+        except BaseException:
+            self._discard_tree(new_tree)
+            raise
+
+    def _copy_changes(self, new_tree: 'BPlusTree', batch_size: int,
+                      pause: float) -> int:
+        """Copy the records written since the last copy to a new tree.
+
+        Return the number of records copied.
+        """
+        with self._mem.read_transaction:
+            changed_keys, self._changed_keys = self._changed_keys, set()
+        changed_keys = sorted(changed_keys)
+        for keys, _ in utils.iter_slice(changed_keys, batch_size):
+            batch = list()
+            with self._mem.read_transaction:
+                for key in keys:
+                    try:
+                        record = self._get_record(key)
+                    except ValueError:
+                        # Written by a transaction that got rolled back
+                        continue
+                    batch.append((key, self._get_bytes(record.value,
+                                                       record.overflow_page)))
+            with new_tree._mem.write_transaction:
+                for key, value in batch:
+                    new_tree.insert(key, value, replace=True)
+            if pause:
+                time.sleep(pause)
+        return len(changed_keys)
+
+    @staticmethod
+    def _discard_tree(tree: 'BPlusTree'):
+        tree.close()
+        if tree._filename != ':memory:':
+            os.remove(tree._filename)
@@ -1,5 +1,5 @@
 import itertools
-from typing import Iterable
+from typing import Iterable, Optional
 
 
 def pairwise(iterable: Iterable):
@@ -12,6 +12,24 @@ def pairwise(iterable: Iterable):
     return zip(a, b)
 
 
+def common_prefix(items: Iterable) -> bytes:
+    """Find the longest prefix shared by all byte strings.
+
+    [b'abc', b'abd', b'ab'] -> b'ab'
+    """
+    items = list(items)
+    if not items:
+        return b''
+
+    # The prefix shared by the smallest and biggest strings is shared by
+    # all the ones in between
+    smallest, biggest = min(items), max(items)
+    for i, byte in enumerate(smallest):
+        if byte != biggest[i]:
+            return smallest[:i]
+    return smallest
+
+
 def iter_slice(iterable: bytes, n: int):
     """Yield slices of size n and says if each slice is the last one.
 
@@ -29,3 +47,40 @@ def iter_slice(iterable: bytes, n: int):
         start = stop
         stop = start + n
         yield rv, start >= final_offset
+
+
+def contiguous_runs(items: Iterable[int], max_length: int):
+    """Group sorted integers in runs of consecutive ones.
+
+    [1, 2, 3, 5, 6] -> [1, 2, 3], [5, 6]
+    """
+    run = list()
+    for item in items:
+        if run and (item != run[-1] + 1 or len(run) >= max_length):
+            yield run
+            run = list()
+        run.append(item)
+    if run:
+        yield run
+
+
+def read_chunks(fileobj, chunk_size: int, length: Optional[int]=None):
+    """Read a binary file object in chunks.
+
+    The file is read until its end, or until `length` bytes if it is given.
+    Raise ValueError if the file ends before `length` bytes.
+    """
+    read_length = 0
+    while length is None or read_length < length:
+        size = chunk_size
+        if length is not None:
+            size = min(chunk_size, length - read_length)
+        chunk = fileobj.read(size)
+        if not chunk:
+            break
+        read_length += len(chunk)
+        yield chunk
+
+    if length is not None and read_length < length:
+        raise ValueError('Expected {} bytes, got only {}'
+                         .format(length, read_length))
@@ -10,13 +10,15 @@ filename = '/tmp/bplustree-testfile.index'
 def clean_file():
     if os.path.isfile(filename):
         os.unlink(filename)
-    if os.path.isfile(filename + '-wal'):
-        os.unlink(filename + '-wal')
+    for path in (filename + '-wal', filename + '-cache'):
+        if os.path.isfile(path):
+            os.unlink(path)
     yield
     if os.path.isfile(filename):
         os.unlink(filename)
-    if os.path.isfile(filename + '-wal'):
-        os.unlink(filename + '-wal')
+    for path in (filename + '-wal', filename + '-cache'):
+        if os.path.isfile(path):
+            os.unlink(path)
 
 
 @pytest.fixture(autouse=True)
@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+import pytest
+
+from bplustree.aio import AsyncBPlusTree
+from bplustree.tree import BPlusTree
+from .conftest import filename
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@pytest.fixture
+def b():
+    b = AsyncBPlusTree(BPlusTree(filename, key_size=16, value_size=16,
+                                 order=4))
+    yield b
+    run(b.close())
+
+
+def test_async_insert_get(b):
+    async def main():
+        await b.insert(1, b'foo')
+        assert await b.get(1) == b'foo'
+        assert await b.get(2) is None
+        assert await b.get(2, b'bar') == b'bar'
+
+        with pytest.raises(ValueError):
+            await b.insert(1, b'bar')
+        await b.insert(1, b'bar', replace=True)
+        assert await b.get(1) == b'bar'
+
+    run(main())
+
+
+def test_async_batch_insert_items(b):
+    async def main():
+        await b.batch_insert((i, str(i).encode()) for i in range(100))
+        await b.checkpoint()
+
+        rv = list()
+        async for key, value in b.items(batch_size=7):
+            rv.append((key, value))
+        assert rv == [(i, str(i).encode()) for i in range(100)]
+
+        rv = list()
+        async for key, value in b.items(slice(10, 20), batch_size=3):
+            rv.append(key)
+        assert rv == list(range(10, 20))
+
+        rv = list()
+        async for key, value in b.items(slice(200, 300)):
+            rv.append(key)
+        assert rv == []
+
+    run(main())
+
+
+def test_async_items_batch_size(b):
+    with pytest.raises(ValueError):
+        b.items(batch_size=0)
+
+
+def test_async_batch_insert_cancelled(b):
+    def generate():
+        for i in range(100):
+            time.sleep(0.01)
+            yield i, str(i).encode()
+
+    async def main():
+        task = asyncio.ensure_future(b.batch_insert(generate()))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        assert await b.get(0) is None
+        assert b._tree._mem._wal._not_committed_pages == {}
+        assert not b._tree
+
+        # The tree is still usable after the rollback
+        await b.batch_insert((i, str(i).encode()) for i in range(100))
+        assert await b.get(99) == b'99'
+
+    run(main())
+
+
+def test_async_context_manager():
+    async def main():
+        async with AsyncBPlusTree(BPlusTree(filename)) as b:
+            await b.insert(1, b'foo')
+
+        async with AsyncBPlusTree(BPlusTree(filename)) as b:
+            assert await b.get(1) == b'foo'
+
+    run(main())
@@ -0,0 +1,43 @@
+import pickle
+
+import pytest
+
+from bplustree.codec import ZlibCodec, PickleCodec, StructCodec
+
+
+def test_zlib_codec():
+    c = ZlibCodec()
+    value = b'foo' * 100
+    data = c.encode(value)
+    assert len(data) < len(value)
+    assert c.decode(data) == value
+    assert c.decode(memoryview(data)) == value
+    assert repr(c) == 'ZlibCodec()'
+
+
+def test_zlib_codec_incompressible():
+    c = ZlibCodec(level=9)
+    assert c.encode(b'foo') == b'\x00foo'
+    assert c.decode(b'\x00foo') == b'foo'
+    assert c.encode(b'') == b'\x00'
+    assert c.decode(b'\x00') == b''
+
+
+def test_pickle_codec():
+    c = PickleCodec()
+    value = {'foo': [1, 2.5, None]}
+    assert c.decode(c.encode(value)) == value
+    assert PickleCodec(protocol=2).encode(value) == pickle.dumps(value, 2)
+
+
+def test_struct_codec():
+    c = StructCodec('<dI')
+    assert c.encode((1.5, 42)) == b'\x00\x00\x00\x00\x00\x00\xf8?*\x00\x00\x00'
+    assert c.decode(c.encode((1.5, 42))) == (1.5, 42)
+    assert repr(c) == "StructCodec('<dI')"
+
+
+def test_codec_slots():
+    c = ZlibCodec()
+    with pytest.raises(AttributeError):
+        c.foo = True
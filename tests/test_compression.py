@@ -0,0 +1,48 @@
+import pytest
+
+from bplustree.compression import (
+    COMPRESSED_PAGE_TYPE, check_compression, compress_page, decompress_page,
+    compression_to_int, int_to_compression
+)
+
+
+def test_check_compression():
+    check_compression(None)
+    check_compression('zlib')
+    check_compression('lzma')
+    with pytest.raises(ValueError):
+        check_compression('foo')
+
+
+def test_compression_to_from_int():
+    for compression in (None, 'zlib', 'lzma'):
+        assert int_to_compression(compression_to_int(compression)) == (
+            compression
+        )
+    assert compression_to_int(None) == 0
+    with pytest.raises(ValueError):
+        int_to_compression(42)
+
+
+@pytest.mark.parametrize('compression', ['zlib', 'lzma'])
+def test_compress_decompress_page(compression):
+    data = bytearray(b'\x04' + b'foo' * 100 + bytes(3796))
+    compressed = compress_page(compression, data)
+    assert compressed[0] == COMPRESSED_PAGE_TYPE
+    assert len(compressed) < len(data)
+
+    # Garbage from a previous page may follow the compressed data
+    padded = compressed + b'\xff' * (len(data) - len(compressed))
+    assert decompress_page(compression, padded) == data
+
+
+def test_compress_page_incompressible():
+    data = bytes(range(256))
+    assert compress_page('zlib', data) is data
+    assert decompress_page('zlib', data) is data
+
+
+def test_no_compression():
+    data = b'\x04' + bytes(4095)
+    assert compress_page(None, data) is data
+    assert decompress_page(None, data) is data
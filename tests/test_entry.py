@@ -1,41 +1,21 @@
 import pytest
 
-from bplustree.entry import Record, Reference, OpaqueData, NOT_LOADED
+from bplustree.entry import Record, Reference
 from bplustree.const import TreeConf
 from bplustree.serializer import IntSerializer, StrSerializer
 
 tree_conf = TreeConf(4096, 4, 16, 16, IntSerializer())
 
 
-def test_record_int_serialization():
+def test_record_int_dump_key():
     r1 = Record(tree_conf, 42, b'foo')
-    data = r1.dump()
-
-    r2 = Record(tree_conf, data=data)
-    assert r1 == r2
-    assert r1.value == r2.value
-    assert r1.overflow_page == r2.overflow_page
+    assert r1.dump_key() == IntSerializer().serialize(42, 16)
 
 
-def test_record_str_serialization():
+def test_record_str_dump_key():
     tree_conf = TreeConf(4096, 4, 40, 40, StrSerializer())
-    r1 = Record(tree_conf, '0', b'0')
-    data = r1.dump()
-
-    r2 = Record(tree_conf, data=data)
-    assert r1 == r2
-    assert r1.value == r2.value
-    assert r1.overflow_page == r2.overflow_page
-
-
-def test_record_int_serialization_overflow_value():
-    r1 = Record(tree_conf, 42, overflow_page=5)
-    data = r1.dump()
-
-    r2 = Record(tree_conf, data=data)
-    assert r1 == r2
-    assert r1.value == r2.value
-    assert r1.overflow_page == r2.overflow_page
+    r1 = Record(tree_conf, 'foo', b'0')
+    assert r1.dump_key() == b'foo'
 
 
 def test_record_repr():
@@ -55,45 +35,22 @@ def test_record_slots():
         r1.foo = True
 
 
-def test_record_lazy_load():
-    data = Record(tree_conf, 42, b'foo').dump()
-    r = Record(tree_conf, data=data)
-
-    assert r._data == data
-    assert r._key == NOT_LOADED
-    assert r._value == NOT_LOADED
-    assert r._overflow_page == NOT_LOADED
-
-    _ = r.key
-    assert r._key == 42
-    assert r._value == b'foo'
-    assert r._overflow_page is None
-    assert r._data == data
-
-    r.key = 27
-    assert r._key == 27
-    assert r._data is None
-
-
-def test_reference_int_serialization():
-    r1 = Reference(tree_conf, 42, 1, 2)
-    data = r1.dump()
-
-    r2 = Reference(tree_conf, data=data)
+def test_entries_compare_keys():
+    r1 = Record(tree_conf, 42, b'foo')
+    r2 = Record(tree_conf, 42, b'bar')
+    r3 = Record(tree_conf, 43, b'foo')
     assert r1 == r2
-    assert r1.before == r2.before
-    assert r1.after == r2.after
+    assert r1 < r3 and r1 <= r2 and r3 > r1 and r2 >= r1
+
+    ref = Reference(tree_conf, 43, 1, 2)
+    assert ref == r3
 
 
-def test_reference_str_serialization():
+def test_reference_str_dump_key():
     tree_conf = TreeConf(4096, 4, 40, 40, StrSerializer())
     r1 = Reference(tree_conf, 'foo', 1, 2)
-    data = r1.dump()
-
-    r2 = Reference(tree_conf, data=data)
-    assert r1 == r2
-    assert r1.before == r2.before
-    assert r1.after == r2.after
+    assert r1.dump_key() == b'foo'
+    assert (r1.before, r1.after) == (1, 2)
 
 
 def test_reference_repr():
@@ -101,35 +58,9 @@ def test_reference_repr():
     assert repr(r1) == '<Reference: key=42 before=1 after=2>'
 
 
-def test_reference_lazy_load():
-    data = Reference(tree_conf, 42, 1, 2).dump()
-    r = Reference(tree_conf, data=data)
-
-    assert r._data == data
-    assert r._key == NOT_LOADED
-    assert r._before == NOT_LOADED
-    assert r._after == NOT_LOADED
-
-    _ = r.key
-    assert r._key == 42
-    assert r._before == 1
-    assert r._after == 2
-    assert r._data == data
-
-    r.key = 27
-    assert r._key == 27
-    assert r._data is None
-
-
-def test_opaque_data():
-    data = b'foo'
-    o = OpaqueData(data=data)
-    assert o.data == data
-    assert o.dump() == data
-
-    o = OpaqueData()
-    o.load(data)
-    assert o.data == data
-    assert o.dump() == data
-
-    assert repr(o) == "<OpaqueData: b'foo'>"
+def test_entries_max_length_page_reference_bytes():
+    wide_conf = tree_conf._replace(page_reference_bytes=8)
+    assert Record.max_length(wide_conf) == Record.max_length(tree_conf) + 4
+    assert Reference.max_length(wide_conf) == (
+        Reference.max_length(tree_conf) + 8
+    )
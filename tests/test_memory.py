@@ -5,11 +5,17 @@ from unittest import mock
 
 import pytest
 
-from bplustree.node import LeafNode, FreelistNode
+import cachetools
+
+from bplustree.node import (LeafNode, FreelistNode, InternalNode, RootNode,
+                            Node, NodePage)
+from bplustree.entry import Record
 from bplustree.memory import (
-    FileMemory, open_file_in_dir, WAL, ReachedEndOfFile, write_to_file
+    FileMemory, VolatileMemory, open_file_in_dir, WAL, ReachedEndOfFile,
+    write_to_file, lock_file, read_from_file, Readahead, BufferPool,
+    TwoQueueCache, NodeCache, FakeCache, create_cache, MetadataNotSet
 )
-from bplustree.const import TreeConf
+from bplustree.const import TreeConf, FILE_MAGIC, FORMAT_VERSION, ENDIAN
 from .conftest import filename
 from bplustree.serializer import IntSerializer
 
@@ -31,10 +37,29 @@ def test_file_memory_node():
 
 def test_file_memory_metadata():
     mem = FileMemory(filename, tree_conf)
-    with pytest.raises(ValueError):
+    with pytest.raises(MetadataNotSet):
         mem.get_metadata()
     mem.set_metadata(6, tree_conf)
     assert mem.get_metadata() == (6, tree_conf)
+    mem.close()
+
+    with open(filename, 'rb') as f:
+        header = f.read(len(FILE_MAGIC) + 4)
+    assert header == FILE_MAGIC + FORMAT_VERSION.to_bytes(4, ENDIAN)
+
+
+@pytest.mark.parametrize('header', [
+    # Metadata page of the format without a magic
+    (1).to_bytes(4, ENDIAN) + (4096).to_bytes(4, ENDIAN),
+    FILE_MAGIC + (FORMAT_VERSION + 1).to_bytes(4, ENDIAN),
+])
+def test_file_memory_unsupported_format(header):
+    with open(filename, 'wb') as f:
+        f.write(header + bytes(tree_conf.page_size - len(header)))
+
+    with pytest.raises(ValueError) as e:
+        FileMemory(filename, tree_conf)
+    assert not isinstance(e.value, MetadataNotSet)
 
 
 def test_file_memory_next_available_page():
@@ -73,6 +98,468 @@ def test_file_memory_freelist():
     assert mem._pop_from_freelist() is None
 
 
+def test_file_memory_extent():
+    mem = FileMemory(filename, tree_conf)
+    value = os.urandom(10000)
+    with mem.write_transaction:
+        assert mem.write_extent(b'foo') == 1
+        assert mem.write_extent(value) == 2
+        assert mem.last_page == 4
+    assert mem.read_extent(1) == b'foo'
+    assert mem.read_extent(2) == value
+
+    # Pages not in the WAL are read from the file at once
+    mem.perform_checkpoint(reopen_wal=True)
+    with mock.patch('bplustree.memory.read_from_file',
+                    wraps=read_from_file) as mock_read:
+        assert mem.read_extent(2) == value
+    assert mock_read.call_count == 2
+
+    # Deallocated extents are reused as a unit
+    with mem.write_transaction:
+        mem.del_extent(2)
+        assert mem.next_available_extent(2) == 3
+        assert mem.next_available_extent(2) == 5
+        assert mem.next_available_page == 2
+    mem.close()
+
+
+def test_next_available_page_near():
+    mem = VolatileMemory(tree_conf)
+    with mem.write_transaction:
+        mem.last_page = 20
+        mem.del_page(3)
+        mem.del_extent(mem.write_extent(b'a' * 20000))  # Pages 21 to 25
+        mem.del_page(18)
+
+    def free_extents():
+        mem._free_extents = None
+        mem._load_free_extents()
+        return sorted((page, n) for page, (n, _) in mem._free_extents.items())
+
+    assert free_extents() == [(3, 1), (18, 1), (21, 5)]
+    with mem.write_transaction:
+        assert mem.next_available_page_near(23) == 23
+        assert free_extents() == [(3, 1), (18, 1), (21, 2), (24, 2)]
+        assert mem.next_available_page_near(2) == 3
+        assert mem.next_available_page_near(20) == 21
+        assert mem.next_available_page_near(100) == 25
+        assert mem.next_available_page_near(0) == 18
+        assert free_extents() == [(22, 1), (24, 1)]
+
+    with pytest.raises(ValueError):
+        with mem.write_transaction:
+            assert mem.next_available_page_near(0) == 22
+            assert mem.next_available_page_near(0) == 24
+            assert mem.next_available_page_near(0) == 26
+            raise ValueError()
+
+    # The map of free extents is reloaded after a rollback
+    assert mem._free_extents is None
+    with mem.write_transaction:
+        assert mem.next_available_page_near(30) == 24
+        assert mem.next_available_page_near(30) == 22
+        assert mem.next_available_page_near(30) == 26
+        assert mem._freelist_start_page == 0
+    mem.close()
+
+
+@pytest.mark.skipif(not hasattr(os, 'posix_fallocate'),
+                    reason='No posix_fallocate on this platform')
+def test_file_memory_preallocate():
+    mem = FileMemory(filename, tree_conf)
+    with mem.write_transaction:
+        node = LeafNode(tree_conf, page=mem.next_available_extent(10))
+        mem.set_node(node)
+        mem.set_node(LeafNode(tree_conf, page=10))
+    with mock.patch('bplustree.memory.os.posix_fallocate',
+                    wraps=os.posix_fallocate) as mock_fallocate:
+        mem.perform_checkpoint(reopen_wal=True)
+    mock_fallocate.assert_called_once_with(mem._fd.fileno(), 0, 11 * 4096)
+    assert os.path.getsize(filename) == 11 * 4096
+    mem.close()
+
+
+def test_file_memory_compression_sparse():
+    compressed_conf = TreeConf(16384, 4, 16, 16, IntSerializer(), 'zlib')
+    mem = FileMemory(filename, compressed_conf)
+    mem.set_metadata(1, compressed_conf)
+    with mem.write_transaction:
+        for page in range(1, 201):
+            mem.set_node(LeafNode(compressed_conf, page=page))
+    mem.close()
+
+    # The end of the slot of each compressed page is not allocated
+    size = os.path.getsize(filename)
+    assert size == 201 * compressed_conf.page_size
+    assert os.stat(filename).st_blocks * 512 < size / 2
+
+
+def test_readahead():
+    mem = mock.Mock()
+    readahead = Readahead(mem, max_pages=8, leaves=iter(range(5, 100)))
+    for _ in range(25):
+        readahead.visit()
+    assert mem.advise.call_args_list == [
+        mock.call(5, 1), mock.call(6, 2), mock.call(8, 3), mock.call(11, 6),
+        # The window is full, it is extended every half window
+        mock.call(17, 4), mock.call(21, 4), mock.call(25, 4), mock.call(29, 4),
+        mock.call(33, 4)
+    ]
+
+    # Only the pages of the leaves are advised, contiguous ones at once
+    mem.reset_mock()
+    leaves = iter([10, 30, 21, 12, 11, 13, 50])
+    readahead = Readahead(mem, max_pages=8, leaves=leaves)
+    for _ in range(3):
+        readahead.visit()
+    assert mem.advise.call_args_list == [
+        mock.call(10, 1), mock.call(21, 1), mock.call(30, 1),
+        mock.call(11, 3)
+    ]
+    assert list(leaves) == [50]
+
+    mem.reset_mock()
+    readahead = Readahead(mem, max_pages=0, leaves=iter(range(5, 100)))
+    readahead.visit()
+    mem.advise.assert_not_called()
+
+
+@pytest.mark.skipif(not hasattr(os, 'posix_fadvise'),
+                    reason='No posix_fadvise on this platform')
+def test_file_memory_advise():
+    mem = FileMemory(filename, tree_conf)
+    with mock.patch('bplustree.memory.os.posix_fadvise') as mock_fadvise:
+        mem.advise(3, 2)
+    mock_fadvise.assert_called_once_with(mem._fd.fileno(), 3 * 4096,
+                                         2 * 4096, os.POSIX_FADV_WILLNEED)
+    mem.close()
+
+
+direct_io = pytest.mark.skipif(not hasattr(os, 'O_DIRECT'),
+                               reason='No direct I/O on this platform')
+
+
+@direct_io
+def test_buffer_pool():
+    with open(filename, 'wb') as f:
+        for page in range(4):
+            f.write(bytes([page]) * 4096)
+    fileno = os.open(filename, os.O_RDONLY | os.O_DIRECT)
+    pool = BufferPool(4096, 2 * 4096)
+
+    assert pool.read_page(fileno, 1) == b'\x01' * 4096
+    assert pool.read_page(fileno, 2) == b'\x02' * 4096
+    assert pool.read_page(fileno, 1) == b'\x01' * 4096
+    # The least recently used page gets evicted
+    assert pool.read_page(fileno, 3) == b'\x03' * 4096
+    assert list(pool._slots) == [1, 3]
+    assert len(pool) == 2
+
+    pool.discard(1)
+    assert list(pool._slots) == [3]
+
+    # Contiguous pages do not enter the pool
+    assert pool.read_pages(fileno, 0, 2) == b'\x00' * 4096 + b'\x01' * 4096
+    assert list(pool._slots) == [3]
+
+    with pytest.raises(ReachedEndOfFile):
+        pool.read_page(fileno, 4)
+    assert len(pool._free_slots) == 1
+
+    pool.clear()
+    assert len(pool) == 0
+    pool.close()
+    os.close(fileno)
+
+
+def test_buffer_pool_size():
+    with pytest.raises(ValueError):
+        BufferPool(4096, 4095)
+    with pytest.raises(ValueError):
+        BufferPool(1000, 4096)
+
+
+@direct_io
+def test_file_memory_direct_io():
+    mem = FileMemory(filename, tree_conf, buffer_pool_size=4 * 4096)
+    with mem.write_transaction:
+        mem.set_node(node)
+    mem.perform_checkpoint(reopen_wal=True)
+    mem._cache.clear()
+    assert mem.get_node(3) == node
+    assert list(mem._pool._slots) == [3]
+
+    # Pages written back to the file are not stale in the pool
+    with mem.write_transaction:
+        mem.set_node(LeafNode(tree_conf, page=3, next_page=5))
+    mem.perform_checkpoint(reopen_wal=True)
+    assert list(mem._pool._slots) == []
+    mem._cache.clear()
+    assert mem.get_node(3).next_page == 5
+
+    with mock.patch('bplustree.memory.os.posix_fadvise') as mock_fadvise:
+        mem.advise(3, 2)
+    mock_fadvise.assert_not_called()
+    mem.close()
+
+
+def test_two_queue_cache():
+    cache = TwoQueueCache(8)
+    for key in range(4):
+        cache[key] = key
+    # Keys read again after leaving the FIFO queue become hot
+    for key in range(4, 12):
+        cache[key] = key
+    for key in range(4):
+        assert cache.get(key) is None
+        cache[key] = key
+    assert list(cache._main) == [0, 1, 2, 3]
+
+    # A scan does not evict them
+    for key in range(100, 200):
+        cache[key] = key
+    for key in range(4):
+        assert cache.get(key) == key
+    assert len(cache) == 8
+    assert 150 not in cache
+    assert 199 in cache
+
+    assert cache.pop(0) == 0
+    assert cache.pop(199) == 199
+    assert cache.pop(199, 'foo') == 'foo'
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_two_queue_cache_getsizeof():
+    cache = TwoQueueCache(100, getsizeof=len)
+    cache['a'] = 'x' * 60
+    cache['b'] = 'x' * 30
+    assert cache.currsize == 90
+    cache['c'] = 'x' * 20
+    assert 'a' not in cache
+    assert cache.currsize == 50
+    cache['b'] = 'x' * 10
+    assert cache.currsize == 30
+    with pytest.raises(ValueError):
+        cache['d'] = 'x' * 101
+
+    # Updated keys go back to the end of the queue
+    assert cache.popitem() == ('c', 'x' * 20)
+    assert cache.currsize == 10
+    cache.clear()
+    assert cache.currsize == 0
+    with pytest.raises(KeyError):
+        cache.popitem()
+
+
+def test_create_cache():
+    assert isinstance(create_cache('lru', 8), cachetools.LRUCache)
+    assert isinstance(create_cache('2q', 8), TwoQueueCache)
+    assert isinstance(create_cache(cachetools.LFUCache, 8),
+                      cachetools.LFUCache)
+    assert isinstance(create_cache('2q', 0), FakeCache)
+    cache = create_cache('lru', 100, getsizeof=len)
+    cache['a'] = 'x' * 60
+    assert cache.currsize == 60
+    with pytest.raises(ValueError):
+        create_cache('foo', 8)
+
+
+def test_node_cache():
+    cache = NodeCache(cachetools.LRUCache(maxsize=1), pin_internal_nodes=True)
+    root = RootNode(tree_conf, page=1)
+    internal = InternalNode(tree_conf, page=2)
+    cache[1] = root
+    cache[2] = internal
+    for page in range(10, 20):
+        cache[page] = LeafNode(tree_conf, page=page)
+    assert cache.get(1) is root
+    assert cache.get(2) is internal
+    assert cache.get(19).page == 19
+
+    # Pages can be reused by nodes of another type
+    cache[2] = LeafNode(tree_conf, page=2)
+    assert isinstance(cache.get(2), LeafNode)
+    cache[2] = FreelistNode(tree_conf, page=2)
+    assert cache.get(2) is None
+
+    cache.clear()
+    assert cache.get(1) is None
+
+    cache = NodeCache(cachetools.LRUCache(maxsize=1))
+    cache[1] = root
+    cache[10] = LeafNode(tree_conf, page=10)
+    assert cache.get(1) is None
+
+
+def test_node_cache_resize():
+    cache = NodeCache(cachetools.LRUCache(maxsize=10))
+    for page in range(10):
+        cache[page] = LeafNode(tree_conf, page=page)
+    cache.resize(4)
+    assert cache.currsize == 4
+    assert cache.get(5) is None
+    assert cache.get(9).page == 9
+    cache[10] = LeafNode(tree_conf, page=10)
+    assert cache.currsize == 4
+
+    cache.resize(None)
+    for page in range(10):
+        cache[page] = LeafNode(tree_conf, page=page)
+    assert cache.currsize == 10
+
+    # Nodes bigger than the whole cache are not kept
+    cache = NodeCache(cachetools.LRUCache(maxsize=100,
+                                          getsizeof=Node.footprint))
+    cache[1] = LeafNode(tree_conf, page=1)
+    assert cache.get(1) is None
+
+
+def test_file_memory_warm_cache():
+    mem = FileMemory(filename, tree_conf, warm_cache=True)
+    with mem.write_transaction:
+        for page in (1, 2, 3, 7):
+            mem.set_node(LeafNode(tree_conf, page=page))
+        mem.set_metadata(1, tree_conf)
+    mem.close()
+    assert os.path.getsize(filename + '-cache') == 4 * 4
+
+    # A read-only instance leaves the list for the next one
+    mem = FileMemory(filename, tree_conf, readonly=True, warm_cache=True)
+    assert sorted(mem._hot_pages) == [1, 2, 3, 7]
+    mem.close()
+    assert os.path.exists(filename + '-cache')
+
+    mem = FileMemory(filename, tree_conf, warm_cache=True)
+    assert not os.path.exists(filename + '-cache')
+    mem.get_metadata()
+    with mock.patch.object(FileMemory, '_read_pages',
+                           wraps=mem._read_pages) as mock_read_pages:
+        mem.warm_cache()
+    assert mock_read_pages.call_args_list == [mock.call(1, 3),
+                                              mock.call(7, 1)]
+    assert sorted(mem._cache.pages()) == [1, 2, 3, 7]
+    mem.close()
+
+    # Without warm_cache, the list is discarded and not saved again
+    mem = FileMemory(filename, tree_conf)
+    assert not os.path.exists(filename + '-cache')
+    mem.close()
+    assert not os.path.exists(filename + '-cache')
+
+
+@pytest.mark.parametrize('memory_class', [VolatileMemory, FileMemory])
+def test_load_nodes_compressed(memory_class):
+    compressed_conf = tree_conf._replace(compression='zlib')
+    if memory_class is FileMemory:
+        mem = FileMemory(filename, compressed_conf)
+    else:
+        mem = VolatileMemory(compressed_conf)
+    nodes = [LeafNode(compressed_conf, page=page, next_page=page + 1)
+             for page in (1, 2, 3)]
+    with mem.write_transaction:
+        for node in nodes:
+            mem.set_node(node)
+
+    # Compressed pages read together are each padded to a whole page
+    mem._cache.clear()
+    assert len(mem._read_pages(1, 3)) == 3 * compressed_conf.page_size
+    loaded = sorted(mem.load_nodes([1, 2, 3]), key=lambda n: n.page)
+    assert loaded == nodes
+    assert [node.next_page for node in loaded] == [2, 3, 4]
+    mem.close()
+
+
+def test_extent_reader():
+    mem = VolatileMemory(tree_conf)
+    value = os.urandom(10000)
+    with mem.write_transaction:
+        page = mem.write_extent(value)
+
+    reader = mem.open_extent(page)
+    assert repr(reader) == '<ExtentReader: page=1 length=10000>'
+    assert reader.readable() and reader.seekable()
+    assert reader.read(4090) == value[:4090]
+    assert reader.tell() == 4090
+    assert reader.read(10) == value[4090:4100]
+    assert reader.seek(-10, io.SEEK_END) == 9990
+    assert reader.read() == value[-10:]
+    assert reader.read() == b''
+    assert reader.seek(-10000, io.SEEK_CUR) == 0
+    assert reader.readall() == value
+
+    with pytest.raises(ValueError):
+        reader.seek(-1)
+    with pytest.raises(ValueError):
+        reader.seek(0, 42)
+
+    reader.close()
+    with pytest.raises(ValueError):
+        reader.read(1)
+
+
+def test_volatile_memory_extent():
+    mem = VolatileMemory(tree_conf)
+    value = b'a' * 4088 + b'b' * 4096 + b'c'
+    with mem.write_transaction:
+        assert mem.write_extent(value) == 1
+        assert mem.last_page == 3
+    assert mem._committed_pages[3] == b'c'
+    assert mem.read_extent(1) == value
+
+
+def test_volatile_memory_extent_stream():
+    mem = VolatileMemory(tree_conf)
+    value = b'a' * 4088 + b'b' * 4096 + b'c'
+    chunks = [value[i:i+1000] for i in range(0, len(value), 1000)]
+    with mem.write_transaction:
+        assert mem.write_extent_stream(iter(chunks)) == 1
+        assert mem.last_page == 3
+        assert mem.write_extent_stream(iter(chunks), len(value)) == 4
+        assert mem.last_page == 6
+        assert mem.write_extent_stream(iter([])) == 7
+        assert mem.last_page == 7
+    assert mem.read_extent(1) == value
+    assert mem.read_extent(4) == value
+    assert mem.read_extent(7) == b''
+
+    with pytest.raises(ValueError):
+        with mem.write_transaction:
+            mem.write_extent_stream(iter(chunks), len(value) - 1)
+    with pytest.raises(ValueError):
+        with mem.write_transaction:
+            mem.write_extent_stream(iter(chunks), len(value) + 1)
+    assert mem.last_page == 7
+
+
+def test_volatile_memory_shared_extents():
+    mem = VolatileMemory(tree_conf)
+    digest = b'd' * 32
+    with mem.write_transaction:
+        assert mem.share_extent(digest) is None
+        page = mem.write_extent(b'foo')
+        mem.add_shared_extent(digest, page)
+        assert mem.share_extent(digest) == page
+    assert mem._dedup_start_page == 2
+
+    with pytest.raises(ValueError):
+        with mem.write_transaction:
+            assert mem.release_extent(page) is False
+            raise ValueError()
+
+    # The rolled back release is forgotten
+    with mem.write_transaction:
+        assert mem.release_extent(page) is False
+        assert mem.release_extent(page) is True
+        assert mem.share_extent(digest) is None
+
+    # Extents that are not shared have a single reference
+    with mem.write_transaction:
+        assert mem.release_extent(42) is True
+
+
 def test_open_file_in_dir():
     with pytest.raises(ValueError):
         open_file_in_dir('/foo/bar/does/not/exist')
@@ -91,6 +578,51 @@ def test_open_file_in_dir():
             os.close(dir_fd)
 
 
+@pytest.mark.skipif(platform.system() == 'Windows',
+                    reason='Files are not locked on Windows')
+def test_lock_file():
+    fd_1, dir_fd_1 = open_file_in_dir(filename)
+    fd_2, dir_fd_2 = open_file_in_dir(filename)
+
+    lock_file(fd_1, shared=True)
+    lock_file(fd_2, shared=True)
+    fd_2.close()
+
+    with pytest.raises(ValueError):
+        fd_3, dir_fd_3 = open_file_in_dir(filename)
+        try:
+            lock_file(fd_3)
+        finally:
+            fd_3.close()
+            os.close(dir_fd_3)
+
+    fd_1.close()
+    os.close(dir_fd_1)
+    os.close(dir_fd_2)
+
+
+@mock.patch.dict('bplustree.memory.__dict__', {'fcntl': None})
+def test_lock_file_no_fcntl():
+    fd_1, dir_fd_1 = open_file_in_dir(filename)
+    fd_2, dir_fd_2 = open_file_in_dir(filename)
+    lock_file(fd_1)
+    lock_file(fd_2)
+    for fd, dir_fd in ((fd_1, dir_fd_1), (fd_2, dir_fd_2)):
+        fd.close()
+        os.close(dir_fd)
+
+
+def test_file_memory_locked():
+    mem = FileMemory(filename, tree_conf)
+    if platform.system() != 'Windows':
+        with pytest.raises(ValueError):
+            FileMemory(filename, tree_conf)
+    mem.close()
+
+    mem = FileMemory(filename, tree_conf)
+    mem.close()
+
+
 def test_write_to_file_multi_times():
     def side_effect(*args, **kwargs):
         if len(args) == 1:
@@ -123,12 +655,12 @@ def test_file_memory_write_transaction():
 
     with mem.write_transaction:
         mem.set_node(node)
-        assert mem._wal._not_committed_pages == {3: 9}
+        assert mem._wal._not_committed_pages == {3: (12, 4096)}
         assert mem._wal._committed_pages == {}
         assert mem._lock.writer_lock.acquire.call_count == 1
 
     assert mem._wal._not_committed_pages == {}
-    assert mem._wal._committed_pages == {3: 9}
+    assert mem._wal._committed_pages == {3: (12, 4096)}
     assert mem._lock.writer_lock.release.call_count == 1
     assert mem._lock.reader_lock.acquire.call_count == 0
 
@@ -148,7 +680,7 @@ def test_file_memory_write_transaction_error():
     with pytest.raises(ValueError):
         with mem.write_transaction:
             mem.set_node(node)
-            assert mem._wal._not_committed_pages == {3: 9}
+            assert mem._wal._not_committed_pages == {3: (12, 4096)}
             assert mem._wal._committed_pages == {}
             assert mem._lock.writer_lock.acquire.call_count == 1
             raise ValueError('Foo')
@@ -159,12 +691,142 @@ def test_file_memory_write_transaction_error():
     assert mem._cache.get(424242) is None
 
 
+def test_file_memory_nested_write_transaction():
+    mem = FileMemory(filename, tree_conf)
+
+    with mem.write_transaction:
+        with mem.write_transaction:
+            mem.set_node(node)
+        assert mem._wal._not_committed_pages == {3: (12, 4096)}
+        assert mem._wal._committed_pages == {}
+
+    assert mem._wal._not_committed_pages == {}
+    assert mem._wal._committed_pages == {3: (12, 4096)}
+    mem.close()
+
+
+def test_file_memory_write_transaction_error_restores_metadata():
+    mem = FileMemory(filename, tree_conf)
+    mem.set_metadata(1, tree_conf)
+
+    with pytest.raises(ValueError):
+        with mem.write_transaction:
+            assert mem.next_available_page == 1
+            mem.set_metadata(2, None)
+            raise ValueError('Foo')
+
+    assert mem.last_page == 0
+    assert mem.root_node_page == 1
+    assert mem.get_metadata() == (1, tree_conf)
+    mem.close()
+
+
+def test_file_memory_compression():
+    compressed_conf = tree_conf._replace(compression='zlib')
+    mem = FileMemory(filename, compressed_conf)
+    mem.set_metadata(1, compressed_conf)
+    with mem.write_transaction:
+        mem.set_node(node)
+    assert mem._wal._committed_pages[3][1] < compressed_conf.page_size
+    assert mem.get_node(3) == node
+    mem.close()
+
+    # Compressed pages leave the end of their slot empty in the file
+    assert os.path.getsize(filename) == 4 * compressed_conf.page_size
+
+    mem = FileMemory(filename, tree_conf)
+    assert mem.get_metadata() == (1, compressed_conf)
+    assert mem.get_node(3) == node
+    mem.close()
+
+
+def test_file_memory_page_reference_bytes():
+    wide_conf = tree_conf._replace(page_reference_bytes=8)
+    wide_node = LeafNode(wide_conf, page=3, next_page=2 ** 40)
+    mem = FileMemory(filename, wide_conf)
+    mem.set_metadata(2 ** 40, wide_conf)
+    with mem.write_transaction:
+        mem.set_node(wide_node)
+    assert mem._wal.frame_header_length == 12
+
+    # The width is read from the metadata before replaying the WAL
+    mem._close_fds()
+    mem = FileMemory(filename, tree_conf)
+    assert mem.get_metadata() == (2 ** 40, wide_conf)
+    assert mem.get_node(3).next_page == 2 ** 40
+    mem.close()
+
+
 def test_file_memory_repr():
     mem = FileMemory(filename, tree_conf)
     assert repr(mem) == '<FileMemory: {}>'.format(filename)
     mem.close()
 
 
+def test_volatile_memory_node():
+    mem = VolatileMemory(tree_conf)
+
+    with pytest.raises(ReachedEndOfFile):
+        mem.get_node(3)
+
+    with mem.write_transaction:
+        mem.set_node(node)
+    assert node == mem.get_node(3)
+    assert mem._committed_pages[3] == node.dump()
+
+    mem.close()
+    assert repr(mem) == '<VolatileMemory>'
+
+
+def test_get_node_or_page():
+    mem = VolatileMemory(tree_conf)
+    node = LeafNode(tree_conf, page=3)
+    node.insert_entry(Record(tree_conf, 1, b'foo'))
+    with mem.write_transaction:
+        mem.set_node(node)
+    assert mem.get_node_or_page(3) is node
+
+    # Pages missing from the cache are searched in place
+    mem._cache.clear()
+    node_page = mem.get_node_or_page(3)
+    assert isinstance(node_page, NodePage)
+    assert node_page.get_entry(1).value == b'foo'
+    assert mem.get_node_or_page(3) is node_page
+
+    # Until their node is needed
+    assert mem.get_node(3) == node
+    assert mem.get_node_or_page(3) == node
+    mem.close()
+
+
+def test_volatile_memory_metadata_freelist():
+    mem = VolatileMemory(tree_conf)
+    with pytest.raises(ValueError):
+        mem.get_metadata()
+    mem.set_metadata(6, tree_conf)
+    assert mem.get_metadata() == (6, tree_conf)
+
+    assert mem.next_available_page == 1
+    assert mem.next_available_page == 2
+    mem.del_page(1)
+    assert mem.next_available_page == 1
+
+
+def test_volatile_memory_write_transaction_error():
+    mem = VolatileMemory(tree_conf)
+    mem._cache[424242] = node
+
+    with pytest.raises(ValueError):
+        with mem.write_transaction:
+            mem.set_node(node)
+            assert mem._not_committed_pages == {3: node.dump()}
+            raise ValueError('Foo')
+
+    assert mem._not_committed_pages == {}
+    assert mem._committed_pages == {}
+    assert mem._cache.get(424242) is None
+
+
 def test_wal_create_reopen_empty():
     WAL(filename, 64)
 
@@ -213,6 +875,30 @@ def test_wal_checkpoint():
     assert os.path.isfile(filename + '-wal') is False
 
 
+def test_wal_shorter_pages():
+    wal = WAL(filename, 64)
+    wal.set_page(1, b'1' * 10)
+    wal.set_page(2, b'2' * 64)
+    wal.commit()
+    with pytest.raises(ValueError):
+        wal.set_page(3, b'3' * 65)
+
+    wal = WAL(filename, 64)
+    assert wal.get_page(1) == b'1' * 10
+    assert wal.get_page(2) == b'2' * 64
+    assert list(wal.checkpoint()) == [(1, b'1' * 10), (2, b'2' * 64)]
+
+
+def test_wal_page_reference_bytes():
+    wal = WAL(filename, 64, page_reference_bytes=8)
+    wal.set_page(2 ** 40, b'1' * 64)
+    wal.commit()
+    assert wal._committed_pages == {2 ** 40: (16, 64)}
+
+    wal = WAL(filename, 64, page_reference_bytes=8)
+    assert wal.get_page(2 ** 40) == b'1' * 64
+
+
 def test_wal_repr():
     wal = WAL(filename, 64)
     assert repr(wal) == '<WAL: {}-wal>'.format(filename)
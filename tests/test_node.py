@@ -1,10 +1,11 @@
 import pytest
 
 from bplustree.const import TreeConf, ENDIAN
-from bplustree.entry import Record, Reference, OpaqueData
+from bplustree.entry import Record, Reference
 from bplustree.node import (Node, LonelyRootNode, RootNode, InternalNode,
-                            LeafNode, FreelistNode, OverflowNode)
-from bplustree.serializer import IntSerializer
+                            LeafNode, FreelistNode, DedupNode, NodePage)
+from bplustree.serializer import (IntSerializer, StrSerializer,
+                                  OrderedIntSerializer)
 
 tree_conf = TreeConf(4096, 7, 16, 16, IntSerializer())
 
@@ -74,12 +75,222 @@ def test_root_node_serialization():
     assert n1.next_page is n2.next_page is None
 
 
+def test_leaf_node_variable_length_serialization():
+    tree_conf = TreeConf(4096, None, 40, 40, StrSerializer())
+    n1 = LeafNode(tree_conf, next_page=66)
+    n1.insert_entry(Record(tree_conf, 'a', b''))
+    n1.insert_entry(Record(tree_conf, 'b' * 40, b'b' * 40))
+    n1.insert_entry(Record(tree_conf, 'c', overflow_page=12))
+    data = n1.dump()
+    used_page_length = int.from_bytes(data[1:4], ENDIAN)
+    assert n1.payload_length == used_page_length - 8
+
+    n2 = LeafNode(tree_conf, data=data)
+    assert n1.entries == n2.entries
+    assert [r.value for r in n2.entries] == [b'', b'b' * 40, None]
+    assert [r.overflow_page for r in n2.entries] == [None, None, 12]
+
+
+def test_node_needs_split():
+    # Limited by the order
+    node = LeafNode(tree_conf)
+    for i in range(6):
+        node.insert_entry(Record(tree_conf, i, b'foo'))
+    assert not node.needs_split
+    node.insert_entry(Record(tree_conf, 6, b'foo'))
+    assert node.needs_split
+
+    # Limited by the size of the page
+    tree_conf_no_order = TreeConf(256, None, 16, 16, IntSerializer())
+    node = LeafNode(tree_conf_no_order)
+    assert node.max_children is None
+    assert node.max_children_in_page == 5
+    i = 0
+    while not node.needs_split:
+        node.insert_entry(Record(tree_conf_no_order, i, b''))
+        i += 1
+    assert i == 10
+    assert node.payload_length > node.max_payload
+
+
+def test_leaf_node_prefix_compression():
+    tree_conf = TreeConf(4096, None, 64, 16, StrSerializer())
+    keys = ['tenant-42/events/{:04d}'.format(i) for i in range(50)]
+    n1 = LeafNode(tree_conf, page=2)
+    for key in keys:
+        n1.insert_entry(Record(tree_conf, key, b'foo'))
+    assert n1.key_prefix == b'tenant-42/events/00'
+
+    data = n1.dump()
+    assert data.count(b'tenant-42/events/') == 1
+
+    n2 = LeafNode(tree_conf, data=data, page=2)
+    assert n2.key_prefix == b'tenant-42/events/00'
+    assert [r.key for r in n2.entries] == keys
+    assert n2.get_entry(keys[10]).value == b'foo'
+
+    # A new key shortens the prefix shared by the whole page
+    n2.insert_entry(Record(tree_conf, 'tenant-43', b'bar'))
+    assert n2.key_prefix == b'tenant-4'
+    n3 = LeafNode(tree_conf, data=n2.dump(), page=2)
+    assert [r.key for r in n3.entries] == keys + ['tenant-43']
+    assert n3.get_entry('tenant-43').value == b'bar'
+
+
+def test_node_needs_split_prefix_compression():
+    tree_conf = TreeConf(512, None, 64, 16, StrSerializer())
+    node = LeafNode(tree_conf)
+    i = 0
+    while not node.needs_split:
+        node.insert_entry(Record(tree_conf, 'a' * 60 + str(i), b''))
+        i += 1
+    assert i > node.max_children_in_page
+
+    # Both halves fit in their pages even without a shared prefix
+    node.remove_entry(node.biggest_key)
+    node.insert_entry(Record(tree_conf, 'b', b''))
+    assert node.needs_split
+    upper = LeafNode(tree_conf)
+    node.split_into(upper)
+    assert upper.key_prefix == b''
+    assert not upper.needs_split
+    assert not node.needs_split
+
+
+def test_split_into_by_size():
+    tree_conf = TreeConf(4096, None, 16, 80, IntSerializer())
+    node = LeafNode(tree_conf)
+    node.insert_entry(Record(tree_conf, 1, b'a' * 80))
+    for i in range(2, 6):
+        node.insert_entry(Record(tree_conf, i, b''))
+    upper = LeafNode(tree_conf)
+    node.split_into(upper)
+    assert node.keys == [1]
+    assert node.values == [b'a' * 80]
+    assert upper.keys == [2, 3, 4, 5]
+    assert upper.values == [b''] * 4
+
+    # Reference nodes keep at least two entries in the upper half
+    node = InternalNode(tree_conf)
+    for i in range(3):
+        node.insert_entry(Reference(tree_conf, i, i, i + 1))
+    upper = InternalNode(tree_conf)
+    node.split_into(upper)
+    assert node.keys == [0]
+    assert upper.keys == [1, 2]
+    assert list(upper.befores) == [1, 2]
+
+
+def test_node_columns():
+    node = LeafNode(tree_conf)
+    node.insert_entry(Record(tree_conf, 2, b'foo'))
+    node.insert_entry(Record(tree_conf, 1, overflow_page=7))
+    node.insert_entry(Record(tree_conf, 3, b'bar'))
+    assert node.keys == [1, 2, 3]
+    assert node.values == [None, b'foo', b'bar']
+    assert list(node.overflow_pages) == [7, 0, 0]
+    assert node.get_entry(1) == Record(tree_conf, 1, overflow_page=7)
+    assert node.get_entry(1).overflow_page == 7
+
+    node.replace_value(1, b'baz', None)
+    assert node.get_entry(1).value == b'baz'
+    assert node.get_entry(1).overflow_page is None
+
+    node.remove_entry(2)
+    assert [e.key for e in node.entries] == [1, 3]
+
+    loaded = LeafNode(tree_conf, data=node.dump())
+    assert loaded.keys == [1, 3]
+    assert loaded.values == [b'baz', b'bar']
+
+
+def test_reference_node_child_page():
+    node = InternalNode(tree_conf)
+    node.insert_entry(Reference(tree_conf, 10, 1, 2))
+    node.insert_entry(Reference(tree_conf, 20, 2, 3))
+    node.insert_entry(Reference(tree_conf, 15, 4, 5))
+    assert node.child_pages == [1, 4, 5, 3]
+    assert node.child_page(5) == 1
+    assert node.child_page(10) == 4
+    assert node.child_page(17) == 5
+    assert node.child_page(20) == 3
+    assert node.child_page(99) == 3
+
+
+def test_node_page():
+    tree_conf = TreeConf(4096, None, 16, 16, StrSerializer())
+    node = LeafNode(tree_conf, page=3)
+    for i in range(0, 100, 2):
+        node.insert_entry(Record(tree_conf, 'key-{:03d}'.format(i),
+                                 str(i).encode()))
+    node.replace_value('key-010', None, 42)
+    node_page = NodePage(tree_conf, bytes(node.dump()), 3)
+    assert node_page.holds_records
+    assert node_page.is_leaf
+    assert node_page.num_slots == 50
+
+    assert node_page.get_entry('key-000').value == b'0'
+    assert node_page.get_entry('key-098').value == b'98'
+    assert node_page.get_entry('key-010').overflow_page == 42
+    for key in ('key-001', 'key-099', 'a', 'z'):
+        with pytest.raises(ValueError):
+            node_page.get_entry(key)
+    assert node_page.to_node() == node
+
+    node = InternalNode(tree_conf, page=4)
+    for i in range(1, 10):
+        node.insert_entry(Reference(tree_conf, 'key-{}'.format(i), i, i + 1))
+    node_page = NodePage(tree_conf, bytes(node.dump()), 4)
+    assert not node_page.holds_records
+    for key in ('a', 'key-1', 'key-15', 'key-5', 'key-9', 'z'):
+        assert node_page.child_page(key) == node.child_page(key)
+
+
+def test_node_byte_comparable_keys():
+    tree_conf = TreeConf(4096, None, 8, 16, OrderedIntSerializer())
+    node = LeafNode(tree_conf)
+    for i in range(-50, 50, 2):
+        node.insert_entry(Record(tree_conf, i, str(i).encode()))
+    node = LeafNode(tree_conf, data=node.dump())
+    # Searching and splitting do not deserialize keys
+    assert node._keys is None
+    assert node.get_entry(-10).value == b'-10'
+    with pytest.raises(ValueError):
+        node.get_entry(-9)
+    assert node.bisect_left(-9) == node.bisect_right(-10) == 21
+    node.insert_entry(Record(tree_conf, -9, b'-9'))
+    upper = LeafNode(tree_conf)
+    node.split_into(upper)
+    assert node._keys is None and upper._keys is None
+    assert node.biggest_key < upper.smallest_key
+    assert node.keys + upper.keys == sorted(list(range(-50, 50, 2)) + [-9])
+
+    node_page = NodePage(tree_conf, bytes(upper.dump()), 3)
+    assert node_page.get_entry(upper.biggest_key).value == b'48'
+
+
 def test_node_slots():
     n1 = RootNode(tree_conf)
     with pytest.raises(AttributeError):
         n1.foo = True
 
 
+def test_node_footprint():
+    empty = LeafNode(tree_conf)
+    assert empty.footprint() > 0
+
+    node = LeafNode(tree_conf)
+    for i in range(5):
+        node.insert_entry(Record(tree_conf, i, b'foo'))
+    entry_footprint = (node.footprint() - empty.footprint()) / 5
+    # An entry costs its key and its value
+    assert 16 < entry_footprint < 1024
+
+    # A loaded node does not keep its page
+    loaded = LeafNode(tree_conf, data=node.dump())
+    assert loaded.footprint() < tree_conf.page_size
+
+
 def test_get_node_from_page_data():
     data = (2).to_bytes(1, ENDIAN) + bytes(4096 - 1)
     tree_conf = TreeConf(4096, 7, 16, 16, IntSerializer())
@@ -150,27 +361,33 @@ def test_freelist_node_serialization():
     assert n1.next_page == n2.next_page
 
 
-def test_freelist_node_serialization_no_next_page():
-    n1 = FreelistNode(tree_conf, next_page=None)
-    data = n1.dump()
+def test_freelist_node_serialization_num_pages():
+    n1 = FreelistNode(tree_conf, page=4, next_page=3, num_pages=42)
+    n2 = FreelistNode(tree_conf, data=n1.dump(), page=4)
+    assert n2.num_pages == 42
+    assert n1 == n2
+    assert repr(n2) == '<FreelistNode: page=4 next_page=3 num_pages=42>'
 
-    n2 = FreelistNode(tree_conf, data=data)
-    assert n1.next_page is n2.next_page is None
 
+def test_dedup_node_serialization():
+    n1 = DedupNode(tree_conf, page=4, next_page=3)
+    n1.extents[b'a' * 32] = (10, 1)
+    n1.extents[b'b' * 32] = (20, 300)
+    n2 = DedupNode(tree_conf, data=n1.dump(), page=4)
+    assert n2.extents == {b'a' * 32: (10, 1), b'b' * 32: (20, 300)}
+    assert n1 == n2
+    assert repr(n2) == '<DedupNode: page=4 next_page=3 extents=2>'
+    assert n2.max_children == 102
+    assert not n2.is_full
 
-def test_overflow_node_serialization():
-    n1 = OverflowNode(tree_conf, next_page=3)
-    n1.insert_entry_at_the_end(OpaqueData(data=b'foo'))
-    data = n1.dump()
-
-    n2 = OverflowNode(tree_conf, data=data)
-    assert n1.next_page == n2.next_page
+    n3 = DedupNode(tree_conf, data=DedupNode(tree_conf).dump())
+    assert n3.extents == {}
+    assert n3.next_page is None
 
 
-def test_overflow_node_serialization_no_next_page():
-    n1 = OverflowNode(tree_conf, next_page=None)
-    n1.insert_entry_at_the_end(OpaqueData(data=b'foo'))
+def test_freelist_node_serialization_no_next_page():
+    n1 = FreelistNode(tree_conf, next_page=None)
     data = n1.dump()
 
-    n2 = OverflowNode(tree_conf, data=data)
+    n2 = FreelistNode(tree_conf, data=data)
     assert n1.next_page is n2.next_page is None
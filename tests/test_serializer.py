@@ -1,11 +1,12 @@
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from unittest import mock
 import uuid
 
 import pytest
 
 from bplustree.serializer import (
-    IntSerializer, StrSerializer, UUIDSerializer, DatetimeUTCSerializer
+    IntSerializer, StrSerializer, UUIDSerializer, DatetimeUTCSerializer,
+    OrderedIntSerializer, FloatSerializer, DatetimeMicrosSerializer
 )
 
 
@@ -29,6 +30,17 @@ def test_str_serializer():
     assert repr(s) == 'StrSerializer()'
 
 
+def test_shortest_separator():
+    s = StrSerializer()
+    assert s.shortest_separator('tenant-42/a', 'tenant-43/b') == 'tenant-43'
+    assert s.shortest_separator('foo', 'foobar') == 'foob'
+    assert s.shortest_separator('a', 'b') == 'b'
+    assert s.shortest_separator('ab', 'ac') == 'ac'
+
+    # Other serializers do not truncate keys
+    assert IntSerializer().shortest_separator(1, 5) == 5
+
+
 def test_uuid_serializer():
     s = UUIDSerializer()
     id_ = uuid.uuid4()
@@ -50,3 +62,54 @@ def test_datetime_utc_serializer():
 def test_datetime_utc_serializer_no_temporenc():
     with pytest.raises(RuntimeError):
         DatetimeUTCSerializer()
+
+
+def test_byte_comparable_serializers():
+    assert not IntSerializer.byte_comparable
+    assert not DatetimeUTCSerializer.byte_comparable
+    assert StrSerializer.byte_comparable
+    assert UUIDSerializer.byte_comparable
+
+    utc = timezone.utc
+    cases = [
+        (OrderedIntSerializer(), 4, [-2**31, -256, -1, 0, 1, 255, 2**31 - 1]),
+        (FloatSerializer(), 8, [float('-inf'), -1e300, -2.5, -1e-300, 0.0,
+                                1e-300, 0.5, 3.0, 1e300, float('inf')]),
+        (DatetimeMicrosSerializer(), 8, [
+            datetime(1900, 1, 1, tzinfo=utc),
+            datetime(1970, 1, 1, tzinfo=utc),
+            datetime(2018, 1, 6, 21, 42, 2, 424739, tzinfo=utc),
+            datetime(2018, 1, 6, 21, 42, 2, 424740, tzinfo=utc)
+        ]),
+        (StrSerializer(), 16, ['', 'a', 'ab', 'b', 'é', '€']),
+        (UUIDSerializer(), 16, [uuid.UUID(int=i) for i in (0, 1, 256, 2**127)])
+    ]
+    for serializer, key_size, keys in cases:
+        serialized = [serializer.serialize(key, key_size) for key in keys]
+        assert serialized == sorted(serialized)
+        assert [serializer.deserialize(data) for data in serialized] == keys
+
+
+def test_ordered_int_serializer():
+    s = OrderedIntSerializer()
+    assert s.serialize(42, 2) == b'\x80*'
+    assert s.serialize(-1, 2) == b'\x7f\xff'
+    assert s.deserialize(b'\x80*') == 42
+    assert repr(s) == 'OrderedIntSerializer()'
+
+
+def test_float_serializer():
+    s = FloatSerializer()
+    assert s.serialize(-0.0, 8) == s.serialize(0.0, 8)
+    with pytest.raises(ValueError):
+        s.serialize(float('nan'), 8)
+
+
+def test_datetime_micros_serializer():
+    s = DatetimeMicrosSerializer()
+    dt = datetime(2018, 1, 6, 21, 42, 2, 424739,
+                  tzinfo=timezone(timedelta(hours=2)))
+    assert s.deserialize(s.serialize(dt, 8)) == dt
+    assert s.deserialize(s.serialize(dt, 8)).tzinfo is timezone.utc
+    with pytest.raises(ValueError):
+        s.serialize(datetime(2018, 1, 6), 8)
@@ -1,15 +1,24 @@
 from datetime import datetime, timezone, timedelta
+import hashlib
+import io
 import itertools
+import os
+import random
+import threading
 from unittest import mock
 import uuid
 
+import cachetools
 import pytest
 
-from bplustree.memory import FileMemory
-from bplustree.node import LonelyRootNode, LeafNode
+from bplustree.codec import ZlibCodec, PickleCodec
+from bplustree.const import VACUUM_CATCH_UP_PASSES
+from bplustree.memory import FileMemory, VolatileMemory
+from bplustree.node import LonelyRootNode, RootNode, LeafNode
 from bplustree.tree import BPlusTree
 from bplustree.serializer import (
-    IntSerializer, StrSerializer, UUIDSerializer, DatetimeUTCSerializer
+    IntSerializer, StrSerializer, UUIDSerializer, DatetimeUTCSerializer,
+    OrderedIntSerializer
 )
 from .conftest import filename
 
@@ -33,6 +42,19 @@ def test_create_and_load_file():
     b.close()
 
 
+def test_create_volatile_tree():
+    b = BPlusTree(':memory:', order=4)
+    assert isinstance(b._mem, VolatileMemory)
+    b.batch_insert((i, str(i).encode()) for i in range(100))
+    b.insert(100, b'f' * 5000)
+    b.checkpoint()
+    assert b.get(42) == b'42'
+    assert b.get(100) == b'f' * 5000
+    assert len(b) == 101
+    b.close()
+    assert not os.path.exists(':memory:')
+
+
 @mock.patch('bplustree.tree.BPlusTree.close')
 def test_closing_context_manager(mock_close):
     with BPlusTree(filename, page_size=512, value_size=128) as b:
@@ -43,7 +65,7 @@ def test_closing_context_manager(mock_close):
 def test_initial_values():
     b = BPlusTree(filename, page_size=512, value_size=128)
     assert b._tree_conf.page_size == 512
-    assert b._tree_conf.order == 100
+    assert b._tree_conf.order is None
     assert b._tree_conf.key_size == 8
     assert b._tree_conf.value_size == 128
     b.close()
@@ -179,24 +201,24 @@ def test_iter_slice(b):
         b.insert(i, str(i).encode())
 
     iter = b._iter_slice(slice(None, 2))
-    assert next(iter).key == 0
-    assert next(iter).key == 1
+    assert next(iter)[0] == 0
+    assert next(iter)[0] == 1
     with pytest.raises(StopIteration):
         next(iter)
 
     iter = b._iter_slice(slice(5, 7))
-    assert next(iter).key == 5
-    assert next(iter).key == 6
+    assert next(iter)[0] == 5
+    assert next(iter)[0] == 6
     with pytest.raises(StopIteration):
         next(iter)
 
     iter = b._iter_slice(slice(8, 9))
-    assert next(iter).key == 8
+    assert next(iter)[0] == 8
     with pytest.raises(StopIteration):
         next(iter)
 
     iter = b._iter_slice(slice(9, 12))
-    assert next(iter).key == 9
+    assert next(iter)[0] == 9
     with pytest.raises(StopIteration):
         next(iter)
 
@@ -205,7 +227,7 @@ def test_iter_slice(b):
         next(iter)
 
     iter = b._iter_slice(slice(-2, 17))
-    assert next(iter).key == 0
+    assert next(iter)[0] == 0
 
     b.close()
 
@@ -215,8 +237,8 @@ def test_iter_slice(b):
         b.insert(i, str(i).encode())
 
     iter = b._iter_slice(slice(65, 85))
-    assert next(iter).key == 70
-    assert next(iter).key == 80
+    assert next(iter)[0] == 70
+    assert next(iter)[0] == 80
     with pytest.raises(StopIteration):
         next(iter)
 
@@ -232,6 +254,105 @@ def test_checkpoint(b):
     assert not b._mem._wal._committed_pages
 
 
+def test_concurrent_readers(b):
+    for i in range(200):
+        b.insert(i, str(i).encode())
+    b.checkpoint()
+
+    errors = list()
+
+    def read():
+        for i in range(200):
+            if b.get(i) != str(i).encode():
+                errors.append(i)
+
+    threads = [threading.Thread(target=read) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_readonly_tree():
+    b = BPlusTree(filename, order=4)
+    b.batch_insert((i, str(i).encode()) for i in range(100))
+    b.insert(100, b'f' * 5000)
+    b.close()
+
+    b1 = BPlusTree(filename, readonly=True)
+    b2 = BPlusTree(filename, readonly=True)
+    assert b1._mem._wal is None
+    assert not os.path.exists(filename + '-wal')
+
+    assert b1.get(42) == b'42'
+    assert b1.get(100) == b'f' * 5000
+    assert list(b2.keys()) == list(range(101))
+
+    with pytest.raises(io.UnsupportedOperation):
+        b1.insert(200, b'200')
+    with pytest.raises(io.UnsupportedOperation):
+        b1.checkpoint()
+    assert b1.get(200) is None
+
+    with pytest.raises(ValueError):
+        BPlusTree(filename)
+
+    b1.close()
+    b2.close()
+
+    b = BPlusTree(filename)
+    assert b.get(42) == b'42'
+    b.close()
+
+
+def test_readonly_tree_empty_or_not_recovered():
+    open(filename, 'wb').close()
+    with pytest.raises(ValueError):
+        BPlusTree(filename, readonly=True)
+
+    b = BPlusTree(filename)
+    b.insert(1, b'1')
+    with pytest.raises(ValueError):
+        BPlusTree(filename, readonly=True)
+    b.close()
+
+    # Simulate a tree that was not closed properly
+    open(filename + '-wal', 'wb').close()
+    with pytest.raises(ValueError):
+        BPlusTree(filename, readonly=True)
+
+
+def test_tree_unsupported_format():
+    data = (1).to_bytes(4, 'little') + bytes(4092)
+    with open(filename, 'wb') as f:
+        f.write(data)
+
+    # The file is left untouched instead of being replaced by an empty tree
+    with pytest.raises(ValueError):
+        BPlusTree(filename)
+    with open(filename, 'rb') as f:
+        assert f.read() == data
+
+    # The file is not left locked by the failed attempt
+    with pytest.raises(ValueError) as e:
+        BPlusTree(filename)
+    assert 'in use' not in str(e.value)
+
+
+def test_tree_metadata_error_closes_file():
+    BPlusTree(filename).close()
+
+    with mock.patch.object(FileMemory, 'get_metadata',
+                           side_effect=ValueError('Foo')):
+        with pytest.raises(ValueError):
+            BPlusTree(filename)
+
+    b = BPlusTree(filename)
+    b.insert(1, b'1')
+    b.close()
+
+
 def test_left_record_node_in_tree():
     b = BPlusTree(filename, order=3)
     assert b._left_record_node == b._root_node
@@ -294,6 +415,123 @@ def test_insert_split_in_tree(iterator, order, page_size, k_size, v_size,
     b.close()
 
 
+@pytest.mark.parametrize('iterator', iterators)
+def test_insert_split_in_tree_no_order(iterator):
+    # Small pages make the capacity of nodes depend on their size in bytes
+    test_insert_split_in_tree(iterator, None, 256, 16, 16, StrSerializer, 50)
+
+
+def test_prefix_compression():
+    keys = ['tenant-42/events/{:05d}'.format(i) for i in range(2000)]
+    random.shuffle(keys)
+
+    b = BPlusTree(filename, page_size=512, key_size=32, value_size=8,
+                  serializer=StrSerializer())
+    for key in keys:
+        b.insert(key, key[-2:].encode())
+    b.insert('tenant-43', b'foo')
+
+    keys.sort()
+    assert [k for k in b.keys(slice(None, 'tenant-43'))] == keys
+    assert b.get('tenant-42/events/01234') == b'34'
+    assert b.get('tenant-43') == b'foo'
+
+    # Pages hold more records than they could without the shared prefix
+    records_per_leaf = b.LeafNode().max_children_in_page
+    assert b._mem.last_page < len(keys) / records_per_leaf
+    b.close()
+
+
+def test_suffix_truncated_separators():
+    keys = ['{:03d}'.format(i) + 'x' * 60 for i in range(500)]
+    b = BPlusTree(filename, page_size=512, key_size=64, value_size=8,
+                  serializer=StrSerializer())
+    b.batch_insert((key, b'') for key in keys)
+    for key in reversed(keys):
+        b.insert(key + 'y', b'foo')
+
+    assert list(b.keys()) == sorted(keys + [key + 'y' for key in keys])
+    for key in keys:
+        assert b.get(key) == b''
+        assert b.get(key + 'y') == b'foo'
+
+    # Internal nodes only hold the start of keys
+    root = b._root_node
+    assert isinstance(root, RootNode)
+    assert all(len(ref.key) < 10 for ref in root.entries)
+    b.close()
+
+
+@pytest.mark.parametrize('compression', ['zlib', 'lzma'])
+def test_compression(compression):
+    b = BPlusTree(filename, order=50, value_size=64, compression=compression)
+    b.batch_insert((i, b'{"value": %d}' % i) for i in range(1000))
+    b.insert(1000, b'{"value": 1000}' * 500)
+    wal_size = os.path.getsize(filename + '-wal')
+    b.close()
+
+    # Pages are compressed in the WAL
+    assert wal_size < b._mem.last_page * 4096 / 2
+
+    # The compression is read from the metadata
+    b = BPlusTree(filename, order=50, value_size=64)
+    assert b._tree_conf.compression == compression
+    assert b.get(42) == b'{"value": 42}'
+    assert b.get(1000) == b'{"value": 1000}' * 500
+    b.insert(1001, b'foo')
+    b.close()
+
+    b = BPlusTree(filename, readonly=True)
+    assert list(b.keys()) == list(range(1002))
+    b.close()
+
+
+@pytest.mark.parametrize('page_reference_bytes', [4, 6, 8])
+def test_page_reference_bytes(page_reference_bytes):
+    b = BPlusTree(filename, page_size=512, value_size=64,
+                  page_reference_bytes=page_reference_bytes)
+    b.batch_insert((i, str(i).encode()) for i in range(1000))
+    b.insert(1000, b'f' * 5000)
+    b.close()
+
+    # The width is read from the metadata
+    b = BPlusTree(filename, page_size=512, value_size=64)
+    assert b._tree_conf.page_reference_bytes == page_reference_bytes
+    assert b.LeafNode().max_payload == 508 - page_reference_bytes
+    b.insert(1001, b'foo')
+    assert b[1000] == b'f' * 5000
+    assert list(b.keys()) == list(range(1002))
+    b.close()
+
+
+def test_unknown_page_reference_bytes():
+    with pytest.raises(ValueError):
+        BPlusTree(filename, page_reference_bytes=5)
+
+
+def test_unknown_compression():
+    with pytest.raises(ValueError):
+        BPlusTree(filename, compression='foo')
+    assert not os.path.exists(filename)
+
+
+def test_replace_with_bigger_values():
+    b = BPlusTree(filename, page_size=256, key_size=16, value_size=64)
+    for i in range(200):
+        b.insert(i, b'')
+    for i in range(200):
+        b.insert(i, str(i).encode() * 20, replace=True)
+    for i in range(200):
+        assert b.get(i) == str(i).encode() * 20
+    b.close()
+
+
+def test_page_size_too_small():
+    with pytest.raises(ValueError):
+        BPlusTree(filename, page_size=128, key_size=16, value_size=64)
+    assert not os.path.exists(filename)
+
+
 def test_insert_split_in_tree_uuid():
     # Not in the test matrix because the iterators don't really make sense
     test_insert_split_in_tree(
@@ -329,16 +567,409 @@ def test_overflow(b):
     with b._mem.read_transaction:
         assert b._read_from_overflow(first_overflow_page) == data
 
-    assert b._mem.last_page == 81
+    # The value and its length are stored in contiguous pages
+    assert first_overflow_page == 2
+    assert b._mem.last_page == 80
 
     with b._mem.write_transaction:
         b._delete_overflow(first_overflow_page)
+    _, last_node = b._mem._traverse_free_list()
+    assert last_node.page == 2
+    assert last_node.num_pages == 79
 
     with b._mem.write_transaction:
-        for i in range(81, 2, -1):
+        for i in range(80, 1, -1):
             assert b._mem.next_available_page == i
 
 
+def test_dedup():
+    value = os.urandom(10000)
+    b = BPlusTree(filename, value_size=16, dedup=True)
+    b.batch_insert((i, value) for i in range(100))
+    b.insert(100, value)
+    b.insert_stream(101, io.BytesIO(value))
+    last_page = b._mem.last_page
+    b.close()
+
+    # The value is stored once along with a page of index
+    assert last_page < 10
+
+    b = BPlusTree(filename, value_size=16, dedup=True)
+    assert b[42] == b[101] == value
+    record = b._search_in_tree(0, b._root_node).get_entry(0)
+    overflow_page = record.overflow_page
+    for i in range(101):
+        b.insert(i, b'foo', replace=True)
+    assert b[101] == value
+
+    # Deleting the last reference frees the pages
+    b.insert(101, b'foo', replace=True)
+    with b._mem.write_transaction:
+        _, last_node = b._mem._traverse_free_list()
+        assert last_node.page == overflow_page
+        assert b._mem.share_extent(hashlib.sha256(value).digest()) is None
+    b.close()
+
+
+def test_zlib_codec():
+    b = BPlusTree(filename, value_size=64, codec=ZlibCodec())
+    value = b'{"value": 42}' * 50
+    b.insert(1, value)
+    b.batch_insert([(2, value), (3, b'foo')])
+    assert b[1] == b[2] == value
+    assert b[3] == b'foo'
+
+    # Values compressing below value_size stay in their record
+    assert b._mem.last_page == 1
+    b.close()
+
+
+def test_pickle_codec():
+    b = BPlusTree(':memory:', value_size=64, codec=PickleCodec())
+    b[1] = {'foo': 'bar'}
+    b[2] = [1, 2, 3] * 1000
+    assert b[1] == {'foo': 'bar'}
+    assert b.get(2) == [1, 2, 3] * 1000
+    assert list(b.values()) == [{'foo': 'bar'}, [1, 2, 3] * 1000]
+    assert b[1:2] == {1: {'foo': 'bar'}}
+    b.close()
+
+
+def test_vacuum():
+    b = BPlusTree(filename, page_size=512, value_size=64)
+    keys = list(range(500))
+    random.shuffle(keys)
+    with b._mem.write_transaction:
+        for key in keys:
+            b.insert(key, b'f' * 2000)
+        for key in keys:
+            b.insert(key, str(key).encode(), replace=True)
+    b.checkpoint()
+    size = os.path.getsize(filename)
+
+    b.vacuum(batch_size=100)
+    assert os.path.getsize(filename) < size / 10
+    assert not os.path.exists(filename + '-vacuum')
+    assert b._mem._freelist_start_page == 0
+    assert list(b.items()) == [(i, str(i).encode()) for i in range(500)]
+
+    # Leaves are in key order in the file
+    pages = list()
+    node = b._left_record_node
+    while node.next_page:
+        pages.append(node.page)
+        node = b._mem.get_node(node.next_page)
+    assert pages == sorted(pages)
+
+    b.insert(500, b'foo')
+    b.close()
+
+    b = BPlusTree(filename, page_size=512, value_size=64)
+    assert len(b) == 501
+    assert b[500] == b'foo'
+    b.close()
+
+
+def test_vacuum_modified_during_copy():
+    b = BPlusTree(':memory:', value_size=64)
+    b.batch_insert((i, b'f' * 1000) for i in range(100))
+    copy_to_new_tree = BPlusTree._copy_to_new_tree
+
+    def copy_and_insert(self, batch_size, pause):
+        new_tree = copy_to_new_tree(self, batch_size, pause)
+        if not self.get(100):
+            self.insert(100, b'foo')
+        return new_tree
+
+    with mock.patch.object(BPlusTree, '_copy_to_new_tree', autospec=True,
+                           side_effect=copy_and_insert) as copy:
+        b.vacuum(batch_size=10)
+    # Only the record written during the copy is copied again
+    assert copy.call_count == 1
+    assert b[100] == b'foo'
+    assert len(b) == 101
+    b.close()
+
+
+def test_vacuum_catch_up():
+    b = BPlusTree(':memory:', value_size=64)
+    b.batch_insert((i, b'f' * 1000) for i in range(100))
+    generation = b._mem.generation
+    b.checkpoint()
+    with b._mem.write_transaction:
+        pass
+    # Transactions that write nothing do not change the tree
+    assert b._mem.generation == generation
+
+    copy_changes = BPlusTree._copy_changes
+    copied = list()
+
+    def copy_and_write(self, new_tree, batch_size, pause):
+        # A writer that never stops
+        self.insert(len(copied) % 10, b'bar', replace=True)
+        rv = copy_changes(self, new_tree, batch_size, pause)
+        copied.append(rv)
+        return rv
+
+    with mock.patch.object(BPlusTree, '_copy_changes', autospec=True,
+                           side_effect=copy_and_write):
+        b.vacuum(batch_size=10)
+    assert copied == [1] * (VACUUM_CATCH_UP_PASSES + 1)
+    assert [b[i] for i in range(5)] == [b'bar'] * 4 + [b'f' * 1000]
+    assert len(b) == 100
+    b.close()
+
+
+def test_vacuum_readonly():
+    BPlusTree(filename).close()
+    b = BPlusTree(filename, readonly=True)
+    with pytest.raises(io.UnsupportedOperation):
+        b.vacuum()
+    b.close()
+
+
+def test_readahead():
+    b = BPlusTree(filename, order=4, readahead=16)
+    b.batch_insert((i, b'foo') for i in range(200))
+    with mock.patch.object(FileMemory, 'advise') as mock_advise:
+        assert list(b.keys()) == list(range(200))
+    advised = [num_pages for _, num_pages in
+               (call[0] for call in mock_advise.call_args_list)]
+    # Contiguous leaves are advised at once rather than one by one
+    assert max(advised) > 1
+    assert len(advised) < sum(advised) / 2
+    b.close()
+
+
+def test_readahead_leaves_not_contiguous():
+    b = BPlusTree(filename, order=4, readahead=16)
+    keys = list(range(500))
+    random.shuffle(keys)
+    for key in keys:
+        b.insert(key, b'foo')
+
+    leaves = list()
+    node = b._left_record_node
+    while node.next_page:
+        node = b._mem.get_node(node.next_page)
+        leaves.append(node.page)
+
+    for start, first_leaf in ((None, 0), (250, None)):
+        if first_leaf is None:
+            node = b._search_in_tree(start, b._root_node)
+            first_leaf = leaves.index(node.page) + 1
+        with mock.patch.object(FileMemory, 'advise') as mock_advise:
+            assert list(b.keys(slice(start, None))) == list(
+                range(start or 0, 500)
+            )
+        advised = list()
+        for call in mock_advise.call_args_list:
+            page, num_pages = call[0]
+            advised.extend(range(page, page + num_pages))
+        # Exactly the leaves after the first one are advised
+        assert sorted(advised) == sorted(leaves[first_leaf:])
+    b.close()
+
+
+@pytest.mark.parametrize('cache_policy', ['lru', '2q', cachetools.LFUCache])
+def test_cache_policy(cache_policy):
+    b = BPlusTree(filename, order=4, cache_size=16, cache_policy=cache_policy,
+                  pin_internal_nodes=True)
+    b.batch_insert((i, str(i).encode()) for i in range(200))
+    b.close()
+
+    b = BPlusTree(filename, order=4, cache_size=16, cache_policy=cache_policy,
+                  pin_internal_nodes=True)
+    assert b[50] == b'50'
+    assert list(b.keys()) == list(range(200))
+    # The path to the leaf stays in memory after a scan
+    with mock.patch.object(FileMemory, '_read_page',
+                           wraps=b._mem._read_page) as mock_read_page:
+        assert b[50] == b'50'
+    assert mock_read_page.call_count <= 1
+    b.close()
+
+    with pytest.raises(ValueError):
+        BPlusTree(filename, cache_policy='foo')
+
+
+def test_cache_bytes():
+    b = BPlusTree(filename, cache_bytes=256 * 1024)
+    b.batch_insert((i, b'foo') for i in range(10000))
+    assert list(b.keys()) == list(range(10000))
+    assert 0 < b._mem._cache.currsize <= 256 * 1024
+
+    b.resize_cache(64 * 1024)
+    assert b._mem._cache.currsize <= 64 * 1024
+    assert list(b.keys()) == list(range(10000))
+    assert b._mem._cache.currsize <= 64 * 1024
+
+    b.resize_cache(None)
+    assert list(b.keys()) == list(range(10000))
+    assert b._mem._cache.currsize > 64 * 1024
+    b.close()
+
+
+def test_get_does_not_load_nodes(b):
+    b.batch_insert((i, str(i).encode()) for i in range(1000))
+    b.checkpoint()
+    b._mem._cache.clear()
+    with mock.patch('bplustree.memory.Node.from_page_data') as from_page:
+        assert b[500] == b'500'
+        assert b.get(1000) is None
+        assert 42 in b
+        from_page.assert_not_called()
+
+    # Writers load the nodes they modify
+    b[500] = b'foo'
+    assert b[500] == b'foo'
+    assert list(b.keys(slice(499, 502))) == [499, 500, 501]
+
+
+def test_byte_comparable_keys():
+    b = BPlusTree(filename, order=4, key_size=8,
+                  serializer=OrderedIntSerializer())
+    b.batch_insert((i, str(i).encode()) for i in range(-500, 500))
+    for i in range(500, 1000):
+        b.insert(i, str(i).encode())
+    b.checkpoint()
+    b._mem._cache.clear()
+    with mock.patch.object(OrderedIntSerializer, 'deserialize') as load:
+        assert b[-250] == b'-250'
+        assert b.get(1000) is None
+        load.assert_not_called()
+    assert list(b.keys(slice(-2, 2))) == [-2, -1, 0, 1]
+    assert len(b) == 1500
+    b.close()
+
+
+@pytest.mark.parametrize('serializer,keys,too_big', [
+    (StrSerializer(), ['k{:03d}'.format(i) for i in range(300)], 'x' * 40),
+    (OrderedIntSerializer(), list(range(-150, 150)), 2 ** 200)
+])
+def test_byte_comparable_keys_not_serializable(serializer, keys, too_big):
+    b = BPlusTree(filename, order=4, key_size=16, serializer=serializer)
+    b.batch_insert((key, b'foo') for key in keys)
+    b.checkpoint()
+    for clear_cache in (True, False):
+        if clear_cache:
+            # Search pages in place
+            b._mem._cache.clear()
+        assert b.get(too_big) is None
+        assert too_big not in b
+        with pytest.raises(KeyError):
+            b.open_value(too_big)
+    if isinstance(too_big, str):
+        assert list(b.keys(slice('k001', 'k002' + 'z' * 30))) == [
+            'k001', 'k002'
+        ]
+        assert list(b.keys(slice('z' * 40, None))) == []
+    else:
+        assert list(b.keys(slice(-too_big, too_big))) == keys
+        assert list(b.keys(slice(too_big, None))) == []
+    b.close()
+
+
+def test_warm_cache():
+    b = BPlusTree(filename, order=4, warm_cache=True)
+    b.batch_insert((i, str(i).encode()) for i in range(1000))
+    b.checkpoint()
+    b._mem._cache.clear()
+    assert b[500] == b'500'
+    b.close()
+
+    b = BPlusTree(filename, order=4, cache_size=1000, warm_cache=True)
+    with mock.patch.object(FileMemory, '_read_page',
+                           wraps=b._mem._read_page) as mock_read_page:
+        # The path to the record was saved
+        assert b[500] == b'500'
+        mock_read_page.assert_not_called()
+        # All internal nodes were loaded, only the leaf is read
+        assert b[990] == b'990'
+        assert mock_read_page.call_count == 1
+    b.close()
+
+
+@pytest.mark.skipif(not hasattr(os, 'O_DIRECT'),
+                    reason='No direct I/O on this platform')
+def test_direct_io():
+    b = BPlusTree(filename, order=4, direct_io=True,
+                  buffer_pool_size=64 * 4096)
+    b.batch_insert((i, str(i).encode()) for i in range(200))
+    b.insert(200, b'x' * 10000)
+    b.checkpoint()
+    b.vacuum()
+    b.close()
+
+    b = BPlusTree(filename, direct_io=True, buffer_pool_size=64 * 4096,
+                  readonly=True)
+    assert b[200] == b'x' * 10000
+    assert list(b.items(slice(0, 5))) == [(i, str(i).encode())
+                                          for i in range(5)]
+    assert len(b) == 201
+    b.close()
+
+    with pytest.raises(ValueError):
+        BPlusTree(filename, page_size=1024, direct_io=True)
+
+
+def test_get_view(b):
+    b.insert(1, b'foo')
+    b.insert(2, b'f' * 10000)
+    b.checkpoint()
+    b._mem._cache.clear()
+
+    view = b.get_view(1)
+    assert isinstance(view, memoryview)
+    assert view.readonly
+    assert view == b'foo'
+    assert b.get_view(2) == b'f' * 10000
+    assert b.get_view(3) is None
+    assert b.get(1) == b'foo'
+    assert isinstance(b.get(1), bytes)
+
+
+def test_open_value(b):
+    value = os.urandom(20000)
+    b.insert(1, b'foo')
+    b.insert(2, value)
+
+    with b.open_value(1) as f:
+        assert f.read() == b'foo'
+
+    with b.open_value(2) as f:
+        assert f.read(10) == value[:10]
+        assert f.read(5000) == value[10:5010]
+        f.seek(-8, io.SEEK_END)
+        assert f.read() == value[-8:]
+        f.seek(0)
+        assert f.read() == value
+
+    with pytest.raises(KeyError):
+        b.open_value(3)
+
+
+@pytest.mark.parametrize('length', [None, 20000])
+def test_insert_stream(b, length):
+    value = os.urandom(20000)
+    b.insert_stream(1, io.BytesIO(b'foo'))
+    b.insert_stream(2, io.BytesIO(value), length)
+    assert b[1] == b'foo'
+    assert b[2] == value
+
+    with pytest.raises(ValueError):
+        b.insert_stream(2, io.BytesIO(b'bar'))
+    b.insert_stream(2, io.BytesIO(b'bar'), replace=True)
+    assert b[2] == b'bar'
+    b.insert_stream(1, io.BytesIO(value), length, replace=True)
+    assert b[1] == value
+
+    # A stream shorter than announced is not inserted
+    with pytest.raises(ValueError):
+        b.insert_stream(3, io.BytesIO(b'foo'), length=4)
+    assert b.get(3) is None
+
+
 def test_batch_insert(b):
     def generate(from_, to):
         for i in range(from_, to):
@@ -355,6 +986,19 @@ def test_batch_insert(b):
     assert i == 2000
 
 
+def test_batch_insert_rollback_after_splits(b):
+    root_node_page = b._root_node_page
+    with pytest.raises(ValueError):
+        b.batch_insert([(i, b'foo') for i in range(100)] + [(0, b'foo')])
+
+    assert b._root_node_page == root_node_page
+    assert b._mem.last_page == root_node_page
+    assert not b
+
+    b.batch_insert([(i, b'foo') for i in range(100)])
+    assert len(b) == 100
+
+
 def test_batch_insert_no_in_order(b):
     with pytest.raises(ValueError):
         b.batch_insert([(2, b'2'), (1, b'1')])
@@ -1,6 +1,9 @@
+import io
+
 import pytest
 
-from bplustree.utils import pairwise, iter_slice
+from bplustree.utils import (pairwise, iter_slice, common_prefix,
+                             read_chunks, contiguous_runs)
 
 
 def test_pairwise():
@@ -26,3 +29,31 @@ def test_iter_slice():
     assert next(i) == (b'456', True)
     with pytest.raises(StopIteration):
         next(i)
+
+
+def test_common_prefix():
+    assert common_prefix([]) == b''
+    assert common_prefix([b'abc']) == b'abc'
+    assert common_prefix([b'abc', b'abd', b'ab']) == b'ab'
+    assert common_prefix([b'abc', b'bcd']) == b''
+    assert common_prefix(iter([b'foo', b'foobar'])) == b'foo'
+
+
+def test_contiguous_runs():
+    assert list(contiguous_runs([], 3)) == []
+    assert list(contiguous_runs([1, 2, 3, 5, 6, 9], 10)) == [
+        [1, 2, 3], [5, 6], [9]
+    ]
+    assert list(contiguous_runs(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+
+def test_read_chunks():
+    f = io.BytesIO(b'abcdefgh')
+    assert list(read_chunks(f, 3)) == [b'abc', b'def', b'gh']
+
+    f = io.BytesIO(b'abcdefgh')
+    assert list(read_chunks(f, 3, length=5)) == [b'abc', b'de']
+    assert f.read() == b'fgh'
+
+    with pytest.raises(ValueError):
+        list(read_chunks(io.BytesIO(b'abc'), 2, length=4))